@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="cashback-export-"), "cashback.db")
+
+import pandas as pd
+
+from bot import database as db
+from bot.export import export_history
+
+# История пользователя: банки x категории x периоды без повторов
+def seed(user_id, rows):
+    bank_ids = [db.get_bank_id(f"Банк {i}") for i in range(20)]
+    category_ids = [db.get_category_id(f"категория {i}") for i in range(50)]
+    data = []
+    for n in range(rows):
+        period_index, rest = divmod(n, len(bank_ids) * len(category_ids))
+        bank_index, category_index = divmod(rest, len(category_ids))
+        year, month = divmod(period_index, 12)
+        data.append((
+            user_id, bank_ids[bank_index], category_ids[category_index], float(1 + n % 15),
+            "manual", "01.01.2020 00:00", f"{2000 + year:04d}-{month + 1:02d}"
+        ))
+    with db._lock:
+        db.cursor.executemany(
+            "INSERT INTO cashback (user_id, bank_id, category_id, amount, input_type, created_at, period) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            data
+        )
+        db.conn.commit()
+
+# Для сравнения: вся история одним запросом в DataFrame и запись в сжатый CSV
+def naive_export(user_id, path):
+    frame = pd.read_sql_query("""
+    SELECT c.period, b.name AS bank, k.name AS category, c.amount, c.input_type, c.created_at FROM cashback AS c
+    JOIN banks AS b ON b.id = c.bank_id
+    JOIN categories AS k ON k.id = c.category_id
+    WHERE c.user_id=? ORDER BY c.period, c.id
+    """, db.conn, params=(user_id,))
+    frame.to_csv(path, sep=";", index=False, compression="gzip")
+
+# Пиковая память по tracemalloc и время отдельного прогона без трассировки (она замедляет выделения)
+def measure(function):
+    tracemalloc.start()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cleanup(result)
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, peak / 1024 / 1024, result
+
+def cleanup(result):
+    if isinstance(result, tuple):
+        os.unlink(result[0])
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк выгрузки истории кэшбэка (/export)")
+    arg_parser.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 100000, 1000000])
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cashback-export-")
+    report = {}
+    for user_id, rows in enumerate(args.rows, start=1):
+        seed(user_id, rows)
+        result = {}
+        for fmt in ("csv", "xlsx"):
+            seconds, peak, (path, count) = measure(lambda: export_history(user_id, fmt))
+            result[fmt] = {
+                "rows": count, "seconds": seconds, "rows_per_second": count / seconds,
+                "file_kb": os.path.getsize(path) / 1024, "peak_memory_mb": peak,
+            }
+            os.unlink(path)
+        path = os.path.join(directory, "naive.csv.gz")
+        seconds, peak, _ = measure(lambda: naive_export(user_id, path))
+        result["naive_csv"] = {"seconds": seconds, "file_kb": os.path.getsize(path) / 1024, "peak_memory_mb": peak}
+        os.unlink(path)
+        report[str(rows)] = result
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+import urllib3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from bot.config import GIGACHAT_KEEPALIVE_EXPIRY, GIGACHAT_MAX_CONNECTIONS
+from bot.http_pool import telegram_session
+
+# Самоподписанный сертификат для локального TLS-сервера
+def make_certificate(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+        "-subj", "/CN=localhost", "-keyout", key, "-out", cert
+    ], check=True, capture_output=True)
+    return cert, key
+
+# TLS-заглушка API: рукопожатие в потоке соединения, задержка connect_latency имитирует
+# сетевые RTT на установку TCP + TLS, latency — обработку запроса
+class TLSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, cert, key, connect_latency, latency):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.connect_latency = connect_latency
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"https://127.0.0.1:{self.server_address[1]}"
+
+    def count_connection(self):
+        with self.lock:
+            self.connections += 1
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.server.count_connection()
+        time.sleep(self.server.connect_latency)
+        self.request = self.server.context.wrap_socket(self.request, server_side=True)
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        time.sleep(self.server.latency)
+        body = b'{"ok": true, "result": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# Клиенты: новое соединение на каждый запрос и общий пул, как в боте
+def _requests_fresh(url):
+    with requests.Session() as session:
+        session.post(url, json={"chat_id": 1, "text": "x"}, verify=False).raise_for_status()
+
+def _httpx_fresh(url):
+    with httpx.Client(verify=False) as client:
+        client.post(url, json={"chat_id": 1, "text": "x"}).raise_for_status()
+
+def clients(keepalive_expiry):
+    session = telegram_session()
+    pooled = httpx.Client(verify=False, limits=httpx.Limits(
+        max_connections=GIGACHAT_MAX_CONNECTIONS, max_keepalive_connections=GIGACHAT_MAX_CONNECTIONS,
+        keepalive_expiry=keepalive_expiry
+    ))
+    return {
+        "requests_fresh": _requests_fresh,
+        "requests_pooled": lambda url: session.post(url, json={"chat_id": 1, "text": "x"}, verify=False).raise_for_status(),
+        "httpx_fresh": _httpx_fresh,
+        "httpx_pooled": lambda url: pooled.post(url, json={"chat_id": 1, "text": "x"}).raise_for_status(),
+    }
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+def measure(server, call, requests_count, concurrency, idle):
+    before = server.connections
+    timings = []
+
+    def one(_):
+        started = time.perf_counter()
+        call(server.url + "/sendMessage")
+        timings.append(time.perf_counter() - started)
+        if idle:
+            time.sleep(idle)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests_count,
+        "connections": server.connections - before,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p50_ms": _percentile(timings, 50) * 1000,
+        "p95_ms": _percentile(timings, 95) * 1000,
+        "requests_per_second": requests_count / elapsed,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк пулов HTTP-соединений на локальном TLS-сервере")
+    arg_parser.add_argument("--requests", type=int, default=200)
+    arg_parser.add_argument("--concurrency", type=int, default=4)
+    arg_parser.add_argument("--connect-latency", type=float, default=0.03, help="Задержка установки соединения, с")
+    arg_parser.add_argument("--latency", type=float, default=0.005, help="Задержка ответа, с")
+    arg_parser.add_argument("--idle", type=float, default=0.0, help="Пауза между запросами одного потока, с")
+    arg_parser.add_argument("--keepalive-expiry", type=float, default=GIGACHAT_KEEPALIVE_EXPIRY)
+    arg_parser.add_argument("--cert", help="Сертификат PEM (по умолчанию создаётся openssl)")
+    arg_parser.add_argument("--key")
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    cert, key = (args.cert, args.key) if args.cert else make_certificate(tempfile.mkdtemp(prefix="cashback-tls-"))
+    server = TLSServer(cert, key, args.connect_latency, args.latency)
+
+    result = {"settings": vars(args), "clients": {}}
+    for name, call in clients(args.keepalive_expiry).items():
+        result["clients"][name] = measure(server, call, args.requests, args.concurrency, args.idle)
+    for kind in ("requests", "httpx"):
+        fresh = result["clients"][f"{kind}_fresh"]
+        pooled = result["clients"][f"{kind}_pooled"]
+        result[f"{kind}_saved_ms_per_request"] = fresh["mean_ms"] - pooled["mean_ms"]
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
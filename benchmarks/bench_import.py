@@ -0,0 +1,77 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="cashback-import-"), "cashback.db")
+
+from bot import database as db
+from bot.config import DEFAULT_BANKS, DEFAULT_CATEGORIES
+from bot.text_parser import parse_rates_text
+
+# Название категории без цифр (цифры из названий отбрасываются): номер буквами
+def _word(n):
+    letters = "абвгдежзиклмнопрстуфхцчшэюя"
+    word = ""
+    while True:
+        n, rest = divmod(n, len(letters))
+        word = letters[rest] + word
+        if not n:
+            return word
+
+# Текст для /import: банки x категории, при нехватке пар — дополнительные категории
+def rates_text(rows):
+    categories = itertools.chain(DEFAULT_CATEGORIES, (f"рубрика {_word(n)}" for n in itertools.count()))
+    pairs = ((bank, category) for category in categories for bank in DEFAULT_BANKS)
+    return "\n".join(f"{bank};{category};{1 + i % 15}" for i, (bank, category) in zip(range(rows), pairs))
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк массового ввода ставок (/import)")
+    arg_parser.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")], default=[30, 500, 5000])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    users = itertools.count(1)
+    report = {}
+    for rows in args.rows:
+        text = rates_text(rows)
+        parse = min(timed(lambda: parse_rates_text(text)) for _ in range(args.repeat))
+        rates, errors = parse_rates_text(text)
+        # Новый пользователь на каждый прогон: вставка, затем повтор того же файла — обновление
+        batch_insert, batch_update, single_insert = [], [], []
+        for _ in range(args.repeat):
+            user_id = next(users)
+            batch_insert.append(timed(lambda: db.save_cashback_many(user_id, rates)))
+            batch_update.append(timed(lambda: db.save_cashback_many(user_id, rates)))
+            # Для сравнения: по одной записи с фиксацией, как при ручном вводе
+            user_id = next(users)
+            single_insert.append(timed(lambda: [db.save_cashback(user_id, *rate) for rate in rates]))
+        report[str(rows)] = {
+            "rates": len(rates),
+            "errors": len(errors),
+            "parse_ms": parse * 1000,
+            "batch_insert_ms": min(batch_insert) * 1000,
+            "batch_update_ms": min(batch_update) * 1000,
+            "batch_rows_per_second": len(rates) / min(batch_insert),
+            "single_insert_ms": min(single_insert) * 1000,
+            "single_rows_per_second": len(rates) / min(single_insert),
+        }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from bot.config import CATEGORY_EMOJIS
+from bot.optimizer import optimize
+
+CATEGORIES = list(CATEGORY_EMOJIS)
+AMOUNTS = [1, 2, 3, 5, 7, 10, 15]
+
+# Синтетический портфель: у каждого банка offered предложенных категорий, из них выбирается picks;
+# траты — по всем категориям с долей нулевых
+def portfolio(rng, banks, offered, picks):
+    rates = {}
+    for bank in range(banks):
+        for category in rng.sample(CATEGORIES, offered):
+            rates.setdefault(category, {})[f"bank{bank}"] = rng.choice(AMOUNTS)
+    spend = {category: rng.choice([0, 500, 1000, 2000, 5000, 10000, 20000]) for category in CATEGORIES}
+    return rates, spend, {f"bank{bank}": picks for bank in range(banks)}
+
+# Полный перебор для проверки точности на небольших портфелях: все наборы карт и все варианты
+# выбора категорий в каждой карте
+def brute_force(rates, spend, picks, max_cards):
+    categories = sorted(rates)
+    banks = sorted({bank for cat in categories for bank in rates[cat]})
+    weights = np.array([[rates[cat].get(bank, 0) * spend[cat] / 100 for cat in categories] for bank in banks])
+    options = []
+    for b, bank in enumerate(banks):
+        offered = np.flatnonzero(weights[b] > 0)
+        combos = list(itertools.combinations(offered, min(picks[bank], len(offered))))
+        rows = np.zeros((len(combos), len(categories)))
+        for row, combo in zip(rows, combos):
+            row[list(combo)] = weights[b, list(combo)]
+        options.append(rows)
+    best = 0.0
+    for size in range(1, len(banks) + 1):
+        if max_cards is not None and size > max_cards:
+            break
+        for subset in itertools.combinations(range(len(banks)), size):
+            for choice in itertools.product(*[range(len(options[b])) for b in subset]):
+                combined = np.max([options[b][option] for b, option in zip(subset, choice)], axis=0)
+                best = max(best, float(combined.sum()))
+    return best
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк подбора категорий по банкам")
+    arg_parser.add_argument("--portfolios", type=int, default=50, help="Портфелей на каждый размер")
+    arg_parser.add_argument("--sizes", default="3x6x3,5x8x3,8x8x4,12x10x4,20x10x5",
+                            help="Размеры банки x предложено x выбрать, через запятую")
+    arg_parser.add_argument("--max-cards", type=int, help="Ограничение на число карт")
+    arg_parser.add_argument("--verify", type=int, default=30, help="Портфелей малого размера для сверки с полным перебором")
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(1)
+    report = {"sizes": {}}
+    for size in args.sizes.split(","):
+        banks, offered, picks = (int(x) for x in size.split("x"))
+        timings = []
+        methods = {}
+        for _ in range(args.portfolios):
+            rates, spend, bank_picks = portfolio(rng, banks, offered, picks)
+            started = time.perf_counter()
+            result = optimize(rates, spend, bank_picks, args.max_cards)
+            timings.append((time.perf_counter() - started) * 1000)
+            methods[result["method"]] = methods.get(result["method"], 0) + 1
+        report["sizes"][size] = {
+            "p50_ms": _percentile(timings, 50),
+            "p95_ms": _percentile(timings, 95),
+            "max_ms": max(timings),
+            "methods": methods,
+        }
+
+    mismatches = 0
+    for _ in range(args.verify):
+        rates, spend, bank_picks = portfolio(rng, 4, 5, 2)
+        max_cards = rng.choice([None, 1, 2])
+        if abs(optimize(rates, spend, bank_picks, max_cards)["total"] - brute_force(rates, spend, bank_picks, max_cards)) > 1e-6:
+            mismatches += 1
+    report["verified"] = args.verify
+    report["mismatches"] = mismatches
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
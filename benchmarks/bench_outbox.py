@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from telebot import TeleBot, apihelper
+from telebot.apihelper import ApiTelegramException
+
+from fakes import FakeTelegramServer
+from bot.outbox import Outbox
+
+# Ответ на одно действие пользователя: сообщение о ходе обработки с правками и итог из
+# нескольких сообщений (как сводка или импорт выписки)
+def reply_direct(bot, chat_id, edits, messages, interval, stats):
+    def call(function, *args):
+        # Без очереди бот ждёт retry_after прямо в обработчике
+        while True:
+            try:
+                return function(*args)
+            except ApiTelegramException as e:
+                if e.error_code != 429:
+                    raise
+                stats["retries"] += 1
+                time.sleep(e.result_json["parameters"]["retry_after"])
+
+    started = time.perf_counter()
+    message = call(bot.send_message, chat_id, "⏳ Обработка")
+    for i in range(edits):
+        time.sleep(interval)
+        call(bot.edit_message_text, f"⏳ Обработка: {i + 1}/{edits}", chat_id, message.message_id)
+    for i in range(messages):
+        call(bot.send_message, chat_id, f"Итог, часть {i + 1}")
+    return time.perf_counter() - started
+
+def reply_outbox(outbox, chat_id, edits, messages, interval):
+    started = time.perf_counter()
+    message = outbox.send_message(chat_id, "⏳ Обработка", coalesce=False)
+    for i in range(edits):
+        time.sleep(interval)
+        outbox.edit_message_text(f"⏳ Обработка: {i + 1}/{edits}", chat_id, message)
+    for i in range(messages):
+        outbox.send_message(chat_id, f"Итог, часть {i + 1}")
+    return time.perf_counter() - started
+
+def run(mode, args):
+    telegram = FakeTelegramServer(
+        latency=args.latency, chat_limit=args.chat_limit, global_limit=args.global_limit, retry_after=1
+    ).start()
+    apihelper.API_URL = telegram.url + "/bot{0}/{1}"
+    bot = TeleBot("0:benchmark", threaded=False)
+    stats = {"retries": 0}
+    outbox = Outbox(bot) if mode == "outbox" else None
+    chats = range(1, args.chats + 1)
+
+    def handle(chat_id):
+        if outbox:
+            return reply_outbox(outbox, chat_id, args.edits, args.messages, args.interval)
+        return reply_direct(bot, chat_id, args.edits, args.messages, args.interval, stats)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        handler_seconds = sorted(pool.map(handle, chats))
+    handled = time.perf_counter() - started
+    if outbox:
+        outbox.flush()
+    delivered = time.perf_counter() - started
+    counts = telegram.method_counts()
+    telegram.stop()
+    return {
+        "handlers_seconds": handled,
+        "handler_p50_ms": handler_seconds[len(handler_seconds) // 2] * 1000,
+        "handler_max_ms": handler_seconds[-1] * 1000,
+        "delivered_seconds": delivered,
+        "requests": sum(counts.values()),
+        "send_message": counts.get("sendMessage", 0),
+        "edit_message_text": counts.get("editMessageText", 0),
+        "flood_429": telegram.floods,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк очереди исходящих сообщений")
+    arg_parser.add_argument("--chats", type=int, default=60)
+    arg_parser.add_argument("--edits", type=int, default=5, help="Правок сообщения о ходе обработки")
+    arg_parser.add_argument("--messages", type=int, default=3, help="Сообщений в итоге")
+    arg_parser.add_argument("--interval", type=float, default=0.05, help="Пауза между правками, с")
+    arg_parser.add_argument("--workers", type=int, default=8, help="Потоков обработчиков")
+    arg_parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа API, с")
+    # Лимиты заглушки — порядок лимитов Bot API: около 1 сообщения в секунду в чат
+    # (с небольшим запасом подряд) и 30 в секунду всего
+    arg_parser.add_argument("--chat-limit", type=int, default=3)
+    arg_parser.add_argument("--global-limit", type=int, default=30)
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    report = {mode: run(mode, args) for mode in ("direct", "outbox")}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from bot.api import PARSE_TIERS, parse_tiered
+from bot.models import CashbackResponse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "gigachat_responses.json")
+
+# Прежняя реализация RobustParser.parse для сравнения
+def legacy_parse(text):
+    try:
+        text = text.replace("'", '"').replace("\\", "")
+        json_match = re.search(r'\{.*\}', text, re.DOTALL)
+        if not json_match:
+            raise ValueError("Не найден JSON в ответе")
+        data = json.loads(json_match.group())
+        if "cashbacks" in data and "categories" not in data:
+            data["categories"] = data.pop("cashbacks")
+        return CashbackResponse(**data)
+    except Exception:
+        return CashbackResponse(categories=[])
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        corpus = json.load(f)
+    for case in corpus:
+        case["expected"] = sorted((category, float(amount)) for category, amount in case["expected"])
+    return corpus
+
+def _pairs(response):
+    return sorted((cat.category, cat.amount) for cat in response.categories)
+
+# Каждый уровень отдельно: на скольких ответах он срабатывает и сколько стоит попытка
+def measure_tiers(corpus, rounds):
+    result = {}
+    for tier, parse in PARSE_TIERS:
+        hits = 0
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for case in corpus:
+                try:
+                    parse(case["response"])
+                    hits += 1
+                except Exception:
+                    pass
+        elapsed = time.perf_counter() - start
+        attempts = rounds * len(corpus)
+        result[tier] = {
+            "hit_rate": hits / attempts,
+            "us_per_attempt": elapsed / attempts * 1e6,
+        }
+    return result
+
+def measure_pipeline(name, parse, corpus, rounds):
+    correct = failed = 0
+    tiers = {}
+    details = []
+    for case in corpus:
+        response, tier = parse(case["response"])
+        got = _pairs(response)
+        correct += got == case["expected"]
+        failed += tier is None
+        tiers[tier or "failed"] = tiers.get(tier or "failed", 0) + 1
+        details.append({"name": case["name"], "tier": tier, "correct": got == case["expected"]})
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for case in corpus:
+            parse(case["response"])
+    elapsed = time.perf_counter() - start
+    total = rounds * len(corpus)
+    return {
+        "parser": name,
+        "accuracy": correct / len(corpus),
+        "failure_rate": failed / len(corpus),
+        "tiers": tiers,
+        "responses_per_second": total / elapsed,
+        "us_per_response": elapsed / total * 1e6,
+        "cases": details,
+    }
+
+def _legacy_with_tier(text):
+    response = legacy_parse(text)
+    return response, "legacy" if response.categories or text.strip() == '{"categories": []}' else None
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк разбора ответов GigaChat")
+    arg_parser.add_argument("--corpus", default=FIXTURES)
+    arg_parser.add_argument("--rounds", type=int, default=2000)
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    # Ошибки разбора ожидаемы для части корпуса
+    logging.getLogger("bot.api").setLevel(logging.CRITICAL)
+
+    corpus = load_corpus(args.corpus)
+    result = {
+        "corpus_size": len(corpus),
+        "tiered": measure_pipeline("tiered", parse_tiered, corpus, args.rounds),
+        "legacy": measure_pipeline("legacy", _legacy_with_tier, corpus, args.rounds),
+        "tiers": measure_tiers(corpus, args.rounds),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from bot.config import PREFILTER_THRESHOLD
+from bot.image_filter import DEFAULT_MODEL, filter_features, load_model, offer_probability
+from fakes import offer_screenshot, other_image
+
+# Размеченный набор: <каталог>/offer/* — скриншоты с условиями кэшбэка, <каталог>/other/* — всё остальное
+LABELS = {"offer": 1, "other": 0}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+def generate(directory, count):
+    for label in LABELS:
+        os.makedirs(os.path.join(directory, label), exist_ok=True)
+    for i in range(count):
+        offer_screenshot(seed=i, dark=i % 4 == 0).save(os.path.join(directory, "offer", f"synthetic-{i}.jpg"), quality=85)
+        kind = ("photo", "meme", "document")[i % 3]
+        other_image(seed=i, kind=kind).save(os.path.join(directory, "other", f"synthetic-{kind}-{i}.jpg"), quality=85)
+
+def load_fixtures(directory):
+    cases = []
+    for label, value in LABELS.items():
+        folder = os.path.join(directory, label)
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                cases.append({"path": os.path.join(folder, name), "label": value})
+    return cases
+
+def extract(cases):
+    for case in cases:
+        start = time.perf_counter()
+        case["features"] = filter_features(case["path"])
+        case["ms"] = (time.perf_counter() - start) * 1000
+    return cases
+
+# Логистическая регрессия градиентным спуском: признаков мало, хватает чистого Python
+def fit(cases, epochs=3000, rate=0.5, l2=0.001):
+    names = list(DEFAULT_MODEL["weights"])
+    weights = dict(DEFAULT_MODEL["weights"])
+    bias = DEFAULT_MODEL["bias"]
+    for _ in range(epochs):
+        grad = {name: 0.0 for name in names}
+        grad_bias = 0.0
+        for case in cases:
+            error = offer_probability(case["features"], {"bias": bias, "weights": weights}) - case["label"]
+            grad_bias += error
+            for name in names:
+                grad[name] += error * case["features"][name]
+        bias -= rate * grad_bias / len(cases)
+        for name in names:
+            weights[name] -= rate * (grad[name] / len(cases) + l2 * weights[name])
+    return {"bias": bias, "weights": weights}
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(math.ceil(q / 100 * len(values))) - 1)]
+
+def evaluate(cases, model, threshold):
+    offers = [c for c in cases if c["label"]]
+    others = [c for c in cases if not c["label"]]
+    scores = {c["path"]: offer_probability(c["features"], model) for c in cases}
+    rejected_offers = [c["path"] for c in offers if scores[c["path"]] < threshold]
+    accepted_others = [c["path"] for c in others if scores[c["path"]] >= threshold]
+    return {
+        "threshold": threshold,
+        "false_reject_rate": len(rejected_offers) / len(offers) if offers else None,
+        "false_accept_rate": len(accepted_others) / len(others) if others else None,
+        # Доля отсечённых запросов к GigaChat при реальной доле предложений в наборе
+        "saved_calls": (len(others) - len(accepted_others)) / len(cases),
+        "false_rejects": rejected_offers,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк локального фильтра изображений")
+    arg_parser.add_argument("--fixtures", required=True, help="Каталог с подкаталогами offer/ и other/")
+    arg_parser.add_argument("--generate", type=int, metavar="N", help="Сначала сгенерировать N синтетических пар")
+    arg_parser.add_argument("--model", help="JSON с весами (по умолчанию встроенные)")
+    arg_parser.add_argument("--fit", metavar="PATH", help="Обучить веса на наборе и сохранить в JSON")
+    arg_parser.add_argument("--threshold", type=float, default=PREFILTER_THRESHOLD)
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    logging.getLogger("bot").setLevel(logging.CRITICAL)
+
+    if args.generate:
+        generate(args.fixtures, args.generate)
+    cases = extract(load_fixtures(args.fixtures))
+    model = load_model(args.model)
+    if args.fit:
+        model = fit(cases)
+        model["threshold"] = args.threshold
+        with open(args.fit, "w", encoding="utf-8") as f:
+            json.dump(model, f, ensure_ascii=False, indent=2)
+
+    timings = [c["ms"] for c in cases]
+    result = {
+        "images": len(cases),
+        "offers": sum(c["label"] for c in cases),
+        "ms_p50": _percentile(timings, 50),
+        "ms_p95": _percentile(timings, 95),
+        "model": model,
+        "result": evaluate(cases, model, args.threshold),
+        "thresholds": [
+            {k: v for k, v in evaluate(cases, model, t).items() if k != "false_rejects"}
+            for t in (0.05, 0.1, 0.15, 0.2, 0.3, 0.5)
+        ],
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="cashback-reminders-"), "cashback.db")
+
+from bot import database as db
+from bot.config import REMINDER_HOUR
+from bot.reminders import ReminderScheduler, get_zone, reminder_time
+
+TIMEZONES = [
+    "Europe/Kaliningrad", "Europe/Moscow", "Europe/Samara", "Asia/Yekaterinburg", "Asia/Omsk",
+    "Asia/Novosibirsk", "Asia/Krasnoyarsk", "Asia/Irkutsk", "Asia/Yakutsk", "Asia/Vladivostok", "Asia/Kamchatka",
+]
+
+# Очередь исходящих без сети: запоминает, кому и когда (по часам бенчмарка) ушло напоминание
+class RecordingOutbox:
+    def __init__(self, clock):
+        self.clock = clock
+        self.pending = 0
+        self.sent = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((self.clock(), chat_id))
+        future = Future()
+        future.set_result(None)
+        return future
+
+# Пользователи с записью кэшбэка; inactive — доля тех, кто давно ничего не вносил
+def seed(users, inactive, period):
+    bank_id = db.get_bank_id("Сбербанк")
+    category_id = db.get_category_id("рестораны")
+    rng = random.Random(1)
+    rows = [
+        (user_id, bank_id, category_id, 5.0, "manual", "01.01.2020 00:00", "2020-01" if rng.random() < inactive else period)
+        for user_id in range(1, users + 1)
+    ]
+    with db._lock:
+        db.cursor.executemany(
+            "INSERT INTO cashback (user_id, bank_id, category_id, amount, input_type, created_at, period) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        db.conn.commit()
+
+def per_minute_peak(times):
+    counts = {}
+    for ts in times:
+        counts[int(ts // 60)] = counts.get(int(ts // 60), 0) + 1
+    return max(counts.values()) if counts else 0
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else None
+
+# Прогон по модельным часам: часы сдвигаются на время ожидания, которое вернул шаг планировщика
+def simulate(scheduler, clock, until, stop_after=None):
+    steps = 0
+    busy = 0.0
+    max_heap = 0
+    while clock[0] < until:
+        started = time.perf_counter()
+        wait = scheduler.run_once(clock[0])
+        busy += time.perf_counter() - started
+        steps += 1
+        max_heap = max(max_heap, len(scheduler.heap))
+        clock[0] += max(wait, 0.001)
+        if stop_after is not None and len(scheduler.outbox.sent) >= stop_after:
+            break
+    return steps, busy, max_heap
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк напоминаний о выборе категорий")
+    arg_parser.add_argument("--users", type=int, default=100000)
+    arg_parser.add_argument("--inactive", type=float, default=0.1, help="Доля неактивных пользователей")
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    # Начало последнего дня месяца (и на Камчатке ещё октябрь): напоминания наступают в следующие сутки
+    start = datetime(2026, 10, 31, tzinfo=timezone.utc).timestamp()
+    clock = [start]
+    seed(args.users, args.inactive, "2026-10")
+
+    scheduler = ReminderScheduler(clock=lambda: clock[0])
+    scheduler.outbox = RecordingOutbox(lambda: clock[0])
+    started = time.perf_counter()
+    # Часовые пояса по кругу; остальным назначит load()
+    users = list(range(1, args.users + 1))
+    for i, zone in enumerate(TIMEZONES):
+        scheduler.register(users[i::len(TIMEZONES) + 1], timezone=zone)
+    scheduler.load()
+    register_seconds = time.perf_counter() - started
+
+    due_times = [row[0] for row in db.cursor.execute("SELECT due_at FROM reminders")]
+    # Без сдвига: все пользователи часового пояса в одну секунду
+    no_jitter = []
+    for zone, count in db.cursor.execute("SELECT timezone, COUNT(*) FROM reminders GROUP BY timezone"):
+        moment = datetime(2026, 11, 1, REMINDER_HOUR, tzinfo=get_zone(zone)).timestamp()
+        no_jitter.extend([moment] * count)
+
+    # Перезапуск посередине: новый планировщик над той же базой и с той же очередью
+    until = start + 2 * 24 * 3600
+    steps, busy, max_heap = simulate(scheduler, clock, until, stop_after=args.users // 3)
+    restarted = ReminderScheduler(clock=lambda: clock[0])
+    restarted.outbox = scheduler.outbox
+    restarted.load()
+    more_steps, more_busy, more_heap = simulate(restarted, clock, until)
+
+    sent = scheduler.outbox.sent
+    due_by_user = dict(db.cursor.execute("SELECT user_id, due_at FROM reminders"))
+    recipients = [user_id for _, user_id in sent]
+    active = sum(len(db.get_active_users(users[i:i + 10000], "2026-08")) for i in range(0, len(users), 10000))
+    # После отправки у пользователя назначено напоминание о декабре; задержка — от времени ноябрьского
+    zones = dict(db.cursor.execute("SELECT user_id, timezone FROM reminders"))
+    lag = [ts - reminder_time(user_id, zones[user_id], "2026-11") for ts, user_id in sent]
+    report = {
+        "users": args.users,
+        "register_seconds": register_seconds,
+        "due_peak_per_minute": per_minute_peak(due_times),
+        "due_peak_per_minute_without_jitter": per_minute_peak(no_jitter),
+        "sent": len(sent),
+        "active_users": active,
+        "duplicates": len(recipients) - len(set(recipients)),
+        "rescheduled_to_december": sum(1 for due_at in due_by_user.values() if due_at > start + 20 * 24 * 3600),
+        "sent_peak_per_minute": per_minute_peak([ts for ts, _ in sent]),
+        "lag_p50_seconds": percentile(lag, 50),
+        "lag_p99_seconds": percentile(lag, 99),
+        "steps": steps + more_steps,
+        "scheduler_cpu_seconds": busy + more_busy,
+        "scheduler_us_per_reminder": (busy + more_busy) / max(1, args.users) * 1e6,
+        "max_heap": max(max_heap, more_heap),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="cashback-statement-"), "cashback.db")
+
+from fakes import write_statement
+from bot.categories import find_category
+from bot.statements import import_statement
+
+# Для сравнения: построчное чтение csv и поиск категории по словарю для каждой строки
+def naive_import(path):
+    started = time.perf_counter()
+    totals = {}
+    with open(path, encoding="cp1251", newline="") as f:
+        reader = csv.reader(f, delimiter=";")
+        next(reader)
+        for row in reader:
+            amount = float(row[4].replace(",", "."))
+            if amount >= 0 or row[3] != "OK":
+                continue
+            category = find_category(row[9]) if row[9] else find_category(row[11])
+            if category:
+                key = (row[0][6:10] + "-" + row[0][3:5], category)
+                totals[key] = totals.get(key, 0) + -amount
+    return time.perf_counter() - started
+
+def measure(path, chunk_rows):
+    tracemalloc.start()
+    report = import_statement(1, path, chunk_rows=chunk_rows, save=False)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Повторный прогон без tracemalloc: трассировка замедляет выделения памяти
+    report = import_statement(1, path, chunk_rows=chunk_rows, save=False)
+    return {
+        "rows": report["rows"],
+        "megabytes": report["bytes"] / 1024 / 1024,
+        "seconds": report["seconds"],
+        "rows_per_second": report["rows_per_second"],
+        "megabytes_per_second": report["megabytes_per_second"],
+        "peak_memory_mb": peak / 1024 / 1024,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк импорта выписок CSV и XLSX")
+    arg_parser.add_argument("--rows", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 100000, 300000])
+    arg_parser.add_argument("--xlsx-rows", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 50000])
+    arg_parser.add_argument("--chunk-rows", type=lambda v: [int(x) for x in v.split(",")], default=[5000, 20000, 100000])
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="cashback-statement-")
+    report = {"csv": {}, "xlsx": {}}
+    for extension, sizes in ((".csv", args.rows), (".xlsx", args.xlsx_rows)):
+        for rows in sizes:
+            path = os.path.join(directory, f"statement-{rows}{extension}")
+            write_statement(path, rows)
+            result = {str(chunk_rows): measure(path, chunk_rows) for chunk_rows in args.chunk_rows}
+            if extension == ".csv":
+                seconds = naive_import(path)
+                result["naive_rows_per_second"] = rows / seconds
+            report[extension[1:]][str(rows)] = result
+            os.unlink(path)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
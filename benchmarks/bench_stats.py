@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="cashback-stats-"), "cashback.db")
+
+from bot import database as db
+from bot.config import DEFAULT_BANKS, DEFAULT_CATEGORIES
+from bot.stats import CategoryStats
+
+# Строки текущего месяца: у каждого пользователя несколько банков и категорий
+def seed(users, rows_per_user, rng, first_user=0):
+    period = datetime.now().strftime("%Y-%m")
+    bank_ids = [db.get_bank_id(name) for name in DEFAULT_BANKS]
+    category_ids = [db.get_category_id(name) for name in DEFAULT_CATEGORIES]
+    now = int(time.time() * 1000)
+    data = []
+    for user_id in range(first_user, first_user + users):
+        pairs = rng.sample([(b, c) for b in bank_ids for c in category_ids], rows_per_user)
+        for bank_id, category_id in pairs:
+            data.append((user_id, bank_id, category_id, float(rng.choice([1, 2, 3, 5, 7, 10, 15])),
+                         "manual", "01.01.2020 00:00", period, now))
+    with db._lock:
+        db.cursor.executemany(
+            "INSERT INTO cashback (user_id, bank_id, category_id, amount, input_type, created_at, period, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (user_id, bank_id, category_id, period) DO UPDATE SET "
+            "amount = excluded.amount, updated_at = excluded.updated_at",
+            data
+        )
+        db.conn.commit()
+    return len(data)
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - started) * 1000, result
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк фонового пересчёта статистики по категориям")
+    arg_parser.add_argument("--users", type=int, default=20000)
+    arg_parser.add_argument("--rows-per-user", type=int, default=8)
+    arg_parser.add_argument("--delta-users", type=int, default=50, help="Пользователей, изменивших данные между пересчётами")
+    arg_parser.add_argument("--rounds", type=int, default=5)
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(1)
+    rows = seed(args.users, args.rows_per_user, rng)
+    stats = CategoryStats()
+    full_ms, result = timed(stats.refresh)
+
+    delta = []
+    rescan = []
+    for round_index in range(args.rounds):
+        time.sleep(0.002)
+        seed(args.delta_users, args.rows_per_user, rng, first_user=rng.randrange(args.users))
+        delta.append(timed(stats.refresh)[0])
+        # Для сравнения: пересчёт с нуля, как если бы каждый раз читалась вся таблица
+        rescan.append(timed(CategoryStats().refresh)[0])
+
+    report = {
+        "rows": rows,
+        "categories": len(result),
+        "initial_load_ms": full_ms,
+        "delta_rows": args.delta_users * args.rows_per_user,
+        "delta_refresh_ms": sum(delta) / len(delta),
+        "full_rescan_ms": sum(rescan) / len(rescan),
+        "aggregate_ms": timed(stats.aggregate)[0],
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
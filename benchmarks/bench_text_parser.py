@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_TOKEN", "0:benchmark")
+os.environ.setdefault("GIGACHAT_CREDENTIALS", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from bot.categories import find_category
+from bot.text_parser import parse_offer_text
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "text_offers.json")
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        corpus = json.load(f)
+    for case in corpus:
+        case["expected"] = {(category, float(amount)) for category, amount in case["expected"]}
+    return corpus
+
+# Точность: доля сообщений, разобранных полностью верно, и precision/recall по позициям
+def measure_accuracy(corpus):
+    exact = true_positive = predicted = expected = 0
+    failures = []
+    for case in corpus:
+        got = {(cat.category, cat.amount) for cat in parse_offer_text(case["text"]).categories}
+        exact += got == case["expected"]
+        true_positive += len(got & case["expected"])
+        predicted += len(got)
+        expected += len(case["expected"])
+        if got != case["expected"]:
+            failures.append({"text": case["text"], "got": sorted(got), "expected": sorted(case["expected"])})
+    return {
+        "messages": len(corpus),
+        "exact_match": exact / len(corpus),
+        "precision": true_positive / predicted if predicted else 1.0,
+        "recall": true_positive / expected if expected else 1.0,
+        "failures": failures,
+    }
+
+def measure_throughput(corpus, rounds, cold):
+    texts = [case["text"] for case in corpus]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if cold:
+            find_category.cache_clear()
+        for text in texts:
+            parse_offer_text(text)
+    elapsed = time.perf_counter() - start
+    total = rounds * len(texts)
+    return {
+        "messages": total,
+        "seconds": elapsed,
+        "messages_per_second": total / elapsed,
+        "us_per_message": elapsed / total * 1e6,
+    }
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк локального разбора текстовых предложений")
+    arg_parser.add_argument("--corpus", default=FIXTURES)
+    arg_parser.add_argument("--rounds", type=int, default=500)
+    arg_parser.add_argument("--output", help="Сохранить результат в JSON")
+    args = arg_parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    result = {
+        "accuracy": measure_accuracy(corpus),
+        "throughput_warm": measure_throughput(corpus, args.rounds, cold=False),
+        "throughput_cold": measure_throughput(corpus, max(1, args.rounds // 10), cold=True),
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeGigaChatServer, FakeTelegramServer, write_statement
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+# Конструкторы обновлений Telegram в том виде, в котором их отдаёт getUpdates
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+def message_update(user_id, text=None, photo=False, caption=None, document=None):
+    message = {
+        "message_id": next(_message_ids),
+        "from": _user(user_id),
+        "chat": {"id": user_id, "type": "private"},
+        "date": int(time.time()),
+    }
+    if photo:
+        message["photo"] = [{"file_id": "photo", "file_unique_id": "photo", "width": 720, "height": 1280}]
+        if caption:
+            message["caption"] = caption
+    elif document:
+        message["document"] = document
+    else:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": message}
+
+def callback_update(user_id, data):
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "from": {"id": 1, "is_bot": True, "first_name": "bench"},
+                "chat": {"id": user_id, "type": "private"},
+                "date": int(time.time()),
+                "text": "",
+            },
+        },
+    }
+
+def inline_update(user_id, query):
+    return {
+        "update_id": next(_update_ids),
+        "inline_query": {"id": str(next(_update_ids)), "from": _user(user_id), "query": query, "offset": ""},
+    }
+
+# Набор запроса в inline-режиме по буквам: каждое нажатие — отдельный запрос
+INLINE_KEYSTROKES = ["", "р", "ре", "рес", "рест", "к", "ка", "кат", "заправка"]
+# Ставки за месяц для массового ввода: шесть банков по пять категорий
+BULK_RATES = "\n".join(
+    f"{bank};{category};{1 + (i * 7 + j * 3) % 10}"
+    for i, bank in enumerate(["Тинькофф", "Альфа-Банк", "Сбербанк", "ВТБ", "OZON", "Газпромбанк"])
+    for j, category in enumerate(["рестораны", "азс", "аптеки", "такси", "супермаркеты"])
+)
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(latencies, elapsed):
+    return {
+        "count": len(latencies),
+        "throughput_per_second": len(latencies) / elapsed if elapsed else None,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else None,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+    }
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.telegram = FakeTelegramServer(latency=args.telegram_latency).start()
+        self.gigachat = FakeGigaChatServer(
+            first_token_latency=args.llm_latency, chunk_delay=args.llm_chunk_delay
+        ).start()
+        self.db_dir = tempfile.mkdtemp(prefix="cashback-bench-")
+        os.environ.update({
+            "TELEGRAM_TOKEN": "0:benchmark",
+            "TELEGRAM_API_URL": self.telegram.url,
+            "GIGACHAT_CREDENTIALS": "YmVuY2htYXJrOmJlbmNobWFyaw==",
+            "GIGACHAT_BASE_URL": self.gigachat.url + "/api/v1",
+            "GIGACHAT_AUTH_URL": self.gigachat.url + "/api/v2/oauth",
+            "DATABASE_URL": "sqlite:///" + os.path.join(self.db_dir, "cashback.db"),
+            # Заглушка не ограничивает отправку; лимиты очереди сообщений замеряет bench_outbox.py
+            "OUTBOX_GLOBAL_RATE": "100000",
+            "OUTBOX_CHAT_RATE": "100000",
+        })
+        # Импорт после настройки окружения: конфигурация читается при импорте
+        import bot
+        from bot import database
+        self.database = database
+        self.bot = bot.create_bot(threaded=False)
+        self.errors = 0
+        self.keystrokes = itertools.count()
+        # Выписка для сценария импорта: отдаётся заглушкой Telegram по getFile
+        statement = os.path.join(self.db_dir, "statement.csv")
+        write_statement(statement, args.statement_rows)
+        with open(statement, "rb") as f:
+            self.telegram.files["statement"] = f.read()
+
+    def process(self, update):
+        from telebot import types
+        started = time.perf_counter()
+        try:
+            self.bot.process_new_updates([types.Update.de_json(update)])
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"Ошибка обработки обновления: {str(e)}")
+        return time.perf_counter() - started
+
+    # Пользователь с заданным числом строк истории: банки x категории x периоды без повторов
+    def seed_user(self, user_id, rows):
+        db = self.database
+        banks = [f"Банк {i}" for i in range(20)]
+        categories = [f"категория {i}" for i in range(50)]
+        bank_ids = [db.get_bank_id(name) for name in banks]
+        category_ids = [db.get_category_id(name) for name in categories]
+        data = []
+        for n in range(rows):
+            period_index, rest = divmod(n, len(banks) * len(categories))
+            bank_index, category_index = divmod(rest, len(categories))
+            year, month = divmod(period_index, 12)
+            data.append((
+                user_id, bank_ids[bank_index], category_ids[category_index], float(1 + n % 15),
+                "manual", "01.01.2020 00:00", f"{2000 + year:04d}-{month + 1:02d}"
+            ))
+        with db._lock:
+            db.cursor.executemany(
+                "INSERT INTO cashback (user_id, bank_id, category_id, amount, input_type, created_at, period) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                data
+            )
+            db.conn.commit()
+
+    def manual_entry(self, user_id):
+        steps = [
+            message_update(user_id, "➕ Добавить информацию"),
+            callback_update(user_id, "bank_Тинькофф"),
+            message_update(user_id, "Ручной ввод"),
+            callback_update(user_id, "cat_рестораны"),
+            message_update(user_id, "5"),
+        ]
+        return sum(self.process(update) for update in steps), {}
+
+    def screenshot(self, user_id):
+        steps = [
+            callback_update(user_id, "bank_Альфа-Банк"),
+            message_update(user_id, "Скриншот"),
+        ]
+        total = sum(self.process(update) for update in steps)
+        photo_started = time.perf_counter()
+        total += self.process(message_update(user_id, photo=True))
+        total += self.wait_recognition(user_id)
+        edits = self.telegram.calls_for(user_id, "editMessageText", since=photo_started)
+        first_category = edits[0][0] - photo_started if edits else None
+        total += self.process(callback_update(user_id, "confirm_screenshot"))
+        return total, {"time_to_first_category": first_category}
+
+    # Скриншот до выбора банка: банк выбирается, пока идёт распознавание
+    def screenshot_first(self, user_id):
+        photo_started = time.perf_counter()
+        total = self.process(message_update(user_id, "/start"))
+        total += self.process(message_update(user_id, photo=True))
+        total += self.process(callback_update(user_id, "bank_Альфа-Банк"))
+        total += self.wait_recognition(user_id)
+        result = time.perf_counter() - photo_started
+        total += self.process(callback_update(user_id, "confirm_screenshot"))
+        return total, {"time_to_result": result}
+
+    # Распознавание идёт в фоновом пуле; ожидание, пока результат покажут пользователю
+    def wait_recognition(self, user_id, timeout=60.0):
+        from bot.handlers import sessions
+        started = time.perf_counter()
+        while sessions.get(user_id, {}).get("pending") is not None and time.perf_counter() - started < timeout:
+            time.sleep(0.002)
+        return time.perf_counter() - started
+
+    # Импорт выписки: от отправки файла до итогового сообщения (разбор идёт в фоновом пуле)
+    def statement(self, user_id, timeout=120.0):
+        document = {
+            "file_id": "statement", "file_unique_id": "statement", "file_name": "statement.csv",
+            "file_size": len(self.telegram.files["statement"]),
+        }
+        started = time.perf_counter()
+        self.process(message_update(user_id, document=document))
+        while time.perf_counter() - started < timeout:
+            edits = self.telegram.calls_for(user_id, "editMessageText", since=started)
+            if any(params.get("text", "")[:1] in ("✅", "❌") for _, params in edits):
+                break
+            time.sleep(0.005)
+        return time.perf_counter() - started, {}
+
+    # Выгрузка истории: от команды до отправленного файла (выгрузка идёт в фоновом пуле)
+    def export(self, user_id, timeout=120.0):
+        started = time.perf_counter()
+        self.process(message_update(user_id, "/export"))
+        while time.perf_counter() - started < timeout:
+            if self.telegram.calls_for(user_id, "sendDocument", since=started):
+                break
+            time.sleep(0.005)
+        return time.perf_counter() - started, {}
+
+    # Массовый ввод ставок одним сообщением /import
+    def bulk_import(self, user_id):
+        return self.process(message_update(user_id, "/import\n" + BULK_RATES)), {}
+
+    def summary(self, user_id):
+        return self.process(message_update(user_id, "📊 Показать сводку")), {}
+
+    # Один inline-запрос; первый после изменения данных собирает ответы пользователя заново
+    def inline(self, user_id):
+        query = INLINE_KEYSTROKES[next(self.keystrokes) % len(INLINE_KEYSTROKES)]
+        return self.process(inline_update(user_id, query)), {}
+
+    # Вопрос «какой картой платить»: обработчик целиком и отдельно поиск по индексу ставок
+    def best(self, user_id):
+        total = self.process(message_update(user_id, "/best рестораны"))
+        started = time.perf_counter()
+        self.database.get_best(user_id, "рестораны")
+        return total, {"lookup": time.perf_counter() - started}
+
+    def run_scenario(self, name, flow, users, iterations):
+        latencies = []
+        extra = {}
+        lock = threading.Lock()
+
+        def worker(user_id):
+            for _ in range(iterations):
+                latency, details = flow(user_id)
+                with lock:
+                    latencies.append(latency)
+                    for key, value in details.items():
+                        if value is not None:
+                            extra.setdefault(key, []).append(value)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(users)) as pool:
+            list(pool.map(worker, users))
+        elapsed = time.perf_counter() - started
+        result = summarize(latencies, elapsed)
+        for key, values in extra.items():
+            result[key] = summarize(values, elapsed)
+        print(f"{name}: p50={result['p50_ms']:.1f} мс p95={result['p95_ms']:.1f} мс "
+              f"p99={result['p99_ms']:.1f} мс, {result['throughput_per_second']:.1f}/с", file=sys.stderr)
+        return result
+
+    def run(self):
+        args = self.args
+        scenarios = {}
+        next_user = itertools.count(1000)
+        for history in args.history:
+            users = [next(next_user) for _ in range(args.concurrency)]
+            for user_id in users:
+                self.seed_user(user_id, history)
+            scenarios[f"summary/history={history}"] = self.run_scenario(
+                f"summary/history={history}", self.summary, users, args.iterations
+            )
+            scenarios[f"manual_entry/history={history}"] = self.run_scenario(
+                f"manual_entry/history={history}", self.manual_entry, users, args.iterations
+            )
+            scenarios[f"bulk_import/history={history}"] = self.run_scenario(
+                f"bulk_import/history={history}", self.bulk_import, users, args.iterations
+            )
+            scenarios[f"best/history={history}"] = self.run_scenario(
+                f"best/history={history}", self.best, users, args.iterations
+            )
+            scenarios[f"inline/history={history}"] = self.run_scenario(
+                f"inline/history={history}", self.inline, users, args.iterations * len(INLINE_KEYSTROKES)
+            )
+            scenarios[f"export/history={history}"] = self.run_scenario(
+                f"export/history={history}", self.export, users, args.export_iterations
+            )
+            scenarios[f"screenshot/history={history}"] = self.run_scenario(
+                f"screenshot/history={history}", self.screenshot, users, args.screenshot_iterations
+            )
+            scenarios[f"screenshot_first/history={history}"] = self.run_scenario(
+                f"screenshot_first/history={history}", self.screenshot_first, users, args.screenshot_iterations
+            )
+        scenarios["statement"] = self.run_scenario("statement", self.statement, users, args.statement_iterations)
+        return scenarios
+
+    def stop(self):
+        self.bot.outbox.flush(10)
+        self.telegram.stop()
+        self.gigachat.stop()
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+# Сравнение с ранее сохранённым результатом: изменение p50/p95/p99 по каждому сценарию
+def compare(current, baseline):
+    lines = []
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if result.get(key) and base.get(key):
+                deltas.append(f"{key} {base[key]:.1f} -> {result[key]:.1f} ({(result[key] / base[key] - 1) * 100:+.1f}%)")
+        lines.append(f"{name}: " + ", ".join(deltas))
+    return "\n".join(lines)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Сквозной бенчмарк бота с заглушками Telegram и GigaChat")
+    arg_parser.add_argument("--history", type=lambda v: [int(x) for x in v.split(",")], default=[10, 1000, 100000],
+                            help="Размеры истории пользователя через запятую")
+    arg_parser.add_argument("--iterations", type=int, default=20, help="Повторов ручного ввода и сводки на пользователя")
+    arg_parser.add_argument("--screenshot-iterations", type=int, default=3, help="Повторов сценария со скриншотом")
+    arg_parser.add_argument("--statement-rows", type=int, default=20000, help="Строк в выписке для сценария импорта")
+    arg_parser.add_argument("--statement-iterations", type=int, default=2, help="Повторов импорта выписки на пользователя")
+    arg_parser.add_argument("--export-iterations", type=int, default=2, help="Повторов /export на пользователя")
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="Одновременных пользователей")
+    arg_parser.add_argument("--llm-latency", type=float, default=1.0, help="Задержка до первого токена GigaChat, с")
+    arg_parser.add_argument("--llm-chunk-delay", type=float, default=0.02, help="Задержка между фрагментами ответа, с")
+    arg_parser.add_argument("--telegram-latency", type=float, default=0.0, help="Задержка ответа Bot API, с")
+    arg_parser.add_argument("--output", help="Файл результата (по умолчанию benchmarks/results/e2e-<commit>.json)")
+    arg_parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    harness = Harness(args)
+    try:
+        scenarios = harness.run()
+    finally:
+        harness.stop()
+
+    result = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "telegram_calls": harness.telegram.method_counts(),
+        "gigachat_requests": harness.gigachat.requests,
+        "errors": harness.errors,
+        "scenarios": scenarios,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"e2e-{result['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Результат сохранён в {output}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(result, json.load(f)), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import email
+import email.policy
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+# Ответ, который заглушка GigaChat отдаёт потоком
+DEFAULT_LLM_RESPONSE = json.dumps({"categories": [
+    {"category": "рестораны", "amount": 5},
+    {"category": "азс", "amount": 3},
+    {"category": "аптеки", "amount": 7},
+    {"category": "такси", "amount": 10},
+]}, ensure_ascii=False)
+
+def _jpeg(image=None):
+    buffer = io.BytesIO()
+    (image or offer_screenshot()).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+# Синтетический скриншот приложения банка: шапка, строки категорий с иконками и процентами
+def offer_screenshot(seed=0, width=720, height=1560, dark=False):
+    rng = random.Random(seed)
+    background, text = ((18, 18, 20), (235, 235, 235)) if dark else ((248, 248, 250), (25, 25, 30))
+    image = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=34)
+    accent = tuple(rng.randrange(40, 220) for _ in range(3))
+    draw.rectangle((0, 0, width, 180), fill=accent)
+    draw.text((40, 80), "Кешбэк на месяц", fill=(255, 255, 255), font=font)
+    y = 240
+    while y < height - 120:
+        icon = tuple(rng.randrange(40, 230) for _ in range(3))
+        draw.ellipse((40, y, 110, y + 70), fill=icon)
+        words = rng.choice(["Рестораны", "АЗС", "Аптеки", "Такси", "Супермаркеты", "Кино", "Одежда"])
+        draw.text((140, y + 14), words, fill=text, font=font)
+        draw.text((width - 140, y + 14), f"{rng.choice([1, 2, 3, 5, 7, 10, 15])}%", fill=accent, font=font)
+        y += rng.randrange(110, 150)
+    return image
+
+# Синтетическое «не предложение»: фото (градиенты, пятна, шум), мем с подписью или документ
+def other_image(seed=0, kind="photo", width=1280, height=960):
+    rng = random.Random(seed)
+    if kind == "document":
+        image = Image.new("RGB", (width, height), tuple(rng.randrange(150, 200) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        draw.polygon([(200, 60), (1080, 90), (1050, 920), (230, 900)], fill=(225, 222, 215))
+        for y in range(120, 860, 28):
+            draw.line((260, y, rng.randrange(600, 1000), y + 3), fill=(60, 60, 60), width=4)
+        return image.filter(ImageFilter.GaussianBlur(1.5))
+    top = [rng.randrange(256) for _ in range(3)]
+    bottom = [rng.randrange(256) for _ in range(3)]
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.composite(Image.new("RGB", (width, height), tuple(bottom)),
+                            Image.new("RGB", (width, height), tuple(top)), gradient)
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y, r = rng.randrange(width), rng.randrange(height), rng.randrange(20, 200)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(6))
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    if kind == "meme":
+        draw = ImageDraw.Draw(image)
+        font = ImageFont.load_default(size=72)
+        draw.text((60, 40), "КОГДА КЕШБЭК", fill=(255, 255, 255), font=font, stroke_width=4, stroke_fill=(0, 0, 0))
+        draw.text((60, height - 140), "ПРИШЁЛ", fill=(255, 255, 255), font=font, stroke_width=4, stroke_fill=(0, 0, 0))
+    return image
+
+class _Server:
+    def __init__(self, handler_class):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self):
+        params = dict(parse_qsl(urlparse(self.path).query))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        content_type = self.headers.get("Content-Type", "")
+        if body and content_type.startswith("application/json"):
+            params.update(json.loads(body))
+        elif body and content_type.startswith("application/x-www-form-urlencoded"):
+            params.update(parse_qsl(body.decode()))
+        elif body and content_type.startswith("multipart/form-data"):
+            # Загрузка файла (sendDocument): поля формы — строками, файлы — байтами
+            form = email.message_from_bytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body, policy=email.policy.HTTP
+            )
+            for part in form.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                params[name] = part.get_payload(decode=True) if part.get_filename() else part.get_content()
+        return params, body
+
+    def _send(self, status, payload, content_type="application/json"):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+# Операции синтетической выписки: категория банка, MCC, описание и знак суммы
+STATEMENT_OPERATIONS = [
+    ("Супермаркеты", "5411", "Пятёрочка", -1), ("Супермаркеты", "5411", "ВкусВилл", -1),
+    ("Рестораны", "5812", "Ресторан Пушкин", -1), ("Фастфуд", "5814", "Вкусно и точка", -1),
+    ("Топливо", "5541", "Лукойл АЗС 123", -1), ("Такси", "4121", "Yandex.Taxi", -1),
+    ("Аптеки", "5912", "Аптека Ригла", -1), ("Маркетплейсы", "5399", "WILDBERRIES", -1),
+    ("Мобильная связь", "4814", "МТС", -1), ("Различные товары", "5999", "ИП Иванов", -1),
+    ("Переводы", "", "Перевод Ивану И.", -1), ("Пополнения", "", "Зарплата", 1),
+]
+STATEMENT_HEADER = [
+    "Дата операции", "Дата платежа", "Номер карты", "Статус", "Сумма операции", "Валюта операции",
+    "Сумма платежа", "Валюта платежа", "Кэшбэк", "Категория", "MCC", "Описание", "Бонусы (включая кэшбэк)",
+]
+
+# Строки выписки в формате выгрузки интернет-банка; у части строк нет MCC и категории
+def statement_rows(rows, seed=0, months=3):
+    rng = random.Random(seed)
+    for index in range(rows):
+        category, mcc, description, sign = rng.choice(STATEMENT_OPERATIONS)
+        if rng.random() < 0.2:
+            category, mcc = "", ""
+        amount = sign * round(rng.uniform(50, 5000), 2)
+        day = f"{rng.randrange(1, 29):02d}.{12 - index * months // rows:02d}.2024 {rng.randrange(24):02d}:{rng.randrange(60):02d}:00"
+        status = "FAILED" if rng.random() < 0.01 else "OK"
+        amount_text = f"{amount:.2f}".replace(".", ",")
+        yield [day, day[:10], "*1234", status, amount_text, "RUB", amount_text, "RUB", "", category, mcc,
+               description + f" {index % 97}" * (rng.random() < 0.3), "0,00"]
+
+def write_statement(path, rows, seed=0, months=3):
+    if path.endswith(".xlsx"):
+        import openpyxl
+
+        # Обычный режим пишет строки в общую таблицу (sharedStrings), как Excel и выгрузки банков
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Выписка по счёту"])
+        sheet.append(STATEMENT_HEADER)
+        for row in statement_rows(rows, seed, months):
+            sheet.append(row)
+        workbook.save(path)
+        return
+    with open(path, "w", encoding="cp1251", newline="") as f:
+        f.write(";".join(STATEMENT_HEADER) + "\n")
+        for row in statement_rows(rows, seed, months):
+            f.write(";".join(f'"{value}"' for value in row) + "\n")
+
+# Методы, на которые действуют лимиты отправки
+FLOOD_METHODS = ("sendMessage", "editMessageText", "sendDocument", "sendPhoto")
+
+# Заглушка Telegram Bot API: отвечает на методы бота и запоминает вызовы с отметкой времени
+class FakeTelegramServer(_Server):
+    # chat_limit и global_limit — сколько сообщений в секунду пропускать в один чат и всего;
+    # сверх лимита ответ 429 с retry_after, как у Bot API
+    def __init__(self, latency=0.0, chat_limit=None, global_limit=None, retry_after=1):
+        super().__init__(_TelegramHandler)
+        self.latency = latency
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.retry_after = retry_after
+        self.sent = {}
+        self.floods = 0
+        self.photo = _jpeg()
+        # Документы для getFile: file_id -> содержимое
+        self.files = {}
+        self.lock = threading.Lock()
+        self.message_id = 0
+        self.calls = []
+
+    def next_message_id(self):
+        with self.lock:
+            self.message_id += 1
+            return self.message_id
+
+    # Превышен ли лимит: отправки за последнюю секунду в чат и всего
+    def flooded(self, method, params):
+        if method not in FLOOD_METHODS or not (self.chat_limit or self.global_limit):
+            return False
+        now = time.perf_counter()
+        chat_id = str(params.get("chat_id"))
+        with self.lock:
+            chat = self.sent.setdefault(chat_id, [])
+            everyone = self.sent.setdefault(None, [])
+            for times in (chat, everyone):
+                while times and now - times[0] > 1.0:
+                    times.pop(0)
+            if (self.chat_limit and len(chat) >= self.chat_limit) or \
+                    (self.global_limit and len(everyone) >= self.global_limit):
+                self.floods += 1
+                return True
+            chat.append(now)
+            everyone.append(now)
+            return False
+
+    def record(self, method, params):
+        with self.lock:
+            self.calls.append((time.perf_counter(), method, params))
+
+    # Вызовы метода для чата, сделанные после момента since
+    def calls_for(self, chat_id, method, since=0.0):
+        with self.lock:
+            return [
+                (ts, params) for ts, name, params in self.calls
+                if name == method and ts >= since and str(params.get("chat_id")) == str(chat_id)
+            ]
+
+    def method_counts(self):
+        with self.lock:
+            counts = {}
+            for _, method, _ in self.calls:
+                counts[method] = counts.get(method, 0) + 1
+            return counts
+
+class _TelegramHandler(_Handler):
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path.startswith("/file/"):
+            time.sleep(fake.latency)
+            file_id = self.path.rsplit("/", 1)[-1]
+            if "/documents/" in self.path and file_id in fake.files:
+                self._send(200, fake.files[file_id], "application/octet-stream")
+            else:
+                self._send(200, fake.photo, "image/jpeg")
+        else:
+            self.do_POST()
+
+    def do_POST(self):
+        fake = self.server.fake
+        params, _ = self._params()
+        method = urlparse(self.path).path.rsplit("/", 1)[-1]
+        time.sleep(fake.latency)
+        if fake.flooded(method, params):
+            self._send(429, {
+                "ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {fake.retry_after}",
+                "parameters": {"retry_after": fake.retry_after},
+            })
+            return
+        fake.record(method, params)
+        self._send(200, {"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method, params):
+        fake = self.server.fake
+        if method == "getFile" and params.get("file_id") in fake.files:
+            file_id = params["file_id"]
+            return {
+                "file_id": file_id, "file_unique_id": file_id,
+                "file_size": len(fake.files[file_id]), "file_path": f"documents/{file_id}"
+            }
+        if method == "getFile":
+            return {
+                "file_id": params.get("file_id"), "file_unique_id": "u",
+                "file_size": len(fake.photo), "file_path": "photos/file.jpg"
+            }
+        if method in ("sendMessage", "editMessageText", "sendDocument", "sendPhoto"):
+            chat_id = int(params.get("chat_id") or 0)
+            return {
+                "message_id": int(params.get("message_id") or fake.next_message_id()),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        return True
+
+# Заглушка GigaChat: авторизация, загрузка файла и потоковый ответ с настраиваемой задержкой
+class FakeGigaChatServer(_Server):
+    def __init__(self, first_token_latency=1.0, chunk_delay=0.02, chunk_size=16, response=DEFAULT_LLM_RESPONSE):
+        super().__init__(_GigaChatHandler)
+        self.first_token_latency = first_token_latency
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.response = response
+        self.lock = threading.Lock()
+        self.requests = {"oauth": 0, "files": 0, "chat": 0, "chat_with_attachments": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.requests[name] += 1
+
+class _GigaChatHandler(_Handler):
+    def do_POST(self):
+        fake = self.server.fake
+        path = urlparse(self.path).path
+        if path.endswith("/oauth"):
+            fake.count("oauth")
+            self._params()
+            self._send(200, {"access_token": "fake-token", "expires_at": int((time.time() + 3600) * 1000)})
+        elif path.endswith("/files"):
+            fake.count("files")
+            _, body = self._params()
+            self._send(200, {
+                "id": "fake-file", "object": "file", "bytes": len(body),
+                "created_at": int(time.time()), "filename": "image.jpg", "purpose": "general"
+            })
+        elif path.endswith("/chat/completions"):
+            fake.count("chat")
+            params, _ = self._params()
+            if any(m.get("attachments") for m in params.get("messages", [])):
+                fake.count("chat_with_attachments")
+            self._stream(params)
+        else:
+            self._send(404, {"message": "Not Found"})
+
+    # Потоковый ответ chunked-кодированием, как у настоящего API: соединение остаётся открытым
+    def _stream(self, params):
+        fake = self.server.fake
+        model = params.get("model") or "GigaChat"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(fake.first_token_latency)
+        text = fake.response
+        for start in range(0, len(text), fake.chunk_size):
+            chunk = {
+                "choices": [{"delta": {"role": "assistant", "content": text[start:start + fake.chunk_size]}, "index": 0}],
+                "created": int(time.time()), "model": model, "object": "chat.completion"
+            }
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            time.sleep(fake.chunk_delay)
+        final = {
+            "choices": [{"delta": {"content": ""}, "index": 0, "finish_reason": "stop"}],
+            "created": int(time.time()), "model": model, "object": "chat.completion",
+            "usage": {
+                "prompt_tokens": 1200, "completion_tokens": len(text) // 3,
+                "total_tokens": 1200 + len(text) // 3, "precached_prompt_tokens": 0
+            }
+        }
+        self._write_chunk(f"data: {json.dumps(final, ensure_ascii=False)}\n\ndata: [DONE]\n\n".encode())
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
@@ -0,0 +1,293 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from e2e import Harness, RESULTS_DIR, _git_commit, callback_update, inline_update, message_update, summarize
+
+# Границы гистограммы задержек, мс
+HISTOGRAM_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf")]
+
+def read_log(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def build_update(entry, user_offset=0):
+    user_id = entry["u"] + user_offset
+    if entry["k"] == "c":
+        return callback_update(user_id, entry["x"])
+    if entry["k"] == "i":
+        return inline_update(user_id, entry["x"])
+    if entry["k"] == "p":
+        return message_update(user_id, photo=True, caption=entry.get("x"))
+    return message_update(user_id, entry["x"])
+
+def histogram(values):
+    counts = [0] * len(HISTOGRAM_BUCKETS)
+    for value in values:
+        ms = value * 1000
+        for index, bound in enumerate(HISTOGRAM_BUCKETS):
+            if ms <= bound:
+                counts[index] += 1
+                break
+    return {("+Inf" if bound == float("inf") else str(bound)): count for bound, count in zip(HISTOGRAM_BUCKETS, counts)}
+
+# Воспроизведение: обновления подаются в пул обработчиков в запланированное время.
+# Обновления одного пользователя обрабатываются строго по очереди, задержка считается
+# от запланированного момента, поэтому ожидание в очереди входит в неё
+class Replayer:
+    def __init__(self, harness, workers):
+        from telebot import types
+        self.types = types
+        self.harness = harness
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.pending = defaultdict(deque)
+        self.busy = set()
+        self.reset()
+
+    def reset(self):
+        self.latencies = defaultdict(list)
+        self.errors = 0
+        self.submitted = 0
+        self.completed = 0
+        self.waiting = 0
+        self.done = threading.Event()
+
+    def submit(self, scheduled, entry, user_offset):
+        user = entry["u"] + user_offset
+        with self.lock:
+            self.submitted += 1
+            if user in self.busy:
+                self.pending[user].append((scheduled, entry, user_offset))
+                self.waiting += 1
+                return
+            self.busy.add(user)
+        self.pool.submit(self._run, scheduled, entry, user_offset)
+
+    def _run(self, scheduled, entry, user_offset):
+        user = entry["u"] + user_offset
+        ok = True
+        try:
+            update = self.types.Update.de_json(build_update(entry, user_offset))
+            self.harness.bot.process_new_updates([update])
+            if entry["k"] == "p":
+                self._watch_recognition(user, scheduled)
+        except Exception as e:
+            ok = False
+            logging.debug(f"Ошибка обработки: {str(e)}")
+        finished = time.perf_counter()
+        following = None
+        with self.lock:
+            self.latencies[entry["k"]].append(finished - scheduled)
+            self.errors += not ok
+            self.completed += 1
+            if self.pending[user]:
+                following = self.pending[user].popleft()
+                self.waiting -= 1
+            else:
+                self.busy.discard(user)
+                self.pending.pop(user, None)
+            if self.completed == self.expected:
+                self.done.set()
+        if following:
+            self.pool.submit(self._run, *following)
+
+    # Фото распознаётся в фоновом пуле бота: время до показа результата учитывается отдельно (p_result)
+    def _watch_recognition(self, user, scheduled):
+        from bot.handlers import sessions
+        future = sessions.get(user, {}).get("pending")
+        if future is None:
+            return
+
+        def done(_):
+            with self.lock:
+                self.latencies["p_result"].append(time.perf_counter() - scheduled)
+
+        future.add_done_callback(done)
+
+    def _wait_recognitions(self, timeout=60.0):
+        from bot.handlers import sessions
+        deadline = time.perf_counter() + timeout
+        while any(session.get("pending") for session in list(sessions.values())) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    # Очередь: ожидающие в пуле плюс ожидающие своей очереди у пользователя
+    def backlog(self):
+        with self.lock:
+            waiting = self.waiting
+        return self.pool._work_queue.qsize() + waiting
+
+    def run(self, schedule, expected):
+        self.reset()
+        self.expected = expected
+        samples = []
+        stop_sampling = threading.Event()
+        started = time.perf_counter()
+
+        def sampler():
+            while not stop_sampling.is_set():
+                samples.append((time.perf_counter() - started, self.backlog()))
+                stop_sampling.wait(0.1)
+
+        sampler_thread = threading.Thread(target=sampler, daemon=True)
+        sampler_thread.start()
+        for offset, entry, user_offset in schedule:
+            target = started + offset
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.submit(target, entry, user_offset)
+        submitted_at = time.perf_counter() - started
+        backlog_at_submit_end = self.backlog()
+        self.done.wait()
+        self._wait_recognitions()
+        elapsed = time.perf_counter() - started
+        stop_sampling.set()
+        sampler_thread.join()
+
+        all_latencies = [value for kind, values in self.latencies.items() if kind != "p_result" for value in values]
+        backlog_values = [value for _, value in samples]
+        return {
+            "updates": self.completed,
+            "duration_seconds": elapsed,
+            "submission_seconds": submitted_at,
+            "offered_rate": self.submitted / submitted_at if submitted_at else None,
+            "achieved_throughput": self.completed / elapsed if elapsed else None,
+            "error_rate": self.errors / self.completed if self.completed else 0.0,
+            "latency": summarize(all_latencies, elapsed),
+            "latency_by_kind": {kind: summarize(values, elapsed) for kind, values in self.latencies.items()},
+            "histogram_ms": histogram(all_latencies),
+            "queue": {
+                "max": max(backlog_values, default=0),
+                "mean": sum(backlog_values) / len(backlog_values) if backlog_values else 0,
+                "at_submission_end": backlog_at_submit_end,
+                "samples": [[round(t, 2), value] for t, value in samples[::max(1, len(samples) // 200)]],
+            },
+        }
+
+# Расписание по записанным отметкам времени, ускоренное в speed раз
+def recorded_schedule(entries, speed, loops):
+    span = (entries[-1]["t"] - entries[0]["t"]) / 1000 / speed if entries else 0
+    schedule = []
+    for loop in range(loops):
+        for entry in entries:
+            offset = loop * (span + 1) + (entry["t"] - entries[0]["t"]) / 1000 / speed
+            schedule.append((offset, entry, loop * 10 ** 15))
+    return schedule
+
+# Открытая модель нагрузки: обновления подаются с заданной частотой независимо от скорости обработки
+def rate_schedule(entries, rate, loops):
+    schedule = []
+    index = 0
+    for loop in range(loops):
+        for entry in entries:
+            schedule.append((index / rate, entry, loop * 10 ** 15))
+            index += 1
+    return schedule
+
+# Синтетический журнал со смесью сценариев, если записанного нет
+def synthesize(users, seed):
+    rng = random.Random(seed)
+    flows = {
+        "manual": [("m", "➕ Добавить информацию"), ("c", "bank_Тинькофф"), ("m", "Ручной ввод"),
+                   ("c", "cat_рестораны"), ("m", "5")],
+        "screenshot": [("m", "➕ Добавить информацию"), ("c", "bank_Альфа-Банк"), ("m", "Скриншот"),
+                       ("p", None), ("c", "confirm_screenshot")],
+        "summary": [("m", "📊 Показать сводку")],
+    }
+    entries = []
+    for user in range(1, users + 1):
+        t = rng.uniform(0, 60)
+        for _ in range(rng.randint(1, 3)):
+            flow = rng.choices(list(flows), weights=[5, 3, 4])[0]
+            for kind, value in flows[flow]:
+                entry = {"u": user, "k": kind, "t": int(t * 1000)}
+                if value is not None:
+                    entry["x"] = value
+                entries.append(entry)
+                t += rng.uniform(1.0, 6.0)
+            t += rng.uniform(10, 60)
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений против заглушек Telegram и GigaChat")
+    arg_parser.add_argument("log", nargs="?", help="Журнал UPDATE_LOG_PATH (.jsonl или .jsonl.gz)")
+    arg_parser.add_argument("--synthesize", type=int, metavar="USERS", help="Сгенерировать журнал для USERS пользователей")
+    arg_parser.add_argument("--save-log", help="Сохранить сгенерированный журнал")
+    arg_parser.add_argument("--speed", type=float, default=1.0, help="Ускорение записанного времени (1, 10, ...)")
+    arg_parser.add_argument("--rate", type=lambda v: [float(x) for x in v.split(",")],
+                            help="Открытая нагрузка, обновлений в секунду; несколько значений через запятую")
+    arg_parser.add_argument("--loops", type=int, default=1, help="Сколько раз повторить журнал")
+    arg_parser.add_argument("--workers", type=int, default=2, help="Потоков обработки (num_threads TeleBot)")
+    arg_parser.add_argument("--slo-ms", type=float, default=2000, help="Порог p95 для определения насыщения")
+    arg_parser.add_argument("--llm-latency", type=float, default=1.0)
+    arg_parser.add_argument("--llm-chunk-delay", type=float, default=0.02)
+    arg_parser.add_argument("--telegram-latency", type=float, default=0.0)
+    arg_parser.add_argument("--output", help="Файл результата (по умолчанию benchmarks/results/replay-<commit>.json)")
+    args = arg_parser.parse_args()
+
+    if args.synthesize:
+        entries = synthesize(args.synthesize, seed=1)
+        if args.save_log:
+            with gzip.open(args.save_log, "wt", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+    elif args.log:
+        entries = read_log(args.log)
+    else:
+        arg_parser.error("нужен журнал или --synthesize")
+    entries.sort(key=lambda entry: entry["t"])
+
+    logging.basicConfig(level=logging.WARNING)
+    harness = Harness(args)
+    replayer = Replayer(harness, args.workers)
+    runs = []
+    try:
+        if args.rate:
+            plans = [(f"rate={rate}", rate_schedule(entries, rate, args.loops)) for rate in args.rate]
+        else:
+            plans = [(f"speed={args.speed}x", recorded_schedule(entries, args.speed, args.loops))]
+        for name, schedule in plans:
+            result = replayer.run(schedule, len(schedule))
+            result["name"] = name
+            p95 = result["latency"]["p95_ms"] or 0
+            # Насыщение: очередь не успевает разбираться к концу подачи или p95 выше порога
+            result["saturated"] = result["queue"]["at_submission_end"] > args.workers or p95 > args.slo_ms
+            runs.append(result)
+            print(f"{name}: {result['achieved_throughput']:.1f} обн/с, p95={p95:.0f} мс, "
+                  f"очередь max={result['queue']['max']}, ошибки={result['error_rate']:.1%}, "
+                  f"насыщение={'да' if result['saturated'] else 'нет'}", file=sys.stderr)
+    finally:
+        replayer.pool.shutdown(wait=False)
+        harness.stop()
+
+    saturation = next((run["name"] for run in runs if run["saturated"]), None)
+    output = args.output or os.path.join(RESULTS_DIR, f"replay-{_git_commit() or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output",)},
+            "log_updates": len(entries),
+            "saturation_point": saturation,
+            "runs": runs,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Результат сохранён в {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,37 @@
-from .config import TELEGRAM_TOKEN
+from .config import (
+    TELEGRAM_TOKEN, TELEGRAM_API_URL, UPDATE_LOG_PATH, UPDATE_LOG_SALT, METRICS_PORT, METRICS_HOST,
+    TRACE_LOG_PATH, TRACE_OTLP_ENDPOINT, TRACE_SAMPLE_RATE, STATS_INTERVAL, REMINDER_RATE
+)
 from .handlers import register_handlers
-from telebot import TeleBot
+from .recorder import attach_recorder
+from .metrics import QUEUE_DEPTH, instrument_handlers, start_metrics_server
+from .logging_config import bind_handlers
+from .http_pool import install_telegram_session
+from .stats import start_stats_job
+from .reminders import start_reminders
+from . import tracing
+from telebot import TeleBot, apihelper
 
-def create_bot():
-    bot = TeleBot(TELEGRAM_TOKEN)
+def create_bot(threaded=True):
+    if TELEGRAM_API_URL:
+        apihelper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+        apihelper.FILE_URL = TELEGRAM_API_URL.rstrip("/") + "/file/bot{0}/{1}"
+    install_telegram_session()
+    bot = TeleBot(TELEGRAM_TOKEN, threaded=threaded)
     register_handlers(bot)
-    return bot 
\ No newline at end of file
+    instrument_handlers(bot)
+    bind_handlers(bot)
+    if TRACE_LOG_PATH or TRACE_OTLP_ENDPOINT:
+        tracing.configure(TRACE_LOG_PATH, TRACE_OTLP_ENDPOINT, TRACE_SAMPLE_RATE)
+        tracing.install(bot)
+    if threaded:
+        QUEUE_DEPTH.set_function(bot.worker_pool.tasks.qsize)
+    if UPDATE_LOG_PATH:
+        attach_recorder(bot, UPDATE_LOG_PATH, UPDATE_LOG_SALT)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+    if STATS_INTERVAL:
+        start_stats_job(STATS_INTERVAL)
+    if REMINDER_RATE:
+        start_reminders(bot.outbox)
+    return bot
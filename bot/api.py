@@ -1,45 +1,199 @@
 import json
 import re
 import os
+import random
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_gigachat.chat_models import GigaChat
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain.output_parsers import PydanticOutputParser
 import logging
 
-from .config import GIGACHAT_CREDENTIALS, GIGACHAT_MODEL, GIGACHAT_TEMPERATURE, GIGACHAT_TIMEOUT
+from .config import (
+    GIGACHAT_CREDENTIALS, GIGACHAT_MODEL, GIGACHAT_TEMPERATURE, GIGACHAT_TIMEOUT,
+    GIGACHAT_BASE_URL, GIGACHAT_AUTH_URL, GIGACHAT_MODEL_TIERS, ROUTING_SHADOW_RATE,
+    ROUTING_SHADOW_WORKERS
+)
 from .models import CashbackCategory, CashbackResponse
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from .categories import canonicalize_categories, canonicalize_category
+from .metrics import (
+    EMPTY_PARSES, LLM_CALLS, LLM_FIRST_CATEGORY_SECONDS, LLM_IMAGE_BYTES, LLM_TOKENS,
+    RECOGNITION_ERRORS, RECOGNITIONS, ROUTING_AGREEMENT, ROUTING_DECISIONS, STAGE_SECONDS
 )
+from .database import SYSTEM_USER_ID, record_llm_usage, record_routing
+from .routing import agreement, escalation_reason, image_features
+from .http_pool import share_gigachat_pool
+from .tracing import span
+
 logger = logging.getLogger(__name__)
 
+# Клиенты GigaChat по моделям; создаются при первом обращении и переиспользуются,
+# соединения всех моделей идут через общий пул httpx (bot/http_pool.py)
+_endpoints = {"base_url": GIGACHAT_BASE_URL, "auth_url": GIGACHAT_AUTH_URL}
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm(model=GIGACHAT_MODEL):
+    with _clients_lock:
+        client = _clients.get(model)
+        if client is None:
+            client = _clients[model] = share_gigachat_pool(GigaChat(
+                credentials=GIGACHAT_CREDENTIALS,
+                temperature=GIGACHAT_TEMPERATURE,
+                verify_ssl_certs=False,
+                timeout=GIGACHAT_TIMEOUT,
+                model=model,
+                **{key: value for key, value in _endpoints.items() if value}
+            ))
+        return client
+
 # Инициализация LLM
-llm = GigaChat(
-    credentials=GIGACHAT_CREDENTIALS,
-    temperature=GIGACHAT_TEMPERATURE,
-    verify_ssl_certs=False,
-    timeout=GIGACHAT_TIMEOUT,
-    model=GIGACHAT_MODEL
+llm = get_llm(GIGACHAT_MODEL)
+
+# Инкрементальный разбор JSON из потока модели: учитывает вложенность скобок и строки,
+# каждая категория отдаётся сразу после закрытия её объекта внутри массива
+class StreamingJSONScanner:
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = None
+        self.escape = False
+        self.object_start = None
+        self.object_depth = None
+        self.root_start = None
+        self.root_end = None
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        objects = []
+        while self.pos < len(self.text) and self.root_end is None:
+            char = self.text[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == self.in_string:
+                    self.in_string = None
+            elif char in "\"'" and self.stack:
+                self.in_string = char
+            elif char in "{[":
+                if not self.stack and char == "{" and self.root_start is None:
+                    self.root_start = self.pos
+                if char == "{" and self.stack and self.stack[-1] == "[" and self.object_start is None:
+                    self.object_start = self.pos
+                    self.object_depth = len(self.stack)
+                if self.stack or char == "{":
+                    self.stack.append(char)
+            elif char in "}]" and self.stack:
+                self.stack.pop()
+                if char == "}" and self.object_start is not None and len(self.stack) == self.object_depth:
+                    objects.append(self.text[self.object_start:self.pos + 1])
+                    self.object_start = None
+                if not self.stack:
+                    self.root_end = self.pos + 1
+            self.pos += 1
+        return objects
+
+    # Первый сбалансированный объект верхнего уровня
+    def root(self):
+        if self.root_start is None or self.root_end is None:
+            return None
+        return self.text[self.root_start:self.root_end]
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+# Исправление типичных ошибок модели: одинарные кавычки, лишние обратные слэши, висячие запятые
+def _repair_json(text: str) -> str:
+    text = text.replace("\\", "")
+    if '"' not in text:
+        text = text.replace("'", '"')
+    return _TRAILING_COMMA_RE.sub(r"\1", text)
+
+def _loads_lenient(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(_repair_json(text))
+
+def extract_json(text: str):
+    scanner = StreamingJSONScanner()
+    scanner.feed(text)
+    return scanner.root()
+
+def _to_response(data) -> CashbackResponse:
+    if isinstance(data, list):
+        data = {"categories": data}
+    if "cashbacks" in data and "categories" not in data:
+        data["categories"] = data.pop("cashbacks")
+    return CashbackResponse(**data)
+
+# Уровень 1: ответ целиком является корректным JSON
+def _parse_strict(text: str) -> CashbackResponse:
+    if not text.lstrip().startswith(("{", "[")):
+        raise ValueError("Ответ не начинается с JSON")
+    return _to_response(json.loads(text))
+
+# Уровень 2: JSON внутри markdown-блока или окружён текстом
+def _parse_extracted(text: str) -> CashbackResponse:
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("Не найден JSON в ответе")
+    # Обычно хватает среза от первой до последней скобки; посимвольный разбор — если после JSON есть текст со скобками
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        data = json.loads(extract_json(text[start:]) or "")
+    return _to_response(data)
+
+# Уровень 3: исправление синтаксиса и значений вида "5%"
+def _parse_repaired(text: str) -> CashbackResponse:
+    json_str = extract_json(text) or text
+    data = json.loads(_repair_json(json_str))
+    items = data if isinstance(data, list) else data.get("categories", data.get("cashbacks", []))
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get("amount"), str):
+            item["amount"] = float(item["amount"].strip(" %").replace(",", "."))
+    return _to_response(data)
+
+PARSE_TIERS = (
+    ("strict", _parse_strict),
+    ("extracted", _parse_extracted),
+    ("repaired", _parse_repaired),
 )
 
-class RobustParser(PydanticOutputParser):
-    def parse(self, text: str) -> CashbackResponse:
+# Сколько ответов разобрано на каждом уровне и сколько времени это заняло
+parse_stats = {name: {"count": 0, "seconds": 0.0} for name, _ in PARSE_TIERS}
+parse_stats["failed"] = {"count": 0, "seconds": 0.0}
+_parse_stats_lock = threading.Lock()
+
+def _record_parse(tier: str, seconds: float):
+    with _parse_stats_lock:
+        parse_stats[tier]["count"] += 1
+        parse_stats[tier]["seconds"] += seconds
+
+# Разбор ответа модели: дешёвые уровни пробуются первыми, исправления — только при неудаче.
+# Возвращает результат и название уровня (None, если ответ разобрать не удалось)
+def parse_tiered(text: str):
+    started = time.perf_counter()
+    error = None
+    for tier, parse in PARSE_TIERS:
         try:
-            text = text.replace("'", '"').replace("\\", "")
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if not json_match:
-                raise ValueError("Не найден JSON в ответе")
-            json_str = json_match.group()
-            data = json.loads(json_str)
-            if "cashbacks" in data and "categories" not in data:
-                data["categories"] = data.pop("cashbacks")
-            return CashbackResponse(**data)
+            result = parse(text)
         except Exception as e:
-            logger.error(f"Ошибка парсинга: {str(e)}")
-            return CashbackResponse(categories=[])
+            error = e
+            continue
+        _record_parse(tier, time.perf_counter() - started)
+        return result, tier
+    _record_parse("failed", time.perf_counter() - started)
+    logger.error("Ошибка парсинга: %s; ответ: %r", error, text[:200])
+    return CashbackResponse(categories=[]), None
+
+class RobustParser(PydanticOutputParser):
+    def parse(self, text: str) -> CashbackResponse:
+        return parse_tiered(text)[0]
 
 parser = RobustParser(pydantic_object=CashbackResponse)
 
@@ -50,35 +204,172 @@ def _get_messages_from_url(url: str):
         ]
     }
 
-def analyze_image(file_path: str):
+# Категория из объекта, закрывшегося в потоке; неполные и некорректные объекты пропускаются
+def _stream_category(obj: str):
     try:
-        # Загрузка файла и получение его ID
-        with open(file_path, "rb") as f:
+        data = _loads_lenient(obj)
+        category = CashbackCategory(**data)
+    except Exception:
+        return None
+    category.category = canonicalize_category(category.category)
+    return category
+
+# Учёт расхода: токены из usage_metadata последнего фрагмента потока, размер изображения и время.
+# Токены изображения GigaChat включает в prompt_tokens, поэтому отдельно сохраняется размер файла
+def _account_usage(user_id, usage, model, image_bytes, seconds):
+    usage = usage or {}
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    precached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    LLM_CALLS.inc(model)
+    LLM_TOKENS.inc(model, "prompt", amount=prompt_tokens)
+    LLM_TOKENS.inc(model, "completion", amount=completion_tokens)
+    LLM_TOKENS.inc(model, "precached", amount=precached_tokens)
+    LLM_IMAGE_BYTES.observe(image_bytes)
+    logger.info(
+        "Расход GigaChat: %s, prompt=%d, completion=%d, изображение %d байт", model, prompt_tokens, completion_tokens, image_bytes,
+        extra={"stage": "llm_usage", "duration_ms": round(seconds * 1000, 1)}
+    )
+    if user_id is not None:
+        try:
+            record_llm_usage(user_id, model, prompt_tokens, completion_tokens, precached_tokens, image_bytes, seconds)
+        except Exception as e:
+            logger.error("Не удалось сохранить расход токенов: %s", e)
+
+IMAGE_PROMPT = (
+    "Проанализируй изображение и выдели все категории кешбэка, которые на нем указаны. "
+    "Выделяй только название категории и процент кешбэка. "
+    "Возвращай данные в формате JSON: {\"categories\": [{\"category\": \"название\", \"amount\": число}]}. "
+    "Название категории должно быть в нижнем регистре, без лишних знаков пунктуации. "
+    "Если на изображении указан банк, добавь поле \"bank\" с его названием, иначе null. "
+    "Пример: {\"categories\": [{\"category\": \"рестораны\", \"amount\": 5}, {\"category\": \"азс\", \"amount\": 3}], \"bank\": \"Альфа-Банк\"}"
+)
+
+# Один запрос к модели по загруженному файлу. Категории передаются в on_category по мере
+# получения; возвращаются распознанные категории, уровень разбора, время ответа и банк
+def _recognize(model, file_id, on_category=None, user_id=None, image_bytes=0):
+    messages = [
+        SystemMessage(content=IMAGE_PROMPT),
+        HumanMessage(content="", additional_kwargs={"attachments": [file_id]})
+    ]
+    
+    started = time.monotonic()
+    first_category_at = None
+    scanner = StreamingJSONScanner()
+    chunks = []
+    usage = None
+    with span("gigachat.stream", model=model):
+        for chunk in get_llm(model).stream(messages):
+            chunks.append(chunk.content)
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+            for obj in scanner.feed(chunk.content):
+                category = _stream_category(obj)
+                if category is None:
+                    continue
+                if first_category_at is None:
+                    first_category_at = time.monotonic() - started
+                    LLM_FIRST_CATEGORY_SECONDS.observe(first_category_at)
+                if on_category:
+                    on_category(category)
+    total = time.monotonic() - started
+    STAGE_SECONDS.observe(total, "llm")
+    if first_category_at is not None:
+        logger.info(
+            "%s: первая категория через %.2f с, ответ целиком за %.2f с", model, first_category_at, total,
+            extra={"stage": "llm", "duration_ms": round(total * 1000, 1)}
+        )
+    else:
+        logger.info(
+            "%s: ответ получен за %.2f с, категорий в потоке нет", model, total,
+            extra={"stage": "llm", "duration_ms": round(total * 1000, 1)}
+        )
+    _account_usage(user_id, usage, model, image_bytes, total)
+    
+    # Парсинг ответа в структурированные данные
+    with STAGE_SECONDS.time("parse"), span("parse"):
+        result, tier = parse_tiered("".join(chunks))
+        categories = canonicalize_categories(result.categories)
+    return categories, tier, total, result.bank
+
+_shadow_pool = ThreadPoolExecutor(max_workers=ROUTING_SHADOW_WORKERS, thread_name_prefix="routing-shadow")
+_shadow_slots = threading.BoundedSemaphore(ROUTING_SHADOW_WORKERS)
+
+# Теневая проверка: старшая модель распознаёт тот же файл в фоне, результат пользователю
+# не показывается, сохраняется только согласие моделей для настройки порогов. Токены проверки
+# записываются на SYSTEM_USER_ID, а не на пользователя: его дневной лимит они не расходуют
+def _shadow_check(user_id, features, file_id, first):
+    # Очередь проверок не копится: при занятых потоках эта проверка пропускается
+    if not _shadow_slots.acquire(blocking=False):
+        logger.debug("Теневая проверка пропущена: все потоки заняты")
+        return
+
+    def run():
+        try:
+            model = GIGACHAT_MODEL_TIERS[-1]
+            categories, _, seconds, _ = _recognize(model, file_id, user_id=SYSTEM_USER_ID, image_bytes=features["bytes"])
+            score = agreement(first[1], categories)
+            ROUTING_AGREEMENT.observe(score)
+            record_routing(user_id, features, first, (model, categories, seconds), None, score, shadow=True)
+        except Exception as e:
+            logger.warning("Теневая проверка не удалась: %s", e)
+        finally:
+            _shadow_slots.release()
+
+    _shadow_pool.submit(run)
+
+# Распознавание скриншота с маршрутизацией по моделям GIGACHAT_MODEL_TIERS: сначала младшая,
+# при пустом или сомнительном результате — следующая. Сложные изображения сразу идут в старшую.
+# Перед повторным запросом вызывается on_escalate, чтобы сбросить показанные категории.
+# Банк, если модель нашла его на скриншоте, передаётся в on_bank
+def analyze_image(file_path: str, on_category=None, user_id=None, on_escalate=None, on_bank=None):
+    try:
+        # Загрузка файла и получение его ID; файл доступен всем моделям
+        with open(file_path, "rb") as f, STAGE_SECONDS.time("upload"), span("gigachat.upload_file"):
             uploaded_file = llm.upload_file(f)
         
-        # Формирование запроса с системным промптом и изображением
-        messages = [
-            SystemMessage(
-                content=(
-                    "Проанализируй изображение и выдели все категории кешбэка, которые на нем указаны. "
-                    "Выделяй только название категории и процент кешбэка. "
-                    "Возвращай данные в формате JSON: {\"categories\": [{\"category\": \"название\", \"amount\": число}]}. "
-                    "Название категории должно быть в нижнем регистре, без лишних знаков пунктуации. "
-                    "Пример: {\"categories\": [{\"category\": \"рестораны\", \"amount\": 5}, {\"category\": \"азс\", \"amount\": 3}]}"
-                )
-            ),
-            HumanMessage(
-                content=[{"type": "file", "file_id": uploaded_file.id_}]
-            )
-        ]
+        tiers = GIGACHAT_MODEL_TIERS
+        features = image_features(file_path) if len(tiers) > 1 else {"bytes": os.path.getsize(file_path)}
+        index = len(tiers) - 1 if features.get("complex") else 0
+        attempts = []
+        bank = None
+        reason = "complex" if features.get("complex") and len(tiers) > 1 else None
+        while True:
+            model = tiers[index]
+            categories, tier, seconds, detected_bank = _recognize(model, uploaded_file.id_, on_category, user_id, features["bytes"])
+            attempts.append((model, categories, seconds))
+            bank = detected_bank or bank
+            if index == len(tiers) - 1:
+                break
+            escalation = escalation_reason(categories, tier)
+            if escalation is None:
+                break
+            reason = reason or escalation
+            logger.info("Эскалация %s -> %s: %s", model, tiers[index + 1], escalation)
+            if on_escalate:
+                on_escalate()
+            index += 1
         
-        # Отправка запроса и получение ответа
-        response = llm(messages)
+        if len(tiers) > 1:
+            first, final = attempts[0], attempts[-1]
+            score = agreement(first[1], final[1]) if len(attempts) > 1 else None
+            if score is not None:
+                ROUTING_AGREEMENT.observe(score)
+            ROUTING_DECISIONS.inc(first[0], "escalated" if len(attempts) > 1 else reason or "accepted")
+            record_routing(user_id, features, first, final, reason, score)
+            if len(attempts) == 1 and first[0] != tiers[-1] and random.random() < ROUTING_SHADOW_RATE:
+                _shadow_check(user_id, features, uploaded_file.id_, first)
         
-        # Парсинг ответа в структурированные данные
-        result = parser.parse(response.content)
-        return result.categories
+        categories = attempts[-1][1]
+        if bank and on_bank:
+            on_bank(bank)
+        if categories:
+            RECOGNITIONS.inc("llm")
+        else:
+            EMPTY_PARSES.inc("llm")
+        return categories
     
     except Exception as e:
-        logger.error(f"Ошибка при анализе изображения: {str(e)}")
-        return [] 
\ No newline at end of file
+        RECOGNITION_ERRORS.inc()
+        logger.error("Ошибка при анализе изображения: %s", e)
+        return []
@@ -0,0 +1,158 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from .config import CATEGORY_EMOJIS, CATEGORY_SYNONYMS, DEFAULT_CATEGORIES, BANK_SYNONYMS
+from .models import CashbackCategory
+from .metrics import CACHE_HITS, CACHE_MISSES
+
+# Минимальное сходство по триграммам (коэффициент Дайса), с которого кандидат проверяется
+MIN_SIMILARITY = 0.35
+# Сходство, при котором кандидат принимается без проверки расстояния Левенштейна
+ACCEPT_SIMILARITY = 0.75
+# Сколько лучших кандидатов проверять расстоянием Левенштейна
+MAX_CANDIDATES = 5
+
+_NOISE_RE = re.compile(r"[^\w\s]|[\d_]")
+_SPACES_RE = re.compile(r"\s+")
+_COMPOUND_RE = re.compile(r"\s+и\s+|[,/&+;]")
+
+def normalize_category(text: str) -> str:
+    text = text.lower().replace("ё", "е").replace("-", " ")
+    text = _NOISE_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+# Части составного названия: "АЗС и заправки", "кафе, рестораны"
+def split_compound(text: str):
+    return [part for part in _COMPOUND_RE.split(text.lower()) if normalize_category(part)]
+
+def _trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _levenshtein(a: str, b: str, limit: int) -> int:
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+# Поиск по словарю синонимов: точное совпадение, затем нечёткое по триграммам и расстоянию
+# Левенштейна. stopwords — слова, которые не участвуют в сравнении ("банк" в названиях банков);
+# max_distance — предел расстояния вместо доли от длины и без приёма по одному сходству
+class CategoryIndex:
+    def __init__(self, synonyms, stopwords=(), max_distance=None):
+        self.stopwords = set(stopwords)
+        self.max_distance = max_distance
+        self.exact = {}
+        self.terms = []
+        self.term_trigrams = []
+        self.postings = defaultdict(list)
+        for canonical, variants in synonyms.items():
+            for variant in [canonical, *variants]:
+                term = self._term(variant)
+                if not term or term in self.exact:
+                    continue
+                self.exact[term] = canonical
+                trigrams = _trigrams(term)
+                term_id = len(self.terms)
+                self.terms.append(term)
+                self.term_trigrams.append(len(trigrams))
+                for trigram in trigrams:
+                    self.postings[trigram].append(term_id)
+
+    def _term(self, text: str) -> str:
+        term = normalize_category(text)
+        if self.stopwords:
+            term = " ".join(word for word in term.split() if word not in self.stopwords)
+        return term
+
+    def lookup(self, text: str, fuzzy: bool = True):
+        term = self._term(text)
+        if not term:
+            return None
+        if term in self.exact or not fuzzy:
+            return self.exact.get(term)
+        # "АЗС и заправки", "кафе, рестораны": все части должны указывать на одну категорию.
+        # Нечёткий поиск по всей строке только без разделителей, иначе "такси, транспорт"
+        # совпадал бы с одной из частей
+        parts = [self._term(part) for part in split_compound(text)]
+        if len(parts) > 1:
+            found = {self.exact.get(part) or self._fuzzy(part) for part in parts}
+            return found.pop() if len(found) == 1 and None not in found else None
+        return self._fuzzy(term)
+
+    def _fuzzy(self, term: str):
+        trigrams = _trigrams(term)
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for term_id in self.postings.get(trigram, ()):
+                shared[term_id] += 1
+        scored = []
+        for term_id, count in shared.items():
+            similarity = 2 * count / (len(trigrams) + self.term_trigrams[term_id])
+            if similarity >= MIN_SIMILARITY:
+                scored.append((similarity, term_id))
+        scored.sort(reverse=True)
+        for similarity, term_id in scored[:MAX_CANDIDATES]:
+            candidate = self.terms[term_id]
+            if similarity >= ACCEPT_SIMILARITY and self.max_distance is None:
+                return self.exact[candidate]
+            limit = max(1, len(candidate) // 4)
+            if self.max_distance is not None:
+                limit = min(limit, self.max_distance)
+            if _levenshtein(term, candidate, limit) <= limit:
+                return self.exact[candidate]
+        return None
+
+# Индекс строится один раз при импорте по словарю синонимов и известным категориям
+_index = CategoryIndex({
+    **CATEGORY_SYNONYMS,
+    **{name: [] for name in [*DEFAULT_CATEGORIES, *CATEGORY_EMOJIS] if name not in CATEGORY_SYNONYMS}
+})
+
+# Тот же поиск для названий банков, распознанных на скриншоте. Слово "банк" есть почти в каждом
+# названии и при сравнении не учитывается, а опечатка допускается одна: иначе "МТС Банк" и
+# "ОТП Банк" оказывались ближе всего к "втб банк"
+_bank_index = CategoryIndex(BANK_SYNONYMS, stopwords={"банк", "bank"}, max_distance=1)
+
+# fuzzy=False — только точное название или синоним, без исправления опечаток
+@lru_cache(maxsize=1024)
+def find_bank(text: str, fuzzy: bool = True):
+    return _bank_index.lookup(text, fuzzy)
+
+@lru_cache(maxsize=4096)
+def find_category(text: str):
+    return _index.lookup(text)
+
+CACHE_HITS.set_function(lambda: find_category.cache_info().hits, "category_lookup")
+CACHE_MISSES.set_function(lambda: find_category.cache_info().misses, "category_lookup")
+CACHE_HITS.set_function(lambda: find_bank.cache_info().hits, "bank_lookup")
+CACHE_MISSES.set_function(lambda: find_bank.cache_info().misses, "bank_lookup")
+
+# Каноническое название категории; неизвестные категории возвращаются нормализованными.
+# Составное название из разных категорий приводится по частям: "такси и транспорт" и
+# "такси, транспорт" дают одно и то же "такси, транспорт"
+def canonicalize_category(text: str) -> str:
+    canonical = find_category(text)
+    if canonical:
+        return canonical
+    parts = split_compound(text)
+    if len(parts) > 1:
+        return ", ".join(dict.fromkeys(find_category(part) or normalize_category(part) for part in parts))
+    return normalize_category(text) or text.strip().lower()
+
+# Приведение распознанных категорий к каноническим; для совпавших оставляется больший процент
+def canonicalize_categories(categories):
+    merged = {}
+    for cat in categories:
+        name = canonicalize_category(cat.category)
+        if name not in merged or cat.amount > merged[name].amount:
+            merged[name] = CashbackCategory(category=name, amount=cat.amount)
+    return list(merged.values())
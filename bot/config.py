@@ -6,12 +6,211 @@ load_dotenv(find_dotenv())
 
 # Telegram
 TELEGRAM_TOKEN = os.environ["TELEGRAM_TOKEN"]
+# Адрес Bot API; переопределяется, например, для локальной заглушки в бенчмарках
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL")
+# Журнал обезличенных обновлений для воспроизведения нагрузки (benchmarks/replay.py)
+UPDATE_LOG_PATH = os.environ.get("UPDATE_LOG_PATH")
+UPDATE_LOG_SALT = os.environ.get("UPDATE_LOG_SALT")
 
 # GigaChat
 GIGACHAT_CREDENTIALS = os.environ["GIGACHAT_CREDENTIALS"]
 GIGACHAT_MODEL = "GigaChat-Max"
+# Модели по возрастанию точности и цены: скриншот сначала отправляется в первую, следующая
+# используется при пустом или сомнительном результате. Одна модель — без маршрутизации
+GIGACHAT_MODEL_TIERS = [
+    model.strip() for model in os.environ.get("GIGACHAT_MODEL_TIERS", f"GigaChat-Pro,{GIGACHAT_MODEL}").split(",")
+    if model.strip()
+] or [GIGACHAT_MODEL]
 GIGACHAT_TEMPERATURE = 0.1
 GIGACHAT_TIMEOUT = 6000
+GIGACHAT_BASE_URL = os.environ.get("GIGACHAT_BASE_URL")
+GIGACHAT_AUTH_URL = os.environ.get("GIGACHAT_AUTH_URL")
+# Цена за 1000 токенов, руб. (для оценки расходов в /usage)
+GIGACHAT_PRICES = {
+    "GigaChat": 0.2,
+    "GigaChat-Pro": 1.5,
+    "GigaChat-Max": 1.95,
+}
+# Дневной лимит токенов на пользователя; 0 — без ограничения. На администраторов не действует
+DAILY_TOKEN_BUDGET = int(os.environ.get("DAILY_TOKEN_BUDGET", "30000"))
+
+# Эндпоинт /metrics в формате Prometheus; без порта не запускается
+METRICS_PORT = int(os.environ["METRICS_PORT"]) if os.environ.get("METRICS_PORT") else None
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# Трассировка обновлений: спаны в JSON Lines и/или OTLP-коллектор (нужен opentelemetry-sdk)
+TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH")
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT")
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+
+# Администраторы бота (через запятую) и каталог отчётов /profile
+ADMIN_IDS = {int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()}
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_SECONDS = 300
+
+# Журнал: JSON Lines с ротацией и сжатием; одинаковые ошибки — не больше LOG_ERROR_BURST за LOG_ERROR_WINDOW секунд
+LOG_PATH = os.environ.get("LOG_PATH", "bot.log")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ERROR_BURST = 5
+LOG_ERROR_WINDOW = 60
+
+# Маршрутизация моделей: правдоподобные проценты, допустимая доля неизвестных категорий,
+# признаки сложного изображения (сразу старшая модель) и доля теневых проверок старшей моделью
+ROUTING_MIN_AMOUNT = 0.1
+ROUTING_MAX_AMOUNT = 50
+ROUTING_MAX_UNKNOWN_SHARE = 0.5
+ROUTING_COMPLEX_ASPECT = 3.5
+ROUTING_COMPLEX_EDGE_DENSITY = 0.2
+ROUTING_SHADOW_RATE = float(os.environ.get("ROUTING_SHADOW_RATE", "0.05"))
+# Теневые проверки идут в отдельном пуле; если все его потоки заняты, проверка пропускается
+ROUTING_SHADOW_WORKERS = 2
+
+# Локальный фильтр изображений: снимки с оценкой ниже порога не отправляются в GigaChat.
+# PREFILTER_MODEL_PATH — необязательный JSON с весами, обученными benchmarks/bench_prefilter.py
+PREFILTER_ENABLED = os.environ.get("PREFILTER_ENABLED", "1") == "1"
+PREFILTER_THRESHOLD = float(os.environ.get("PREFILTER_THRESHOLD", "0.15"))
+PREFILTER_MODEL_PATH = os.environ.get("PREFILTER_MODEL_PATH")
+
+# Потоки для распознавания скриншотов в фоне, пока пользователь выбирает банк
+RECOGNITION_WORKERS = 4
+
+# Минимальный интервал между правками статусного сообщения (лимиты Telegram на редактирование)
+STATUS_EDIT_INTERVAL = 1.5
+
+# Очередь исходящих сообщений: лимиты Bot API (около 30 сообщений в секунду на бота и одного
+# в секунду в чат, короткие всплески допускаются), потоки отправки и повторы после 429.
+# За любую секунду уходит не больше RATE + BURST сообщений
+OUTBOX_GLOBAL_RATE = float(os.environ.get("OUTBOX_GLOBAL_RATE", "25"))
+OUTBOX_GLOBAL_BURST = 5
+OUTBOX_CHAT_RATE = float(os.environ.get("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = 2
+OUTBOX_WORKERS = 4
+OUTBOX_MAX_RETRIES = 5
+
+# Пулы HTTP-соединений: одна сессия Telegram на все потоки и один клиент httpx на все модели GigaChat.
+# httpx по умолчанию закрывает простаивающие соединения через 5 с — между скриншотами этого мало
+TELEGRAM_POOL_SIZE = int(os.environ.get("TELEGRAM_POOL_SIZE", "16"))
+GIGACHAT_MAX_CONNECTIONS = int(os.environ.get("GIGACHAT_MAX_CONNECTIONS", "16"))
+GIGACHAT_KEEPALIVE_EXPIRY = float(os.environ.get("GIGACHAT_KEEPALIVE_EXPIRY", "120"))
+# HTTP/2 для GigaChat, если установлен пакет h2 (httpx[http2])
+GIGACHAT_HTTP2 = os.environ.get("GIGACHAT_HTTP2", "1") == "1"
+
+# Inline-режим (@bot азс): сколько секунд Telegram кэширует ответ пользователю, максимум результатов
+# и для скольких пользователей готовые ответы хранятся в памяти (давно не обращавшиеся вытесняются)
+INLINE_CACHE_TIME = 10
+INLINE_MAX_RESULTS = 50
+INLINE_CACHE_USERS = int(os.environ.get("INLINE_CACHE_USERS", "10000"))
+
+# Статистика по всем пользователям за месяц: период пересчёта, секунды, и минимум пользователей
+# с данными по категории, чтобы по ней можно было что-то показывать
+STATS_INTERVAL = int(os.environ.get("STATS_INTERVAL", "60"))
+STATS_MIN_USERS = 3
+
+# Напоминание в начале месяца выбрать категории: местное время отправки, часовой пояс по умолчанию,
+# разброс времени отправки по пользователям (секунды), сколько напоминаний в секунду отправлять
+# (0 — не отправлять) и пачками по сколько. Напоминают тем, кто вносил кэшбэк за последние
+# REMINDER_ACTIVE_MONTHS месяцев; пропущенные больше чем на REMINDER_MAX_LATE секунд не отправляются
+REMINDER_HOUR = 10
+REMINDER_TIMEZONE = os.environ.get("REMINDER_TIMEZONE", "Europe/Moscow")
+REMINDER_JITTER = 4 * 3600
+REMINDER_RATE = float(os.environ.get("REMINDER_RATE", "10"))
+REMINDER_BATCH = 50
+REMINDER_ACTIVE_MONTHS = 3
+REMINDER_MAX_LATE = 3 * 24 * 3600
+# Напоминания из базы загружаются в память на REMINDER_WINDOW секунд вперёд; пока в очереди
+# исходящих больше REMINDER_MAX_PENDING сообщений, новые пачки не отправляются
+REMINDER_WINDOW = 3600
+REMINDER_MAX_PENDING = 100
+
+# Подбор категорий (/optimize): сколько категорий в месяц можно выбрать в банке из предложенных
+# и сколько наборов банков перебирать точно при ограничении на число карт
+BANK_CATEGORY_PICKS = {
+    "Тинькофф": 4,
+    "Альфа-Банк": 3,
+    "Сбербанк": 5,
+    "ВТБ": 3,
+    "OZON": 3,
+    "Газпромбанк": 3,
+}
+OPTIMIZER_DEFAULT_PICKS = 3
+OPTIMIZER_MAX_SUBSETS = 20000
+# Траты в месяц по категориям, руб., если пользователь не указал свои
+OPTIMIZER_DEFAULT_SPEND = {
+    "продукты": 15000,
+    "супермаркеты": 10000,
+    "рестораны": 4000,
+    "кафе": 2000,
+    "фастфуд": 1500,
+    "доставка еды": 3000,
+    "азс": 5000,
+    "такси": 2500,
+    "транспорт": 2000,
+    "аптеки": 1500,
+    "одежда": 4000,
+    "маркетплейсы": 6000,
+    "связь": 800,
+    "жкх": 6000,
+    "развлечения": 2000,
+    "кино": 800,
+}
+
+# Импорт выписок (CSV, XLSX): строк в одном блоке, предел размера файла (Bot API отдаёт файлы
+# до 20 МБ) и за сколько последних месяцев выписки считаются средние траты для /optimize
+STATEMENT_EXTENSIONS = (".csv", ".xlsx")
+STATEMENT_CHUNK_ROWS = 20000
+STATEMENT_MAX_BYTES = 20 * 1024 * 1024
+STATEMENT_PROFILE_MONTHS = 3
+# Категории по MCC-коду операции
+MCC_CATEGORIES = {
+    "продукты": [5411, 5422, 5441, 5451, 5462, 5499],
+    "рестораны": [5812],
+    "кафе": [5813],
+    "фастфуд": [5814],
+    "азс": [5541, 5542, 5983],
+    "такси": [4121],
+    "транспорт": [4111, 4112, 4131],
+    "аптеки": [5912],
+    "медицина": [8011, 8021, 8031, 8041, 8042, 8043, 8049, 8050, 8062, 8071, 8099],
+    "одежда": [5611, 5621, 5631, 5641, 5651, 5661, 5691, 5699],
+    "техника": [5722, 5732, 5734],
+    "кино": [7832],
+    "развлечения": [7922, 7929, 7991, 7996],
+    "красота": [5977, 7230, 7298],
+    "связь": [4812, 4814],
+    "жкх": [4900],
+    "путешествия": [3000, 4411, 4511, 4722, 7011],
+    "дом и ремонт": [5200, 5211, 5231, 5251, 5712, 5719],
+    "спорт": [5655, 5940, 5941, 7997],
+    "животные": [5995, 742],
+    "цветы": [5992],
+    "образование": [8211, 8220, 8241, 8244, 8249, 8299],
+    "авто": [5511, 5531, 5533, 7531, 7538, 7542],
+}
+# Части названий магазинов в описании операции
+MERCHANT_KEYWORDS = {
+    "продукты": ["пятерочка", "pyaterochka", "магнит", "magnit", "перекресток", "perekrestok", "вкусвилл", "vkusvill", "дикси", "лента", "lenta", "ашан", "auchan"],
+    "азс": ["лукойл", "lukoil", "газпромнефть", "gazpromneft", "роснефть", "rosneft", "татнефть", "shell"],
+    "такси": ["yandex.taxi", "яндекс такси", "uber", "ситимобил"],
+    "фастфуд": ["вкусно и точка", "макдоналдс", "mcdonalds", "kfc", "бургер кинг", "burger king"],
+    "кафе": ["шоколадница", "кофе хауз", "starbucks", "cofix"],
+    "доставка еды": ["самокат", "samokat", "delivery club", "яндекс еда", "eda.yandex"],
+    "маркетплейсы": ["wildberries", "ozon", "озон", "яндекс маркет", "market.yandex", "aliexpress"],
+    "аптеки": ["аптека", "apteka", "ригла", "горздрав"],
+    "связь": ["мтс", "mts", "билайн", "beeline", "мегафон", "megafon", "tele2"],
+    "кино": ["киномакс", "синема парк", "cinema park", "формула кино"],
+}
+
+# Массовый ввод ставок (/import): расширения файлов, предел размера файла и строк за раз
+IMPORT_EXTENSIONS = (".csv", ".tsv", ".txt")
+IMPORT_MAX_BYTES = 256 * 1024
+IMPORT_MAX_ROWS = 500
+
+# Выгрузка истории (/export): строк в одном запросе к базе и уровень сжатия (у gzip по умолчанию 9 —
+# вдвое медленнее при почти том же размере)
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_COMPRESS_LEVEL = 6
 
 # Database
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///cashback.db")
@@ -31,12 +230,73 @@ CATEGORY_EMOJIS = {
     "аптеки": "💊",
     "азс": "⛽",
     "кино": "🎬",
-    "заправки": "⛽"
+    "фастфуд": "🍔",
+    "доставка еды": "🛵",
+    "транспорт": "🚇",
+    "авто": "🚗",
+    "красота": "💄",
+    "медицина": "🏥",
+    "маркетплейсы": "📦",
+    "путешествия": "✈️",
+    "развлечения": "🎭",
+    "спорт": "⚽",
+    "дом и ремонт": "🏠",
+    "животные": "🐾",
+    "цветы": "💐",
+    "связь": "📶",
+    "жкх": "💡",
+    "книги": "📖",
+    "игрушки": "🧸"
+}
+
+# Синонимы категорий: каноническое название -> варианты, которые встречаются
+# в ответах модели и при ручном вводе
+CATEGORY_SYNONYMS = {
+    "азс": ["заправки", "заправка", "автозаправки", "топливо", "бензин", "топливо и азс", "азс и заправки"],
+    "рестораны": ["ресторан", "кафе и рестораны", "рестораны и кафе"],
+    "кафе": ["кофейни", "кофе", "кафе и кофейни"],
+    "фастфуд": ["фаст фуд", "фаст-фуд", "фастфуды"],
+    "доставка еды": ["доставка", "доставка продуктов", "доставка еды и продуктов"],
+    "продукты": ["продуктовые магазины", "продукты питания"],
+    "супермаркеты": ["супермаркет", "гипермаркеты", "продуктовые супермаркеты"],
+    "одежда": ["одежда и обувь", "обувь"],
+    "образование": ["обучение", "курсы"],
+    "техника": ["электроника", "бытовая техника", "электроника и техника", "цифровая техника"],
+    "такси": ["каршеринг", "такси и каршеринг"],
+    "транспорт": ["общественный транспорт", "метро"],
+    "авто": ["автоуслуги", "автозапчасти", "автотовары"],
+    "аптеки": ["аптека", "лекарства"],
+    "медицина": ["медицинские услуги", "клиники", "медицинские центры"],
+    "красота": ["салоны красоты", "косметика", "красота и здоровье"],
+    "кино": ["кинотеатры", "кинотеатр"],
+    "развлечения": ["театры", "концерты", "культура и искусство"],
+    "путешествия": ["авиабилеты", "отели", "ж/д билеты", "туризм"],
+    "маркетплейсы": ["маркетплейс", "интернет-магазины"],
+    "спорт": ["спорттовары", "спортивные товары", "фитнес"],
+    "дом и ремонт": ["товары для дома", "ремонт", "строительство и ремонт"],
+    "животные": ["зоотовары", "товары для животных", "зоомагазины"],
+    "цветы": ["цветочные магазины"],
+    "связь": ["мобильная связь", "интернет и связь"],
+    "жкх": ["коммунальные услуги"],
+    "книги": ["книжные магазины", "книги и канцтовары"],
+    "игрушки": ["детские игрушки", "детские товары", "товары для детей"]
 }
 
 # Default categories
 DEFAULT_CATEGORIES = ["одежда", "продукты", "рестораны", "образование", "техника", "такси"]
 
+# Default banks
+DEFAULT_BANKS = ["Тинькофф", "Альфа-Банк", "Сбербанк", "ВТБ", "OZON", "Газпромбанк"]
+# Написания банков на скриншотах и в ответах модели
+BANK_SYNONYMS = {
+    "Тинькофф": ["т банк", "тбанк", "t bank", "tbank", "tinkoff", "тинькофф банк", "тинькоф"],
+    "Альфа-Банк": ["альфа", "альфабанк", "alfa bank", "alfa", "альфа банк"],
+    "Сбербанк": ["сбер", "sber", "sberbank", "сбер банк"],
+    "ВТБ": ["vtb", "втб банк", "банк втб"],
+    "OZON": ["озон", "ozon банк", "озон банк", "ozon bank"],
+    "Газпромбанк": ["гпб", "gazprombank", "газпром банк"],
+}
+
 # External links
 CARD_LINKS = {
     "Альфа банк": "https://alfa.me/xGH5KO",
@@ -1,53 +1,788 @@
 import sqlite3
-from datetime import datetime
+import threading
+import logging
+from datetime import datetime, timedelta
 from .config import DATABASE_PATH
+from .metrics import CACHE_HITS, CACHE_MISSES, DB_COMMITS, STAGE_SECONDS
+from .tracing import traced
+from .categories import canonicalize_category
+
+logger = logging.getLogger(__name__)
 
 # Инициализация базы данных
 conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
 cursor = conn.cursor()
 
-# Создание таблицы при первом запуске
-def init_db():
+# Соединение и курсор общие для всех потоков TeleBot
+_lock = threading.RLock()
+
+# Текущая версия схемы (хранится в PRAGMA user_version)
+SCHEMA_VERSION = 9
+
+# Служебный user_id для расхода токенов, который не запрашивал пользователь (теневые проверки
+# маршрутизатора): такой расход виден в сводке, но не входит в дневной лимит пользователя
+SYSTEM_USER_ID = 0
+
+# Кэш справочников: название -> id
+_bank_ids = {}
+_category_ids = {}
+
+# Индекс ставок для быстрого ответа «какой картой платить»:
+# user_id -> {каноническая категория: {банк: (период, процент)}}.
+# Пользователь загружается из cashback при первом запросе, дальше индекс обновляют функции записи
+_rates = {}
+_rates_lock = threading.Lock()
+
+# Подписчики на изменение кэшбэка пользователя (например, кэш inline-ответов)
+_change_listeners = []
+
+def _create_dictionaries():
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS banks (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    """)
     cursor.execute("""
-    CREATE TABLE IF NOT EXISTS cashback (
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    """)
+
+def _create_cashback_table(name="cashback"):
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {name} (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id INTEGER,
-        bank TEXT,
-        category TEXT,
+        bank_id INTEGER REFERENCES banks (id),
+        category_id INTEGER REFERENCES categories (id),
         amount REAL,
         input_type TEXT,
-        created_at TEXT
+        created_at TEXT,
+        period TEXT,
+        updated_at INTEGER NOT NULL DEFAULT 0
     )
     """)
-    conn.commit()
 
-def save_cashback(user_id, bank, category, amount, input_type="manual"):
-    cursor.execute(
-        "INSERT INTO cashback (user_id, bank, category, amount, input_type, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, bank, category, amount, input_type, datetime.now().strftime("%d.%m.%Y %H:%M"))
+# Расход токенов GigaChat по пользователям и дням (день — "%Y-%m-%d")
+def _create_usage_table():
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS llm_usage (
+        user_id INTEGER,
+        day TEXT,
+        model TEXT,
+        calls INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        precached_tokens INTEGER NOT NULL DEFAULT 0,
+        image_bytes INTEGER NOT NULL DEFAULT 0,
+        seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, model)
+    )
+    """)
+
+# Решения маршрутизатора моделей: первая модель, причина эскалации, итог и согласие моделей
+def _create_routing_table():
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS llm_routing (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT,
+        user_id INTEGER,
+        image_width INTEGER,
+        image_height INTEGER,
+        image_bytes INTEGER,
+        edge_density REAL,
+        complex INTEGER,
+        first_model TEXT,
+        first_seconds REAL,
+        first_count INTEGER,
+        reason TEXT,
+        final_model TEXT,
+        final_seconds REAL,
+        final_count INTEGER,
+        agreement REAL,
+        shadow INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+# Траты пользователя по категориям за месяц из импортированных выписок
+def _create_spending_table():
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS spending (
+        user_id INTEGER,
+        period TEXT,
+        category_id INTEGER REFERENCES categories (id),
+        amount REAL NOT NULL DEFAULT 0,
+        operations INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, period, category_id)
+    )
+    """)
+
+# Напоминания о выборе категорий: месяц, о котором напомнить, и время отправки (unix, UTC).
+# timezone NULL — часовой пояс по умолчанию
+def _create_reminders_table():
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reminders (
+        user_id INTEGER PRIMARY KEY,
+        timezone TEXT,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        period TEXT NOT NULL,
+        due_at INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_reminders_due
+    ON reminders (due_at) WHERE enabled=1
+    """)
+
+def _create_indexes():
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_cashback_unique
+    ON cashback (user_id, bank_id, category_id, period)
+    """)
+    _create_updated_index()
+    _create_history_index()
+
+# Изменения за период по возрастанию времени записи (для фонового пересчёта статистики)
+def _create_updated_index():
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_cashback_updated
+    ON cashback (period, updated_at)
+    """)
+
+# История пользователя по периодам; id в конце ключа индекса есть неявно (rowid), поэтому
+# выгрузка страницами по (period, id) не сортирует строки заново
+def _create_history_index():
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_cashback_history
+    ON cashback (user_id, period)
+    """)
+
+# Создание таблиц при первом запуске и миграция существующей базы.
+# Всё выполняется одной транзакцией, чтобы не оставить схему в промежуточном состоянии
+def init_db():
+    with _lock:
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='cashback'"
+        ).fetchone()
+        cursor.execute("BEGIN")
+        try:
+            if not exists:
+                _create_dictionaries()
+                _create_cashback_table()
+                _create_indexes()
+                _create_usage_table()
+                _create_routing_table()
+                _create_spending_table()
+                _create_reminders_table()
+            else:
+                if version < 1:
+                    _migrate_unique_period()
+                if version < 2:
+                    _migrate_dictionaries()
+                if version < 3:
+                    _create_usage_table()
+                if version < 4:
+                    _create_routing_table()
+                if version < 5:
+                    _migrate_updated_at()
+                if version < 6:
+                    _create_spending_table()
+                if version < 7:
+                    _create_history_index()
+                if version < 8:
+                    _create_reminders_table()
+                if version < 9:
+                    _migrate_canonical_categories()
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+            DB_COMMITS.inc("migrate")
+        except Exception:
+            conn.rollback()
+            raise
+
+# Миграция 1: период (месяц) у записи, удаление дублей и уникальный ключ
+def _migrate_unique_period():
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(cashback)")]
+    if "period" not in columns:
+        cursor.execute("ALTER TABLE cashback ADD COLUMN period TEXT")
+    # created_at хранится как "%d.%m.%Y %H:%M", период — "%Y-%m"
+    cursor.execute("""
+    UPDATE cashback
+    SET period = substr(created_at, 7, 4) || '-' || substr(created_at, 4, 2)
+    WHERE period IS NULL
+    """)
+    # Из дублей оставляем самую свежую запись
+    cursor.execute("""
+    DELETE FROM cashback
+    WHERE id NOT IN (
+        SELECT MAX(id) FROM cashback GROUP BY user_id, bank, category, period
+    )
+    """)
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_cashback_unique
+    ON cashback (user_id, bank, category, period)
+    """)
+
+# Миграция 2: банки и категории выносятся в справочники, cashback ссылается на них по id.
+# Таблица пересобирается внутри транзакции, старая остаётся доступной до commit
+def _migrate_dictionaries():
+    _create_dictionaries()
+    cursor.execute("""
+    INSERT OR IGNORE INTO banks (name)
+    SELECT DISTINCT bank FROM cashback WHERE bank IS NOT NULL
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO categories (name)
+    SELECT DISTINCT category FROM cashback WHERE category IS NOT NULL
+    """)
+    _create_cashback_table("cashback_new")
+    cursor.execute("""
+    INSERT INTO cashback_new (id, user_id, bank_id, category_id, amount, input_type, created_at, period)
+    SELECT c.id, c.user_id, b.id, k.id, c.amount, c.input_type, c.created_at, c.period
+    FROM cashback AS c
+    JOIN banks AS b ON b.name = c.bank
+    JOIN categories AS k ON k.name = c.category
+    """)
+    cursor.execute("DROP TABLE cashback")
+    cursor.execute("ALTER TABLE cashback_new RENAME TO cashback")
+    _create_indexes()
+
+# Миграция 5: время последней записи строки (мс с начала эпохи). У существующих строк — 0,
+# они попадают в первую полную загрузку статистики
+def _migrate_updated_at():
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(cashback)")]
+    if "updated_at" not in columns:
+        cursor.execute("ALTER TABLE cashback ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0")
+    _create_updated_index()
+
+# Миграция 9: категории приводятся к каноническим названиям ("заправки" -> "азс"). Строки
+# переводятся на id канонической категории; из дублей, которые при этом появляются, остаётся
+# самая свежая запись, траты из выписок складываются
+def _migrate_canonical_categories():
+    names = dict(cursor.execute("SELECT id, name FROM categories").fetchall())
+    mapping = []
+    for category_id, name in names.items():
+        canonical = canonicalize_category(name)
+        if canonical != name:
+            cursor.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (canonical,))
+            canonical_id = cursor.execute("SELECT id FROM categories WHERE name=?", (canonical,)).fetchone()[0]
+            mapping.append((category_id, canonical_id))
+    if not mapping:
+        return
+    cursor.execute("CREATE TEMP TABLE category_map (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+    cursor.executemany("INSERT INTO category_map (old_id, new_id) VALUES (?, ?)", mapping)
+    cursor.execute("""
+    DELETE FROM cashback
+    WHERE id NOT IN (
+        SELECT MAX(c.id) FROM cashback AS c
+        LEFT JOIN category_map AS m ON m.old_id = c.category_id
+        GROUP BY c.user_id, c.bank_id, COALESCE(m.new_id, c.category_id), c.period
     )
-    conn.commit()
+    """)
+    cursor.execute("""
+    UPDATE cashback SET category_id = (SELECT new_id FROM category_map WHERE old_id = cashback.category_id)
+    WHERE category_id IN (SELECT old_id FROM category_map)
+    """)
+    cursor.execute("""
+    INSERT INTO spending (user_id, period, category_id, amount, operations)
+    SELECT s.user_id, s.period, m.new_id, SUM(s.amount), SUM(s.operations)
+    FROM spending AS s JOIN category_map AS m ON m.old_id = s.category_id
+    GROUP BY s.user_id, s.period, m.new_id
+    ON CONFLICT (user_id, period, category_id) DO UPDATE SET
+        amount = amount + excluded.amount,
+        operations = operations + excluded.operations
+    """)
+    cursor.execute("DELETE FROM spending WHERE category_id IN (SELECT old_id FROM category_map)")
+    cursor.execute("DROP TABLE category_map")
+    logger.info("Категории приведены к каноническим: %d названий", len(mapping))
+
+# Получение id из справочника; при create=True отсутствующее значение добавляется
+def _intern(table, cache, name, create=True):
+    value_id = cache.get(name)
+    if value_id is not None:
+        CACHE_HITS.inc(table)
+        return value_id
+    CACHE_MISSES.inc(table)
+    if create:
+        cursor.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+    row = cursor.execute(f"SELECT id FROM {table} WHERE name=?", (name,)).fetchone()
+    if row is None:
+        return None
+    cache[name] = row[0]
+    return row[0]
 
+def get_bank_id(bank, create=True):
+    with _lock:
+        return _intern("banks", _bank_ids, bank, create)
+
+def get_category_id(category, create=True):
+    with _lock:
+        return _intern("categories", _category_ids, category, create)
+
+@traced("db.save_cashback")
+def save_cashback(user_id, bank, category, amount, input_type="manual"):
+    now = datetime.now()
+    with _lock, STAGE_SECONDS.time("db_write"):
+        bank_id = _intern("banks", _bank_ids, bank)
+        category_id = _intern("categories", _category_ids, category)
+        cursor.execute(
+            """
+            INSERT INTO cashback (user_id, bank_id, category_id, amount, input_type, created_at, period, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, bank_id, category_id, period) DO UPDATE SET
+                amount = excluded.amount,
+                input_type = excluded.input_type,
+                created_at = excluded.created_at,
+                updated_at = excluded.updated_at
+            """,
+            (user_id, bank_id, category_id, amount, input_type, now.strftime("%d.%m.%Y %H:%M"), now.strftime("%Y-%m"),
+             int(now.timestamp() * 1000))
+        )
+        conn.commit()
+        DB_COMMITS.inc("save")
+        _update_rate(user_id, bank, category, now.strftime("%Y-%m"), amount)
+    _cashback_changed(user_id)
+
+# Массовая запись ставок [(банк, категория, процент)] за текущий месяц одной транзакцией:
+# справочники, затем один executemany с той же заменой, что у save_cashback
+@traced("db.save_cashback_many")
+def save_cashback_many(user_id, rates, input_type="import"):
+    now = datetime.now()
+    period = now.strftime("%Y-%m")
+    created_at = now.strftime("%d.%m.%Y %H:%M")
+    updated_at = int(now.timestamp() * 1000)
+    with _lock, STAGE_SECONDS.time("db_write"):
+        try:
+            rows = [
+                (user_id, _intern("banks", _bank_ids, bank), _intern("categories", _category_ids, category),
+                 amount, input_type, created_at, period, updated_at)
+                for bank, category, amount in rates
+            ]
+            cursor.executemany(
+                """
+                INSERT INTO cashback (user_id, bank_id, category_id, amount, input_type, created_at, period, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, bank_id, category_id, period) DO UPDATE SET
+                    amount = excluded.amount,
+                    input_type = excluded.input_type,
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at
+                """,
+                rows
+            )
+            conn.commit()
+        except Exception:
+            # Вместе с транзакцией откатываются и новые строки справочников, их id нельзя оставлять в кэше
+            conn.rollback()
+            _bank_ids.clear()
+            _category_ids.clear()
+            raise
+        DB_COMMITS.inc("import")
+        with _rates_lock:
+            user_rates = _rates.get(user_id)
+            if user_rates is not None:
+                for bank, category, amount in rates:
+                    _put_rate(user_rates, bank, category, period, amount)
+    _cashback_changed(user_id)
+    return len(rows)
+
+@traced("db.get_user_categories")
 def get_user_categories(user_id):
-    cursor.execute("SELECT DISTINCT category FROM cashback WHERE user_id=?", (user_id,))
-    return [row[0] for row in cursor.fetchall()]
+    with _lock:
+        cursor.execute("""
+        SELECT name FROM categories
+        WHERE id IN (SELECT DISTINCT category_id FROM cashback WHERE user_id=?)
+        """, (user_id,))
+        return [row[0] for row in cursor.fetchall()]
 
+@traced("db.get_user_banks")
 def get_user_banks(user_id):
-    cursor.execute("SELECT DISTINCT bank FROM cashback WHERE user_id=?", (user_id,))
-    banks = [row[0] for row in cursor.fetchall() if row[0] != "Не выбран"]
-    return banks
+    with _lock:
+        cursor.execute("""
+        SELECT name FROM banks
+        WHERE id IN (SELECT DISTINCT bank_id FROM cashback WHERE user_id=?)
+        """, (user_id,))
+        banks = [row[0] for row in cursor.fetchall() if row[0] != "Не выбран"]
+        return banks
 
+# Для каждой пары банк/категория берётся значение за последний период: (банк, категория, процент,
+# период). Запись без периода (старые записи и импорт без даты) попадает в сводку, только если у
+# пары нет датированных: NULL при сортировке по убыванию идёт последним
+@traced("db.get_summary")
 def get_summary(user_id):
-    cursor.execute("SELECT bank, category, amount FROM cashback WHERE user_id=?", (user_id,))
-    return cursor.fetchall()
+    with _lock, STAGE_SECONDS.time("db_read"):
+        cursor.execute("""
+        SELECT b.name, k.name, c.amount, c.period FROM cashback AS c
+        JOIN banks AS b ON b.id = c.bank_id
+        JOIN categories AS k ON k.id = c.category_id
+        WHERE c.user_id=? AND c.id = (
+            SELECT id FROM cashback
+            WHERE user_id=c.user_id AND bank_id=c.bank_id AND category_id=c.category_id
+            ORDER BY period DESC, id DESC LIMIT 1
+        )
+        """, (user_id,))
+        return cursor.fetchall()
 
+@traced("db.reset_data_for_bank")
 def reset_data_for_bank(user_id, bank):
-    cursor.execute("DELETE FROM cashback WHERE user_id=? AND bank=?", (user_id, bank))
-    conn.commit()
+    with _lock:
+        bank_id = _intern("banks", _bank_ids, bank, create=False)
+        if bank_id is None:
+            return
+        cursor.execute("DELETE FROM cashback WHERE user_id=? AND bank_id=?", (user_id, bank_id))
+        conn.commit()
+        DB_COMMITS.inc("reset_bank")
+        with _rates_lock:
+            for banks in _rates.get(user_id, {}).values():
+                banks.pop(bank, None)
+    _cashback_changed(user_id)
 
+@traced("db.reset_all_data")
 def reset_all_data(user_id):
-    cursor.execute("DELETE FROM cashback WHERE user_id=?", (user_id,))
-    conn.commit()
+    with _lock:
+        cursor.execute("DELETE FROM cashback WHERE user_id=?", (user_id,))
+        cursor.execute("DELETE FROM spending WHERE user_id=?", (user_id,))
+        conn.commit()
+        DB_COMMITS.inc("reset_all")
+        with _rates_lock:
+            if user_id in _rates:
+                _rates[user_id] = {}
+    _cashback_changed(user_id)
+
+def add_change_listener(listener):
+    _change_listeners.append(listener)
+
+def _cashback_changed(user_id):
+    for listener in _change_listeners:
+        try:
+            listener(user_id)
+        except Exception as e:
+            logger.warning("Ошибка обработчика изменения данных: %s", e)
+
+# Ставка в индексе заменяется значением за более поздний период. В пределах периода запись
+# заменяет прежнее значение, а при загрузке из базы из нескольких написаний категории берётся больший процент
+def _put_rate(rates, bank, category, period, amount, replace=True):
+    banks = rates.setdefault(canonicalize_category(category), {})
+    current = banks.get(bank)
+    if current is None or period > current[0] or (period == current[0] and (replace or amount > current[1])):
+        banks[bank] = (period, amount)
+
+def _update_rate(user_id, bank, category, period, amount):
+    with _rates_lock:
+        rates = _rates.get(user_id)
+        if rates is not None:
+            _put_rate(rates, bank, category, period, amount)
+
+def _load_rates(user_id):
+    with _lock, STAGE_SECONDS.time("db_read"):
+        with _rates_lock:
+            if user_id in _rates:
+                return _rates[user_id]
+        # Последний период по каждой паре банк/категория; amount берётся из строки с MAX(period)
+        # (поведение SQLite для столбцов вне агрегата), группировка идёт по уникальному индексу
+        rows = cursor.execute("""
+        SELECT b.name, k.name, r.period, r.amount FROM (
+            SELECT bank_id, category_id, MAX(period) AS period, amount FROM cashback
+            WHERE user_id=? GROUP BY bank_id, category_id
+        ) AS r
+        JOIN banks AS b ON b.id = r.bank_id
+        JOIN categories AS k ON k.id = r.category_id
+        """, (user_id,)).fetchall()
+        rates = {}
+        for bank, category, period, amount in rows:
+            _put_rate(rates, bank, category, period or "", amount, replace=False)
+        with _rates_lock:
+            _rates[user_id] = rates
+        return rates
+
+def _top(banks, limit):
+    banks = sorted(banks.items(), key=lambda item: item[1][1], reverse=True)
+    return [(bank, amount) for bank, (period, amount) in banks[:limit]]
+
+def _user_rates(user_id):
+    with _rates_lock:
+        rates = _rates.get(user_id)
+    if rates is None:
+        CACHE_MISSES.inc("best_rates")
+        return _load_rates(user_id)
+    CACHE_HITS.inc("best_rates")
+    return rates
+
+# Банки с кэшбэком в категории по убыванию процента (последний период для каждого банка)
+@traced("db.get_best")
+def get_best(user_id, category, limit=3):
+    rates = _user_rates(user_id)
+    with _rates_lock:
+        return _top(rates.get(category, {}), limit)
+
+# То же для всех категорий пользователя: {категория: [(банк, процент), ...]}
+@traced("db.get_all_best")
+def get_all_best(user_id, limit=3):
+    rates = _user_rates(user_id)
+    with _rates_lock:
+        return {category: _top(banks, limit) for category, banks in rates.items() if banks}
+
+# Последние проценты пользователя во всех банках: {категория: {банк: процент}}
+@traced("db.get_user_rates")
+def get_user_rates(user_id):
+    rates = _user_rates(user_id)
+    with _rates_lock:
+        return {
+            category: {bank: amount for bank, (period, amount) in banks.items()}
+            for category, banks in rates.items() if banks
+        }
+
+@traced("db.record_llm_usage")
+def record_llm_usage(user_id, model, prompt_tokens, completion_tokens, precached_tokens=0, image_bytes=0, seconds=0.0):
+    day = datetime.now().strftime("%Y-%m-%d")
+    with _lock, STAGE_SECONDS.time("db_write"):
+        cursor.execute(
+            """
+            INSERT INTO llm_usage (user_id, day, model, calls, prompt_tokens, completion_tokens, precached_tokens, image_bytes, seconds)
+            VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, day, model) DO UPDATE SET
+                calls = calls + 1,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                completion_tokens = completion_tokens + excluded.completion_tokens,
+                precached_tokens = precached_tokens + excluded.precached_tokens,
+                image_bytes = image_bytes + excluded.image_bytes,
+                seconds = seconds + excluded.seconds
+            """,
+            (user_id, day, model, prompt_tokens, completion_tokens, precached_tokens, image_bytes, seconds)
+        )
+        conn.commit()
+        DB_COMMITS.inc("llm_usage")
+
+@traced("db.record_routing")
+def record_routing(user_id, features, first, final, reason, agreement=None, shadow=False):
+    with _lock, STAGE_SECONDS.time("db_write"):
+        cursor.execute(
+            """
+            INSERT INTO llm_routing (
+                created_at, user_id, image_width, image_height, image_bytes, edge_density, complex,
+                first_model, first_seconds, first_count, reason, final_model, final_seconds, final_count,
+                agreement, shadow
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                datetime.now().isoformat(timespec="seconds"), user_id,
+                features.get("width"), features.get("height"), features.get("bytes"),
+                features.get("edge_density"), int(bool(features.get("complex"))),
+                first[0], first[2], len(first[1]), reason, final[0], final[2], len(final[1]),
+                agreement, int(shadow)
+            )
+        )
+        conn.commit()
+        DB_COMMITS.inc("llm_routing")
+
+# Токены пользователя за сегодня по всем моделям (для дневного лимита)
+def get_user_tokens_today(user_id):
+    day = datetime.now().strftime("%Y-%m-%d")
+    with _lock:
+        cursor.execute(
+            "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM llm_usage WHERE user_id=? AND day=?",
+            (user_id, day)
+        )
+        return cursor.fetchone()[0]
+
+# Расход за последние days дней по дням и моделям
+def get_usage_summary(days=7):
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    with _lock:
+        cursor.execute("""
+        SELECT day, model, COUNT(DISTINCT NULLIF(user_id, ?)), SUM(calls), SUM(prompt_tokens), SUM(completion_tokens),
+               SUM(precached_tokens), SUM(image_bytes), SUM(seconds)
+        FROM llm_usage WHERE day >= ?
+        GROUP BY day, model ORDER BY day DESC, model
+        """, (SYSTEM_USER_ID, since))
+        return cursor.fetchall()
+
+def get_top_usage_users(days=7, limit=10):
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    with _lock:
+        cursor.execute("""
+        SELECT user_id, SUM(calls), SUM(prompt_tokens + completion_tokens) AS tokens
+        FROM llm_usage WHERE day >= ? AND user_id != ?
+        GROUP BY user_id ORDER BY tokens DESC LIMIT ?
+        """, (since, SYSTEM_USER_ID, limit))
+        return cursor.fetchall()
+
+# Строки периода, записанные начиная с since (мс): приращение для фонового пересчёта статистики
+def get_period_changes(period, since=0):
+    with _lock, STAGE_SECONDS.time("db_read"):
+        cursor.execute("""
+        SELECT id, user_id, bank_id, category_id, amount, updated_at FROM cashback
+        WHERE period=? AND updated_at >= ?
+        """, (period, since))
+        return cursor.fetchall()
+
+# Все строки периода у заданных пользователей (после удалений, которые не видны по updated_at)
+def get_users_period_rows(user_ids, period):
+    user_ids = list(user_ids)
+    with _lock, STAGE_SECONDS.time("db_read"):
+        cursor.execute(f"""
+        SELECT id, user_id, bank_id, category_id, amount, updated_at FROM cashback
+        WHERE period=? AND user_id IN ({",".join("?" * len(user_ids))})
+        """, (period, *user_ids))
+        return cursor.fetchall()
+
+# Вся история кэшбэка пользователя блоками по chunk_rows строк: (период, банк, категория, процент,
+# способ ввода, дата записи). Каждый блок — отдельный запрос с продолжением после последней строки
+# предыдущего, поэтому блокировка общего соединения не держится, пока блок записывается в файл.
+# Строки без периода (старые записи с пустой датой) идут первыми: сравнение (period, id) > (?, ?)
+# их не выбирает, а COALESCE в ключе не дал бы использовать индекс
+def iter_cashback_history(user_id, chunk_rows=5000):
+    select = """
+    SELECT c.period, c.id, b.name, k.name, c.amount, c.input_type, c.created_at FROM cashback AS c
+    JOIN banks AS b ON b.id = c.bank_id
+    JOIN categories AS k ON k.id = c.category_id
+    """
+    pages = [
+        (select + "WHERE c.user_id=? AND c.period IS NULL AND c.id > ? ORDER BY c.id LIMIT ?", lambda row: row[1:2], (0,)),
+        (select + "WHERE c.user_id=? AND (c.period, c.id) > (?, ?) ORDER BY c.period, c.id LIMIT ?",
+         lambda row: row[:2], ("", 0)),
+    ]
+    for query, key, last in pages:
+        while True:
+            with _lock, STAGE_SECONDS.time("db_read"):
+                rows = cursor.execute(query, (user_id, *last, chunk_rows)).fetchall()
+            if rows:
+                last = key(rows[-1])
+                yield [(period, *row) for period, _, *row in rows]
+            if len(rows) < chunk_rows:
+                break
+
+# Траты из выписки: totals — {(период, категория): (сумма, число операций)}.
+# Месяцы, которые есть в выписке, заменяются целиком, поэтому повторный импорт не удваивает траты
+@traced("db.replace_spending")
+def replace_spending(user_id, totals):
+    periods = sorted({period for period, _ in totals})
+    with _lock, STAGE_SECONDS.time("db_write"):
+        rows = [
+            (user_id, period, _intern("categories", _category_ids, category), amount, operations)
+            for (period, category), (amount, operations) in totals.items()
+        ]
+        cursor.execute(
+            f"DELETE FROM spending WHERE user_id=? AND period IN ({','.join('?' * len(periods))})",
+            (user_id, *periods)
+        )
+        cursor.executemany(
+            "INSERT INTO spending (user_id, period, category_id, amount, operations) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        conn.commit()
+        DB_COMMITS.inc("spending")
+
+# Средние траты в месяц по категориям за последние months месяцев с выписками: {категория: рублей}
+@traced("db.get_spending_profile")
+def get_spending_profile(user_id, months=3):
+    with _lock, STAGE_SECONDS.time("db_read"):
+        periods = [row[0] for row in cursor.execute(
+            "SELECT DISTINCT period FROM spending WHERE user_id=? ORDER BY period DESC LIMIT ?", (user_id, months)
+        )]
+        if not periods:
+            return {}
+        cursor.execute(f"""
+        SELECT k.name, SUM(s.amount) FROM spending AS s
+        JOIN categories AS k ON k.id = s.category_id
+        WHERE s.user_id=? AND s.period IN ({",".join("?" * len(periods))})
+        GROUP BY k.name
+        """, (user_id, *periods))
+        return {category: amount / len(periods) for category, amount in cursor.fetchall()}
+
+# Пользователи с записями кэшбэка, которым ещё не назначено напоминание
+def get_unscheduled_users():
+    with _lock:
+        return [row[0] for row in cursor.execute("""
+        SELECT DISTINCT user_id FROM cashback
+        WHERE user_id NOT IN (SELECT user_id FROM reminders)
+        """)]
+
+def get_reminder_users():
+    with _lock:
+        return {row[0] for row in cursor.execute("SELECT user_id FROM reminders")}
+
+# rows — (user_id, timezone, период, due_at); уже назначенные напоминания не меняются
+def add_reminders(rows):
+    with _lock, STAGE_SECONDS.time("db_write"):
+        cursor.executemany(
+            "INSERT OR IGNORE INTO reminders (user_id, timezone, period, due_at) VALUES (?, ?, ?, ?)", rows
+        )
+        conn.commit()
+        DB_COMMITS.inc("reminders")
+
+# (timezone, enabled, период, due_at) или None
+def get_reminder(user_id):
+    with _lock:
+        return cursor.execute(
+            "SELECT timezone, enabled, period, due_at FROM reminders WHERE user_id=?", (user_id,)
+        ).fetchone()
+
+def set_reminder(user_id, timezone, enabled, period, due_at):
+    with _lock, STAGE_SECONDS.time("db_write"):
+        cursor.execute("""
+        INSERT INTO reminders (user_id, timezone, enabled, period, due_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            timezone=excluded.timezone, enabled=excluded.enabled, period=excluded.period, due_at=excluded.due_at
+        """, (user_id, timezone, int(enabled), period, due_at))
+        conn.commit()
+        DB_COMMITS.inc("reminders")
+
+# Включённые напоминания со временем отправки в [since, until): (due_at, user_id, timezone, период)
+def get_due_reminders(since, until):
+    with _lock, STAGE_SECONDS.time("db_read"):
+        return cursor.execute("""
+        SELECT due_at, user_id, timezone, period FROM reminders
+        WHERE enabled=1 AND due_at >= ? AND due_at < ?
+        """, (since, until)).fetchall()
+
+# Перенос напоминаний на следующий месяц перед отправкой: claims — (user_id, период, due_at,
+# следующий период, следующий due_at). Строка меняется, только если в ней всё ещё тот же период
+# и due_at, поэтому после перезапуска или повторной загрузки напоминание не уходит дважды.
+# Возвращает user_id перенесённых
+def claim_reminders(claims):
+    claimed = []
+    with _lock, STAGE_SECONDS.time("db_write"):
+        try:
+            for user_id, period, due_at, next_period, next_due in claims:
+                cursor.execute(
+                    "UPDATE reminders SET period=?, due_at=? WHERE user_id=? AND period=? AND due_at=? AND enabled=1",
+                    (next_period, next_due, user_id, period, due_at)
+                )
+                if cursor.rowcount:
+                    claimed.append(user_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        DB_COMMITS.inc("reminders")
+    return claimed
+
+def disable_reminder(user_id):
+    with _lock:
+        cursor.execute("UPDATE reminders SET enabled=0 WHERE user_id=?", (user_id,))
+        conn.commit()
+        DB_COMMITS.inc("reminders")
+
+# Кто из user_ids вносил кэшбэк за периоды начиная с since
+def get_active_users(user_ids, since):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+    with _lock, STAGE_SECONDS.time("db_read"):
+        return {row[0] for row in cursor.execute(
+            f"SELECT DISTINCT user_id FROM cashback WHERE user_id IN ({','.join('?' * len(user_ids))}) AND period >= ?",
+            (*user_ids, since)
+        )}
+
+# Справочник целиком: id -> название
+def get_names(table):
+    with _lock:
+        return dict(cursor.execute(f"SELECT id, name FROM {table}").fetchall())
 
 # Инициализация при импорте
-init_db() 
\ No newline at end of file
+init_db()
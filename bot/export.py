@@ -0,0 +1,123 @@
+import csv
+import gzip
+import io
+import os
+import time
+import logging
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+from .config import EXPORT_CHUNK_ROWS, EXPORT_COMPRESS_LEVEL
+from .database import iter_cashback_history
+from .metrics import STAGE_SECONDS, EXPORT_ROWS
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ["Период", "Банк", "Категория", "Процент", "Способ ввода", "Добавлено"]
+# Столбец с процентом пишется числом, остальные — строками
+AMOUNT_COLUMN = 3
+
+def _write_csv(chunks, path):
+    # BOM и ";" — чтобы файл открывался в Excel с русской локалью без мастера импорта.
+    # Блок собирается в строку и кодируется целиком: TextIOWrapper кодирует каждую строку отдельно
+    with gzip.open(path, "wb", compresslevel=EXPORT_COMPRESS_LEVEL) as f:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=";")
+        writer.writerow(EXPORT_COLUMNS)
+        f.write(("\ufeff" + buffer.getvalue()).encode())
+        for rows in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                [*row[:AMOUNT_COLUMN], f"{row[AMOUNT_COLUMN]:g}".replace(".", ","), *row[AMOUNT_COLUMN + 1:]]
+                for row in rows
+            )
+            f.write(buffer.getvalue().encode())
+            yield len(rows)
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Кэшбэк" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+def _xlsx_row(values):
+    cells = []
+    for i, value in enumerate(values):
+        if i == AMOUNT_COLUMN and isinstance(value, (int, float)):
+            cells.append(f"<c><v>{value!r}</v></c>")
+        else:
+            text = escape("" if value is None else str(value))
+            cells.append(f'<c t="inlineStr"><is><t>{text}</t></is></c>')
+    return "<row>" + "".join(cells) + "</row>"
+
+# Лист пишется прямо в поток архива (строки inlineStr, без общей таблицы строк): XLSX — тот же
+# zip, сжатие идёт по мере записи. openpyxl в режиме write_only сначала пишет лист во временный файл
+def _write_xlsx(chunks, path):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=EXPORT_COMPRESS_LEVEL) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as f:
+            f.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            f.write(_xlsx_row(EXPORT_COLUMNS).encode())
+            for rows in chunks:
+                f.write("".join(_xlsx_row(row) for row in rows).encode())
+                yield len(rows)
+            f.write(b"</sheetData></worksheet>")
+
+EXPORT_FORMATS = {"csv": (".csv.gz", _write_csv), "xlsx": (".xlsx", _write_xlsx)}
+
+# Выгрузка истории кэшбэка пользователя во временный файл: история читается блоками и сразу
+# пишется в сжатый файл, в памяти один блок строк и буфер компрессора, сколько бы записей ни было.
+# Возвращает путь и число строк; файл удаляет вызывающий
+def export_history(user_id, fmt="csv", chunk_rows=EXPORT_CHUNK_ROWS):
+    suffix, write = EXPORT_FORMATS[fmt]
+    started = time.perf_counter()
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="cashback-export-")
+    os.close(fd)
+    rows = 0
+    try:
+        with STAGE_SECONDS.time("export"):
+            for count in write(iter_cashback_history(user_id, chunk_rows), path):
+                rows += count
+    except Exception:
+        os.unlink(path)
+        raise
+    EXPORT_ROWS.inc(fmt, amount=rows)
+    logger.info(
+        "Выгрузка %s: %d строк, %.1f КБ за %.2f с",
+        fmt, rows, os.path.getsize(path) / 1024, time.perf_counter() - started
+    )
+    return path, rows
@@ -1,30 +1,66 @@
 import os
 import tempfile
 import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from telebot import TeleBot
 from telebot import types
 
-from .config import CARD_LINKS
-from .database import save_cashback, reset_data_for_bank, reset_all_data
+from .config import (
+    CARD_LINKS, ADMIN_IDS, PROFILE_DIR, PROFILE_MAX_SECONDS, DAILY_TOKEN_BUDGET, RECOGNITION_WORKERS, INLINE_CACHE_TIME,
+    STATEMENT_EXTENSIONS, STATEMENT_MAX_BYTES, IMPORT_EXTENSIONS, IMPORT_MAX_BYTES, IMPORT_MAX_ROWS
+)
+from .database import save_cashback, save_cashback_many, reset_data_for_bank, reset_all_data, get_user_tokens_today
 from .api import analyze_image
+from .image_filter import check_image
+from .inline import inline_results
+from .outbox import Outbox
+from .statements import StatementError, import_statement
+from .export import EXPORT_FORMATS, export_history
+from .reminders import reminder_scheduler, valid_timezone
+from .categories import canonicalize_category, find_bank, find_category
+from .text_parser import parse_offer_text, parse_spend_text, parse_rates_text
 from .keyboards import (
     main_menu_keyboard, add_info_keyboard, input_method_keyboard,
     bank_keyboard, category_keyboard, reset_confirm_keyboard,
-    full_reset_confirm_keyboard, add_more_keyboard, screenshot_confirm_keyboard
+    full_reset_confirm_keyboard, add_more_keyboard, screenshot_confirm_keyboard,
+    force_recognize_keyboard
 )
-from .utils import format_summary, save_temp_file, delete_temp_file
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from .utils import (
+    format_summary, format_usage, format_best, format_offers, format_optimization, format_statement_report,
+    format_import_report, format_reminder,
+    save_temp_file, download_temp_file, delete_temp_file, ProgressMessage
 )
+from .metrics import ACTIVE_SESSIONS, EMPTY_PARSES, RECOGNITIONS, STAGE_SECONDS
+from .profiler import start_profiling
+
 logger = logging.getLogger(__name__)
 
 # Глобальная сессия для хранения промежуточных данных пользователя
 sessions = {}
+# Распознавание скриншотов идёт в отдельном пуле, чтобы поток TeleBot сразу освобождался
+_recognition_pool = ThreadPoolExecutor(max_workers=RECOGNITION_WORKERS, thread_name_prefix="recognition")
+ACTIVE_SESSIONS.set_function(lambda: len(sessions))
 
 def register_handlers(bot: TeleBot):
+    # Ответы идут через очередь исходящих: обработчик не ждёт сети и не упирается в лимиты Telegram
+    outbox = bot.outbox = Outbox(bot)
+    
+    # Показ распознанных категорий: подтверждение, если банк уже выбран, иначе выбор банка
+    def show_recognized(message, categories, detected_bank=None):
+        user_id = message.from_user.id
+        sessions.setdefault(user_id, {})["screenshot"] = categories
+        
+        response = "✅ Распознанные категории:\n\n"
+        for cat in categories:
+            response += f"▪️ {cat.category.capitalize()}: {int(cat.amount)}%\n"
+        if detected_bank:
+            response += f"\n🏦 Банк: {detected_bank} (определён по скриншоту, можно выбрать другой кнопкой выше)\n"
+        
+        if "bank" in sessions[user_id]:
+            outbox.reply_to(message, response, reply_markup=screenshot_confirm_keyboard())
+        else:
+            outbox.reply_to(message, f"{response}\nВыберите банк:", reply_markup=bank_keyboard(user_id))
     
     # Обработчик команды /start
     @bot.message_handler(commands=["start"])
@@ -35,7 +71,7 @@ def register_handlers(bot: TeleBot):
             "Я помогу вам отслеживать лучшие предложения и сохранять информацию о кешбэке.\n"
             "Выберите, что хотите сделать:"
         )
-        bot.reply_to(message, welcome_text, reply_markup=main_menu_keyboard())
+        outbox.reply_to(message, welcome_text, reply_markup=main_menu_keyboard())
 
     # Обработчик команды /offer
     @bot.message_handler(commands=["offer"])
@@ -43,7 +79,121 @@ def register_handlers(bot: TeleBot):
         links_text = "💳 Оформление карт:\n"
         for bank, link in CARD_LINKS.items():
             links_text += f"{bank}: {link}\n"
-        bot.reply_to(message, links_text, reply_markup=main_menu_keyboard())
+        outbox.reply_to(message, links_text, reply_markup=main_menu_keyboard())
+    
+    # Профилирование работающего бота: /profile N — стеки всех потоков за N секунд, /profile N mem — снимки tracemalloc
+    @bot.message_handler(commands=["profile"], func=lambda m: m.from_user.id in ADMIN_IDS)
+    def command_profile(message):
+        args = message.text.split()[1:]
+        try:
+            seconds = int(args[0]) if args else 30
+        except ValueError:
+            outbox.reply_to(message, "Использование: /profile <секунды> [mem]")
+            return
+        seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+        mode = "mem" if "mem" in args[1:] else "cpu"
+        
+        def on_done(path, error):
+            if error:
+                outbox.send_message(message.chat.id, f"❌ Ошибка профилирования: {error}")
+            else:
+                outbox.send_message(message.chat.id, f"✅ Отчёт сохранён: {path}")
+        
+        if start_profiling(seconds, mode, PROFILE_DIR, on_done):
+            outbox.reply_to(message, f"⏳ Профилирование ({mode}) на {seconds} с запущено")
+        else:
+            outbox.reply_to(message, "Профилирование уже идёт")
+    
+    # Расход токенов GigaChat за последние N дней: /usage 7
+    @bot.message_handler(commands=["usage"], func=lambda m: m.from_user.id in ADMIN_IDS)
+    def command_usage(message):
+        args = message.text.split()[1:]
+        days = int(args[0]) if args and args[0].isdigit() else 7
+        outbox.reply_to(message, format_usage(max(1, min(days, 90))))
+    
+    # Какой картой платить в категории: /best аптеки
+    @bot.message_handler(commands=["best"])
+    def command_best(message):
+        query = message.text.partition(" ")[2].strip()
+        if not query:
+            outbox.reply_to(message, "Укажите категорию: /best аптеки")
+            return
+        outbox.reply_to(message, format_best(message.from_user.id, canonicalize_category(query)))
+    
+    # Какие категории выбрать в банках под свои траты: /optimize продукты 20000, кафе 5000, карт 2
+    @bot.message_handler(commands=["optimize"])
+    def command_optimize(message):
+        spend, max_cards = parse_spend_text(message.text.partition(" ")[2])
+        outbox.reply_to(message, format_optimization(message.from_user.id, spend, max_cards))
+    
+    # Массовый ввод ставок: /import и строки "банк;категория;процент" в том же сообщении,
+    # следующим сообщением или файлом CSV/TSV
+    @bot.message_handler(commands=["import"])
+    def command_import(message):
+        parts = message.text.split(maxsplit=1)
+        if len(parts) > 1:
+            import_rates(message, parts[1])
+            return
+        sessions.setdefault(message.from_user.id, {})["await_import"] = True
+        outbox.reply_to(
+            message,
+            "Пришлите ставки сообщением или файлом CSV/TSV, по одной в строке:\n"
+            "банк;категория;процент\n\nНапример:\nСбербанк;рестораны;5\nАльфа-Банк;азс;3"
+        )
+    
+    def import_rates(message, text):
+        rates, errors = parse_rates_text(text)
+        if len(rates) > IMPORT_MAX_ROWS:
+            outbox.reply_to(message, f"❌ Больше {IMPORT_MAX_ROWS} ставок за раз, разделите файл")
+            return
+        saved = save_cashback_many(message.from_user.id, rates) if rates else 0
+        outbox.reply_to(message, format_import_report(saved, errors))
+    
+    # Напоминание в начале месяца: /remind — когда следующее, /remind on|off, /remind Asia/Yekaterinburg
+    @bot.message_handler(commands=["remind"])
+    def command_remind(message):
+        user_id = message.from_user.id
+        arg = message.text.partition(" ")[2].strip()
+        if not arg:
+            reminder = reminder_scheduler.get(user_id)
+        elif arg.lower() in ("on", "off"):
+            reminder = reminder_scheduler.update(user_id, enabled=arg.lower() == "on")
+        elif valid_timezone(arg):
+            reminder = reminder_scheduler.update(user_id, timezone=arg)
+        else:
+            outbox.reply_to(message, f"❌ Не знаю часовой пояс «{arg}». Пример: /remind Asia/Yekaterinburg")
+            return
+        outbox.reply_to(message, format_reminder(reminder))
+    
+    # Вся история кэшбэка файлом: /export (CSV, сжатый gzip) или /export xlsx
+    @bot.message_handler(commands=["export"])
+    def command_export(message):
+        fmt = message.text.partition(" ")[2].strip().lower() or "csv"
+        if fmt not in EXPORT_FORMATS:
+            outbox.reply_to(message, "Использование: /export [csv|xlsx]")
+            return
+        progress = ProgressMessage(outbox, message.chat.id, "⏳ Готовлю выгрузку...")
+        _recognition_pool.submit(contextvars.copy_context().run, export_document, message, fmt, progress)
+    
+    def export_document(message, fmt, progress):
+        path = None
+        try:
+            path, rows = export_history(message.from_user.id, fmt)
+            if not rows:
+                progress.finish("История кэшбэка пуста")
+                return
+            with STAGE_SECONDS.time("send_document"), open(path, "rb") as f:
+                bot.send_document(
+                    message.chat.id, f, visible_file_name="cashback" + EXPORT_FORMATS[fmt][0],
+                    caption=f"История кэшбэка: {rows} записей"
+                )
+            progress.finish(f"✅ Выгружено записей: {rows}")
+        except Exception as e:
+            logger.error("Ошибка выгрузки истории: %s", e)
+            progress.finish("❌ Не удалось выгрузить историю")
+        finally:
+            if path:
+                delete_temp_file(path)
     
     # Обработчик добавления информации
     @bot.message_handler(func=lambda m: "добавить информацию" in m.text.lower())
@@ -51,18 +201,15 @@ def register_handlers(bot: TeleBot):
         sessions[message.from_user.id] = {}  # Сброс сессии для нового ввода
         user_id = message.from_user.id
         markup = bank_keyboard(user_id)
-        bot.reply_to(message, "Выберите банк:", reply_markup=markup)
+        outbox.reply_to(message, "Выберите банк:", reply_markup=markup)
     
     # Обработчик показа сводки
     @bot.message_handler(func=lambda m: "показать сводку" in m.text.lower())
     def show_summary(message):
         summary = format_summary(message.from_user.id)
-        bot.reply_to(message, f"\n{summary}", reply_markup=main_menu_keyboard())
+        outbox.reply_to(message, f"\n{summary}", reply_markup=main_menu_keyboard())
         
-        offer_msg = "💳 Чтобы увеличить вашу выгоду, оформите карту:\n"
-        for bank, link in CARD_LINKS.items():
-            offer_msg += f"{bank}: {link}\n"
-        bot.send_message(message.from_user.id, offer_msg, reply_markup=main_menu_keyboard())
+        outbox.send_message(message.from_user.id, format_offers(message.from_user.id), reply_markup=main_menu_keyboard())
     
     # Обработчик сброса данных
     @bot.message_handler(func=lambda m: "сбросить данные" in m.text.lower())
@@ -79,67 +226,181 @@ def register_handlers(bot: TeleBot):
         
         # Всегда добавляем кнопку для полного сброса
         keyboard.add(types.InlineKeyboardButton(text="Полный сброс статистики", callback_data="reset_all"))
-        bot.reply_to(message, "Выберите сброс: для отдельного банка или полный сброс статистики:", reply_markup=keyboard)
+        outbox.reply_to(message, "Выберите сброс: для отдельного банка или полный сброс статистики:", reply_markup=keyboard)
     
     # Обработчик возврата в главное меню
     @bot.message_handler(func=lambda m: m.text == "Назад")
     def back_to_main(message):
-        bot.reply_to(message, "Главное меню", reply_markup=main_menu_keyboard())
+        outbox.reply_to(message, "Главное меню", reply_markup=main_menu_keyboard())
     
     # Обработчик выбора способа ввода
     @bot.message_handler(func=lambda m: m.text in ["Ручной ввод", "Скриншот"])
     def handle_input_method(message):
         user_id = message.from_user.id
         if user_id not in sessions or "bank" not in sessions[user_id]:
-            bot.reply_to(message, "Сначала выберите банк", reply_markup=main_menu_keyboard())
+            outbox.reply_to(message, "Сначала выберите банк", reply_markup=main_menu_keyboard())
             return
         
         if message.text == "Ручной ввод":
             markup = category_keyboard(user_id)
-            bot.reply_to(message, "Выберите категорию:", reply_markup=markup)
+            outbox.reply_to(message, "Выберите категорию:", reply_markup=markup)
         else:  # "Скриншот"
-            bot.reply_to(message, "Пожалуйста, отправьте скриншот с условиями кэшбэка:", reply_markup=types.ReplyKeyboardRemove())
+            outbox.reply_to(message, "Пожалуйста, отправьте скриншот с условиями кэшбэка:", reply_markup=types.ReplyKeyboardRemove())
+    
+    # Завершение фонового распознавания: результат показывается, только если за это время
+    # пользователь не отправил новый скриншот и не начал ввод заново
+    def finish_recognition(message, future, progress, temp_file, detected):
+        user_id = message.from_user.id
+        delete_temp_file(temp_file)
+        session = sessions.setdefault(user_id, {})
+        try:
+            if session.get("pending") is not future:
+                return
+            try:
+                categories = future.result()
+            except Exception as e:
+                logger.error("Ошибка распознавания: %s", e)
+                categories = []
+            
+            if not categories:
+                progress.finish("⚠️ Анализ завершён")
+                outbox.reply_to(message, "⚠️ Не удалось найти данные о кэшбэке")
+                return
+            progress.finish("✅ Анализ завершён")
+            
+            # Банк со скриншота подставляется, если пользователь ещё не выбрал свой
+            bank = find_bank(detected["bank"]) if detected.get("bank") else None
+            if bank and "bank" not in session and not session.get("await_bank"):
+                session["bank"] = bank
+            else:
+                bank = None
+            # Сохраняем результат в сессию и отправляем с кнопками подтверждения
+            show_recognized(message, categories, detected_bank=bank)
+        except Exception as e:
+            logger.error("Ошибка обработки фото: %s", e)
+            outbox.reply_to(message, "❌ Произошла ошибка при обработке")
+        finally:
+            if session.get("pending") is future:
+                session.pop("pending", None)
     
     # Обработчик фотографий
     @bot.message_handler(content_types=["photo"])
     def handle_photo(message):
         user_id = message.from_user.id
-        if user_id not in sessions or "bank" not in sessions[user_id]:
-            bot.reply_to(message, "Сначала выберите банк и метод ввода", reply_markup=main_menu_keyboard())
+        
+        # Текст предложения в подписи разбирается локально, без запроса к GigaChat
+        if message.caption:
+            parsed = parse_offer_text(message.caption)
+            if parsed.categories:
+                RECOGNITIONS.inc("caption")
+                show_recognized(message, parsed.categories)
+                return
+            EMPTY_PARSES.inc("caption")
+        
+        recognize_photo(message)
+    
+    # Распознавание фото через GigaChat; check=False пропускает локальный фильтр
+    # (пользователь подтвердил, что на отклонённом изображении всё же есть условия кэшбэка)
+    def recognize_photo(message, check=True):
+        user_id = message.from_user.id
+        if DAILY_TOKEN_BUDGET and user_id not in ADMIN_IDS and get_user_tokens_today(user_id) >= DAILY_TOKEN_BUDGET:
+            outbox.reply_to(message, "⚠️ Дневной лимит распознавания скриншотов исчерпан. Введите данные вручную или попробуйте завтра", reply_markup=input_method_keyboard())
             return
         
         try:
             # Получаем файл с наилучшим качеством
-            file_info = bot.get_file(message.photo[-1].file_id)
-            file_data = bot.download_file(file_info.file_path)
+            with STAGE_SECONDS.time("download"):
+                file_info = bot.get_file(message.photo[-1].file_id)
+                file_data = bot.download_file(file_info.file_path)
             
             # Сохраняем во временный файл
             temp_file = save_temp_file(file_data)
             
-            # Отправляем на анализ
-            bot.send_message(user_id, "⏳ Анализирую изображение...")
-            categories = analyze_image(temp_file)
-            
-            # Удаляем временный файл
-            delete_temp_file(temp_file)
+            # Селфи, чеки и мемы отсекаются локально, без запроса к GigaChat
+            if check:
+                accepted, score = check_image(temp_file)
+                if not accepted:
+                    delete_temp_file(temp_file)
+                    sessions.setdefault(user_id, {})["rejected_photo"] = message
+                    outbox.reply_to(message, "🤔 Похоже, на изображении нет условий кэшбэка. Отправьте скриншот из приложения банка или распознайте это фото:", reply_markup=force_recognize_keyboard())
+                    return
             
-            if not categories:
-                bot.reply_to(message, "⚠️ Не удалось найти данные о кэшбэке")
-            else:
-                # Сохраняем результат в сессию
-                sessions[user_id]["screenshot"] = categories
-                
-                # Формируем текст с результатами
-                response = "✅ Распознанные категории:\n\n"
-                for cat in categories:
-                    response += f"▪️ {cat.category.capitalize()}: {int(cat.amount)}%\n"
-                
-                # Отправляем результат с кнопками подтверждения
-                bot.reply_to(message, response, reply_markup=screenshot_confirm_keyboard())
+            # Анализ идёт в фоне; категории появляются в статусном сообщении по мере распознавания
+            progress = ProgressMessage(outbox, user_id, "⏳ Анализирую изображение...")
+        except Exception as e:
+            logger.error("Ошибка обработки фото: %s", e)
+            outbox.reply_to(message, "❌ Произошла ошибка при обработке")
+            return
         
+        session = sessions.setdefault(user_id, {})
+        session.pop("screenshot", None)
+        detected = {}
+        # Контекст трассировки и журнала переносится в поток распознавания
+        future = _recognition_pool.submit(
+            contextvars.copy_context().run, analyze_image, temp_file,
+            on_category=lambda cat: progress.add(f"▪️ {cat.category.capitalize()}: {int(cat.amount)}%"),
+            user_id=user_id,
+            on_escalate=lambda: progress.restart("🔍 Уточняю распознавание..."),
+            on_bank=lambda bank: detected.update(bank=bank)
+        )
+        session["pending"] = future
+        # Банк выбирается, пока модель распознаёт скриншот
+        if "bank" not in session:
+            outbox.send_message(user_id, "Пока я распознаю скриншот, выберите банк:", reply_markup=bank_keyboard(user_id))
+        future.add_done_callback(lambda f: finish_recognition(message, f, progress, temp_file, detected))
+    
+    # Файл от пользователя: ставки для /import (после команды, с подписью /import или TSV/TXT)
+    # или выписка из интернет-банка (CSV или XLSX) — траты по категориям для /optimize
+    @bot.message_handler(content_types=["document"])
+    def handle_document(message):
+        document = message.document
+        name = (document.file_name or "").lower()
+        if sessions.get(message.from_user.id, {}).pop("await_import", False) \
+                or (message.caption or "").startswith("/import") \
+                or (name.endswith(IMPORT_EXTENSIONS) and not name.endswith(STATEMENT_EXTENSIONS)):
+            import_rates_file(message)
+            return
+        if not name.endswith(STATEMENT_EXTENSIONS):
+            outbox.reply_to(message, "Пришлите выписку из интернет-банка в формате CSV или XLSX")
+            return
+        if (document.file_size or 0) > STATEMENT_MAX_BYTES:
+            outbox.reply_to(message, f"Файл больше {STATEMENT_MAX_BYTES // 1024 // 1024} МБ, выгрузите выписку за меньший период")
+            return
+        progress = ProgressMessage(outbox, message.chat.id, "⏳ Обрабатываю выписку...")
+        # Разбор идёт в пуле, поток TeleBot сразу освобождается
+        _recognition_pool.submit(contextvars.copy_context().run, import_document, message, progress)
+    
+    def import_rates_file(message):
+        if not (message.document.file_name or "").lower().endswith(IMPORT_EXTENSIONS):
+            outbox.reply_to(message, "Пришлите ставки файлом CSV, TSV или TXT")
+            return
+        if (message.document.file_size or 0) > IMPORT_MAX_BYTES:
+            outbox.reply_to(message, f"Файл больше {IMPORT_MAX_BYTES // 1024} КБ, разделите его на части")
+            return
+        with STAGE_SECONDS.time("download"):
+            data = bot.download_file(bot.get_file(message.document.file_id).file_path)
+        try:
+            text = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            text = data.decode("cp1251", errors="replace")
+        import_rates(message, text)
+    
+    def import_document(message, progress):
+        temp_file = None
+        try:
+            with STAGE_SECONDS.time("download"):
+                file_info = bot.get_file(message.document.file_id)
+                suffix = os.path.splitext(message.document.file_name)[1].lower()
+                temp_file = download_temp_file(bot.token, file_info.file_path, suffix)
+            progress.finish(format_statement_report(import_statement(message.from_user.id, temp_file)))
+        except StatementError as e:
+            progress.finish(f"❌ {e}")
         except Exception as e:
-            logger.error(f"Ошибка: {str(e)}")
-            bot.reply_to(message, "❌ Произошла ошибка при обработке")
+            logger.error("Ошибка импорта выписки: %s", e)
+            progress.finish("❌ Не удалось обработать выписку")
+        finally:
+            if temp_file:
+                delete_temp_file(temp_file)
     
     # Обработчик текстовых сообщений для ручного ввода
     @bot.message_handler(func=lambda m: True)
@@ -147,19 +408,30 @@ def register_handlers(bot: TeleBot):
         user_id = message.from_user.id
         sessions.setdefault(user_id, {})
         
+        # Ставки списком после /import
+        if sessions[user_id].pop("await_import", False):
+            import_rates(message, message.text)
+            return
+        
         # Обработка ожидания ввода банка
         if sessions[user_id].get("await_bank", False):
             sessions[user_id]["bank"] = message.text
             sessions[user_id]["await_bank"] = False
-            bot.reply_to(message, f"Выбран банк: {message.text}\nВыберите способ ввода информации:", reply_markup=input_method_keyboard())
+            if sessions[user_id].get("screenshot"):
+                outbox.reply_to(message, f"Выбран банк: {message.text}\nСохранить распознанные категории?", reply_markup=screenshot_confirm_keyboard())
+            elif sessions[user_id].get("pending"):
+                outbox.reply_to(message, f"Выбран банк: {message.text}\nСкриншот ещё распознаётся, категории появятся выше")
+            else:
+                outbox.reply_to(message, f"Выбран банк: {message.text}\nВыберите способ ввода информации:", reply_markup=input_method_keyboard())
             return
         
         # Обработка ожидания ввода категории
         if sessions[user_id].get("await_category", False):
-            sessions[user_id]["category"] = message.text
+            category = canonicalize_category(message.text)
+            sessions[user_id]["category"] = category
             sessions[user_id]["await_category"] = False
             sessions[user_id]["stage"] = "await_cashback"
-            bot.reply_to(message, f"Выбрана категория: {message.text}\nВведите величину кешбэка (целое число):")
+            outbox.reply_to(message, f"Выбрана категория: {category}\nВведите величину кешбэка (целое число):")
             return
         
         # Обработка ожидания ввода кэшбэка
@@ -173,12 +445,34 @@ def register_handlers(bot: TeleBot):
                 save_cashback(user_id, bank, category, amount)
                 
                 # Уведомляем пользователя
-                bot.reply_to(message, f"✅ Сохранено: {category.capitalize()} - {int(amount)}%", reply_markup=add_more_keyboard())
+                outbox.reply_to(message, f"✅ Сохранено: {category.capitalize()} - {int(amount)}%", reply_markup=add_more_keyboard())
                 
                 # Сбрасываем состояние
                 sessions[user_id]["stage"] = None
             except ValueError:
-                bot.reply_to(message, "❌ Пожалуйста, введите числовое значение")
+                outbox.reply_to(message, "❌ Пожалуйста, введите числовое значение")
+            return
+        
+        # Вставленный текст предложения банка ("Рестораны 5%, АЗС 3%") разбирается локально
+        parsed = parse_offer_text(message.text)
+        if parsed.categories:
+            RECOGNITIONS.inc("text")
+            show_recognized(message, parsed.categories)
+            return
+        EMPTY_PARSES.inc("text")
+        
+        # Название категории без процентов ("аптека") — вопрос, какой картой платить
+        category = find_category(message.text)
+        if category:
+            outbox.reply_to(message, format_best(user_id, category))
+    
+    # Inline-режим: "@bot азс" в любом чате показывает лучшую карту для категории.
+    # Ответ персональный, поэтому is_personal; Telegram кэширует его на INLINE_CACHE_TIME секунд
+    @bot.inline_handler(func=lambda query: True)
+    def inline_query(query):
+        results = inline_results(query.from_user.id, query.query)
+        button = None if results else types.InlineQueryResultsButton(text="➕ Добавить кэшбэк", start_parameter="add")
+        bot.answer_inline_query(query.id, results, cache_time=INLINE_CACHE_TIME, is_personal=True, button=button)
     
     # Обработчики callback-запросов
     
@@ -187,12 +481,24 @@ def register_handlers(bot: TeleBot):
     def callback_bank(call):
         user_id = call.from_user.id
         bank = call.data.split("_", 1)[1]
+        screenshot = sessions.get(user_id, {}).get("screenshot")
+        pending = sessions.get(user_id, {}).get("pending")
         if bank == "other":
-            bot.send_message(user_id, "Введите название вашего банка:")
+            outbox.send_message(user_id, "Введите название вашего банка:")
             sessions[user_id] = {"await_bank": True}
+            if screenshot:
+                sessions[user_id]["screenshot"] = screenshot
+            if pending:
+                sessions[user_id]["pending"] = pending
+        elif screenshot:
+            sessions[user_id]["bank"] = bank
+            outbox.send_message(user_id, f"Выбран банк: {bank}\nСохранить распознанные категории?", reply_markup=screenshot_confirm_keyboard())
+        elif pending:
+            sessions[user_id]["bank"] = bank
+            outbox.send_message(user_id, f"Выбран банк: {bank}\nСкриншот ещё распознаётся, категории появятся выше")
         else:
             sessions.setdefault(user_id, {})["bank"] = bank
-            bot.send_message(user_id, f"Выбран банк: {bank}\nВыберите способ ввода информации:", reply_markup=input_method_keyboard())
+            outbox.send_message(user_id, f"Выбран банк: {bank}\nВыберите способ ввода информации:", reply_markup=input_method_keyboard())
         bot.answer_callback_query(call.id)
     
     # Обработчик выбора категории
@@ -201,11 +507,12 @@ def register_handlers(bot: TeleBot):
         user_id = call.from_user.id
         cat = call.data.split("_", 1)[1]
         if cat == "other":
-            bot.send_message(user_id, "Введите название категории:")
+            outbox.send_message(user_id, "Введите название категории:")
             sessions[user_id]["await_category"] = True
         else:
+            cat = canonicalize_category(cat)
             sessions.setdefault(user_id, {})["category"] = cat
-            bot.send_message(user_id, f"Выбрана категория: {cat}\nВведите величину кешбэка (целое число):")
+            outbox.send_message(user_id, f"Выбрана категория: {cat}\nВведите величину кешбэка (целое число):")
             sessions[user_id]["stage"] = "await_cashback"
         bot.answer_callback_query(call.id)
     
@@ -215,14 +522,14 @@ def register_handlers(bot: TeleBot):
         user_id = call.from_user.id
         bank = call.data.split("_", 1)[1]
         msg = f"Вы действительно хотите сбросить данные для банка {bank}?"
-        bot.send_message(user_id, msg, reply_markup=reset_confirm_keyboard(bank))
+        outbox.send_message(user_id, msg, reply_markup=reset_confirm_keyboard(bank))
         bot.answer_callback_query(call.id)
     
     # Обработчик полного сброса
     @bot.callback_query_handler(func=lambda call: call.data == "reset_all")
     def callback_reset_all(call):
         user_id = call.from_user.id
-        bot.send_message(user_id, "Вы действительно хотите полностью сбросить всю статистику?", reply_markup=full_reset_confirm_keyboard())
+        outbox.send_message(user_id, "Вы действительно хотите полностью сбросить всю статистику?", reply_markup=full_reset_confirm_keyboard())
         bot.answer_callback_query(call.id)
     
     # Обработчик подтверждения полного сброса
@@ -230,14 +537,14 @@ def register_handlers(bot: TeleBot):
     def callback_reset_all_confirm(call):
         user_id = call.from_user.id
         reset_all_data(user_id)
-        bot.send_message(user_id, "✅ Полный сброс статистики выполнен.", reply_markup=main_menu_keyboard())
+        outbox.send_message(user_id, "✅ Полный сброс статистики выполнен.", reply_markup=main_menu_keyboard())
         bot.answer_callback_query(call.id)
     
     # Обработчик отмены сброса
     @bot.callback_query_handler(func=lambda call: call.data == "reset_cancel")
     def callback_reset_cancel(call):
         user_id = call.from_user.id
-        bot.send_message(user_id, "Сброс данных отменён.", reply_markup=main_menu_keyboard())
+        outbox.send_message(user_id, "Сброс данных отменён.", reply_markup=main_menu_keyboard())
         bot.answer_callback_query(call.id)
     
     # Обработчик подтверждения сохранения скриншота
@@ -252,19 +559,30 @@ def register_handlers(bot: TeleBot):
                 save_cashback(user_id, bank, cat.category, int(cat.amount), input_type="screenshot")
             
             response = "\n".join(f"{cat.category.capitalize()}: {int(cat.amount)}% 💰" for cat in categories)
-            bot.send_message(user_id, f"✅ Сохранено:\n{response}", reply_markup=main_menu_keyboard())
+            outbox.send_message(user_id, f"✅ Сохранено:\n{response}", reply_markup=main_menu_keyboard())
             sessions[user_id].pop("screenshot", None)
         else:
-            bot.send_message(user_id, "❌ Нет данных для сохранения.", reply_markup=main_menu_keyboard())
+            outbox.send_message(user_id, "❌ Нет данных для сохранения.", reply_markup=main_menu_keyboard())
         
         bot.answer_callback_query(call.id)
     
+    # Распознавание скриншота несмотря на фильтр
+    @bot.callback_query_handler(func=lambda call: call.data == "force_recognize")
+    def callback_force_recognize(call):
+        user_id = call.from_user.id
+        message = sessions.get(user_id, {}).pop("rejected_photo", None)
+        if message is None:
+            bot.answer_callback_query(call.id, "Отправьте скриншот ещё раз")
+            return
+        bot.answer_callback_query(call.id)
+        recognize_photo(message, check=False)
+    
     # Обработчик отмены сохранения скриншота
     @bot.callback_query_handler(func=lambda call: call.data == "cancel_screenshot")
     def cancel_screenshot(call):
         user_id = call.from_user.id
         sessions[user_id].pop("screenshot", None)
-        bot.send_message(user_id, "Отменено. Вы можете попробовать ввести данные вручную.", reply_markup=input_method_keyboard())
+        outbox.send_message(user_id, "Отменено. Вы можете попробовать ввести данные вручную.", reply_markup=input_method_keyboard())
         bot.answer_callback_query(call.id)
     
     # Обработчик подтверждения сброса данных банка
@@ -273,7 +591,7 @@ def register_handlers(bot: TeleBot):
         user_id = call.from_user.id
         bank = call.data.split("_", 1)[1]
         reset_data_for_bank(user_id, bank)
-        bot.send_message(user_id, f"Данные для банка {bank} сброшены.", reply_markup=main_menu_keyboard())
+        outbox.send_message(user_id, f"Данные для банка {bank} сброшены.", reply_markup=main_menu_keyboard())
         bot.answer_callback_query(call.id)
     
     # Обработчик "Добавить ещё"
@@ -282,15 +600,15 @@ def register_handlers(bot: TeleBot):
         user_id = call.from_user.id
         if user_id in sessions and "bank" in sessions[user_id]:
             markup = category_keyboard(user_id)
-            bot.send_message(user_id, "Выберите категорию:", reply_markup=markup)
+            outbox.send_message(user_id, "Выберите категорию:", reply_markup=markup)
         else:
             markup = bank_keyboard(user_id)
-            bot.send_message(user_id, "Выберите банк:", reply_markup=markup)
+            outbox.send_message(user_id, "Выберите банк:", reply_markup=markup)
         bot.answer_callback_query(call.id)
     
     # Обработчик "Главное меню"
     @bot.callback_query_handler(func=lambda call: call.data == "back_main")
     def callback_back_main(call):
         user_id = call.from_user.id
-        bot.send_message(user_id, "Главное меню", reply_markup=main_menu_keyboard())
+        outbox.send_message(user_id, "Главное меню", reply_markup=main_menu_keyboard())
         bot.answer_callback_query(call.id) 
\ No newline at end of file
@@ -0,0 +1,109 @@
+import logging
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+from .config import (
+    TELEGRAM_POOL_SIZE, GIGACHAT_MAX_CONNECTIONS, GIGACHAT_KEEPALIVE_EXPIRY, GIGACHAT_HTTP2
+)
+from .metrics import HTTP_CONNECTIONS, HTTP_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Общая сессия requests для всех потоков TeleBot и пула распознавания.
+# По умолчанию apihelper создаёт отдельную сессию в каждом потоке, и каждый поток
+# открывает собственные соединения с api.telegram.org
+def telegram_session(pool_size=TELEGRAM_POOL_SIZE):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _pool_total(session, attribute):
+    total = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                total += getattr(pool, attribute)
+    return total
+
+def install_telegram_session(pool_size=TELEGRAM_POOL_SIZE):
+    session = telegram_session(pool_size)
+    apihelper.session = session
+    # Сессия живёт всё время работы бота
+    apihelper.SESSION_TIME_TO_LIVE = None
+    # urllib3 сам считает запросы и открытые соединения в каждом пуле
+    HTTP_REQUESTS.set_function(lambda: _pool_total(session, "num_requests"), "telegram")
+    HTTP_CONNECTIONS.set_function(lambda: _pool_total(session, "num_connections"), "telegram")
+    return session
+
+# Трассировка httpcore: событие connect_tcp приходит только для нового соединения
+def _count_events(client):
+    def trace(event, info):
+        if event == "connection.connect_tcp.complete":
+            HTTP_CONNECTIONS.inc(client)
+
+    def on_request(request):
+        HTTP_REQUESTS.inc(client)
+        request.extensions["trace"] = trace
+
+    return on_request
+
+def _http2_available():
+    if not GIGACHAT_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+_gigachat_http = {}
+_gigachat_lock = threading.Lock()
+
+# Клиенты httpx, общие для всех моделей GigaChat: запросы к API и к серверу авторизации
+def gigachat_http_clients(settings):
+    from gigachat.client import _get_auth_kwargs, _get_kwargs
+
+    with _gigachat_lock:
+        if not _gigachat_http:
+            limits = httpx.Limits(
+                max_connections=GIGACHAT_MAX_CONNECTIONS,
+                max_keepalive_connections=GIGACHAT_MAX_CONNECTIONS,
+                keepalive_expiry=GIGACHAT_KEEPALIVE_EXPIRY,
+            )
+            http2 = _http2_available()
+            _gigachat_http["api"] = httpx.Client(
+                **{**_get_kwargs(settings), "limits": limits}, http2=http2,
+                event_hooks={"request": [_count_events("gigachat")]}
+            )
+            _gigachat_http["auth"] = httpx.Client(
+                **_get_auth_kwargs(settings), limits=limits,
+                event_hooks={"request": [_count_events("gigachat_auth")]}
+            )
+            logger.info("Пул GigaChat: до %d соединений, keep-alive %.0f с, HTTP/2: %s",
+                        GIGACHAT_MAX_CONNECTIONS, GIGACHAT_KEEPALIVE_EXPIRY, "да" if http2 else "нет")
+        return _gigachat_http["api"], _gigachat_http["auth"]
+
+# Подмена собственных клиентов httpx, которые gigachat создаёт для каждой модели, на общие.
+# Используются внутренние атрибуты gigachat (версии закреплены в requirements.txt); если их нет,
+# модель остаётся со своими клиентами
+def share_gigachat_pool(llm):
+    try:
+        client = llm._client
+        api, auth = gigachat_http_clients(client._settings)
+        own_api, own_auth = client._client, client._auth_client
+    except (ImportError, AttributeError) as e:
+        logger.warning("Общий пул GigaChat недоступен, у модели свои соединения: %s", e)
+        return llm
+    if own_api is not api:
+        own_api.close()
+        own_auth.close()
+        client._client = api
+        client._auth_client = auth
+    return llm
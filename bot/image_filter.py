@@ -0,0 +1,117 @@
+import json
+import math
+import time
+import logging
+from collections import Counter
+from PIL import Image, ImageFilter
+
+from .config import PREFILTER_ENABLED, PREFILTER_THRESHOLD, PREFILTER_MODEL_PATH
+from .metrics import PREFILTER_DECISIONS, PREFILTER_SCORE, STAGE_SECONDS
+from .routing import EDGE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Ширина уменьшенной копии: признаки считаются по ~20 тыс. пикселей за несколько миллисекунд
+FILTER_WIDTH = 96
+# Строка считается пустой (фон интерфейса), если разброс яркости в ней меньше порога
+FLAT_ROW_RANGE = 16
+# Скриншоты телефона вытянуты по вертикали; более квадратные и горизонтальные снимки штрафуются
+SCREEN_MIN_ASPECT = 1.6
+# Доля пикселей, которую должны покрыть самые частые цвета (5 бит на канал)
+COLOUR_COVERAGE = 0.9
+
+# Логистическая модель по умолчанию: скриншот приложения банка — крупный однотонный фон,
+# мало цветов, много пустых строк между строками текста
+DEFAULT_MODEL = {
+    "bias": -2.0,
+    "weights": {
+        "dominant_share": 6.0,
+        "colours": -8.0,
+        "flat_rows": 4.0,
+        "line_breaks": 20.0,
+        "edge_density": 2.0,
+        "aspect_penalty": -3.0,
+    },
+}
+
+def load_model(path):
+    if not path:
+        return DEFAULT_MODEL
+    try:
+        with open(path, encoding="utf-8") as f:
+            model = json.load(f)
+        model["weights"] = {**DEFAULT_MODEL["weights"], **model.get("weights", {})}
+        return model
+    except Exception as e:
+        logger.warning("Не удалось загрузить модель фильтра %s: %s", path, e)
+        return DEFAULT_MODEL
+
+_model = load_model(PREFILTER_MODEL_PATH)
+
+def filter_features(file_path):
+    with Image.open(file_path) as image:
+        width, height = image.size
+        # JPEG декодируется сразу в уменьшенном масштабе
+        image.draft("RGB", (FILTER_WIDTH * 2, FILTER_WIDTH * 2 * height // width))
+        small = image.convert("RGB").resize((FILTER_WIDTH, max(1, round(height * FILTER_WIDTH / width))))
+    gray = small.convert("L")
+    w, h = gray.size
+    total = w * h
+
+    colours = Counter(small.point(lambda v: v >> 3).getdata()).most_common()
+    covered = 0
+    needed = 0
+    for _, count in colours:
+        covered += count
+        needed += 1
+        if covered >= total * COLOUR_COVERAGE:
+            break
+
+    pixels = gray.tobytes()
+    flat = [max(pixels[y * w:(y + 1) * w]) - min(pixels[y * w:(y + 1) * w]) < FLAT_ROW_RANGE for y in range(h)]
+    breaks = sum(a != b for a, b in zip(flat, flat[1:]))
+
+    edges = gray.filter(ImageFilter.FIND_EDGES).histogram()
+    aspect = height / width
+    return {
+        "aspect": aspect,
+        "aspect_penalty": max(0.0, math.log(SCREEN_MIN_ASPECT / aspect)),
+        "dominant_share": colours[0][1] / total,
+        # Логарифм числа цветов, покрывающих COLOUR_COVERAGE пикселей, от 0 до 1
+        "colours": math.log2(needed) / 15,
+        "flat_rows": sum(flat) / h,
+        "line_breaks": breaks / h,
+        "edge_density": sum(edges[EDGE_THRESHOLD:]) / total,
+    }
+
+def offer_probability(features, model=None):
+    model = model or _model
+    z = model["bias"] + sum(weight * features.get(name, 0.0) for name, weight in model["weights"].items())
+    return 1 / (1 + math.exp(-max(-50.0, min(50.0, z))))
+
+# Проверка перед запросом к GigaChat: (пропустить ли изображение, оценка).
+# При ошибке чтения изображение пропускается — решение остаётся за моделью
+def check_image(file_path):
+    if not PREFILTER_ENABLED:
+        return True, None
+    started = time.perf_counter()
+    try:
+        features = filter_features(file_path)
+        score = offer_probability(features)
+    except Exception as e:
+        logger.warning("Не удалось оценить изображение фильтром: %s", e)
+        PREFILTER_DECISIONS.inc("error")
+        return True, None
+    seconds = time.perf_counter() - started
+
+    STAGE_SECONDS.observe(seconds, "prefilter")
+    PREFILTER_SCORE.observe(score)
+    accepted = score >= _model.get("threshold", PREFILTER_THRESHOLD)
+    PREFILTER_DECISIONS.inc("accepted" if accepted else "rejected")
+    logger.info(
+        "Фильтр изображений: оценка %.2f, %s (фон %.2f, цвета %.3f, пустые строки %.2f, переходы %.3f)",
+        score, "пропущено" if accepted else "отклонено", features["dominant_share"], features["colours"],
+        features["flat_rows"], features["line_breaks"],
+        extra={"stage": "prefilter", "duration_ms": round(seconds * 1000, 1)}
+    )
+    return accepted, score
@@ -0,0 +1,100 @@
+import bisect
+import threading
+from collections import OrderedDict
+from telebot import types
+
+from .config import INLINE_CACHE_USERS, INLINE_MAX_RESULTS
+from .database import add_change_listener, get_all_best
+from .categories import find_category, normalize_category
+from .metrics import CACHE_HITS, CACHE_MISSES
+from .utils import category_label
+
+# Результат, сериализованный заранее: apihelper склеивает to_json() результатов в массив
+class _Serialized(types.JsonSerializable):
+    def __init__(self, json):
+        self.json = json
+
+    def to_json(self):
+        return self.json
+
+# Готовые inline-ответы пользователя: результаты по убыванию лучшего процента
+# и отсортированные ключи (название категории и каждое слово в нём) для поиска по префиксу
+class _UserResults:
+    def __init__(self, best):
+        ranked = sorted(best.items(), key=lambda item: item[1][0][1], reverse=True)
+        self.results = []
+        self.positions = {}
+        keys = set()
+        for position, (category, banks) in enumerate(ranked):
+            self.results.append(_Serialized(_article(position, category, banks).to_json()))
+            self.positions[category] = position
+            name = normalize_category(category) or category.lower()
+            keys.add((name, position))
+            keys.update((word, position) for word in name.split())
+        self.keys = sorted(keys)
+
+    def search(self, query):
+        term = normalize_category(query)
+        if not term:
+            return self.results[:INLINE_MAX_RESULTS]
+        found = set()
+        index = bisect.bisect_left(self.keys, (term,))
+        while index < len(self.keys) and self.keys[index][0].startswith(term):
+            found.add(self.keys[index][1])
+            index += 1
+        # Синонимы и опечатки ("заправка" -> "азс") — через словарь категорий
+        if not found:
+            canonical = find_category(query)
+            if canonical in self.positions:
+                found.add(self.positions[canonical])
+        return [self.results[position] for position in sorted(found)[:INLINE_MAX_RESULTS]]
+
+def _article(position, category, banks):
+    bank, amount = banks[0]
+    label = category_label(category)
+    lines = [f"{label}: платите картой {bank} — {amount:g}%"]
+    lines += [f"└ {other}: {value:g}%" for other, value in banks[1:]]
+    return types.InlineQueryResultArticle(
+        id=str(position),
+        title=f"{label} — {bank} {amount:g}%",
+        description=", ".join(f"{other} {value:g}%" for other, value in banks[1:]) or None,
+        input_message_content=types.InputTextMessageContent("\n".join(lines)),
+    )
+
+# Готовые ответы не больше чем для INLINE_CACHE_USERS пользователей, вытесняются давно не обращавшиеся
+_cache = OrderedDict()
+# Сборки ответов, которые идут сейчас: user_id -> метка сборки. Изменение данных снимает метку,
+# и ответ, собранный по старым данным, не попадает в кэш
+_building = {}
+_lock = threading.Lock()
+
+def inline_results(user_id, query):
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is not None:
+            _cache.move_to_end(user_id)
+        else:
+            token = _building[user_id] = object()
+    if entry is None:
+        CACHE_MISSES.inc("inline")
+        try:
+            entry = _UserResults(get_all_best(user_id))
+        finally:
+            with _lock:
+                if _building.get(user_id) is token:
+                    del _building[user_id]
+                    if entry is not None:
+                        _cache[user_id] = entry
+                        if len(_cache) > INLINE_CACHE_USERS:
+                            _cache.popitem(last=False)
+    else:
+        CACHE_HITS.inc("inline")
+    return entry.search(query)
+
+# Любое изменение кэшбэка пользователя сбрасывает его готовые ответы
+def invalidate(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+        _building.pop(user_id, None)
+
+add_change_listener(invalidate)
@@ -1,5 +1,5 @@
 from telebot import types
-from .config import CATEGORY_EMOJIS, DEFAULT_CATEGORY_EMOJI, DEFAULT_CATEGORIES
+from .config import CATEGORY_EMOJIS, DEFAULT_CATEGORY_EMOJI, DEFAULT_CATEGORIES, DEFAULT_BANKS
 from .database import get_user_categories, get_user_banks
 
 def main_menu_keyboard():
@@ -22,9 +22,8 @@ def input_method_keyboard():
 
 def bank_keyboard(user_id: int):
     markup = types.InlineKeyboardMarkup(row_width=3)
-    default_banks = ["Тинькофф", "Альфа-Банк", "Сбербанк", "ВТБ", "OZON", "Газпромбанк"]
     user_banks = get_user_banks(user_id)
-    all_banks = list(set(default_banks + user_banks))
+    all_banks = list(set(DEFAULT_BANKS + user_banks))
     
     buttons = []
     for bank in all_banks:
@@ -82,4 +81,9 @@ def screenshot_confirm_keyboard():
         types.InlineKeyboardButton(text="Сохранить ✅", callback_data="confirm_screenshot"),
         types.InlineKeyboardButton(text="Отмена ❌", callback_data="cancel_screenshot")
     )
-    return keyboard 
\ No newline at end of file
+    return keyboard
+
+def force_recognize_keyboard():
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.add(types.InlineKeyboardButton(text="🔍 Всё равно распознать", callback_data="force_recognize"))
+    return keyboard
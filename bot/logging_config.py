@@ -0,0 +1,184 @@
+import atexit
+import contextvars
+import copy
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from .tracing import current_trace_id
+
+# Поля, которые переносятся из extra и контекста обработчика в JSON
+CONTEXT_FIELDS = ("user_id", "handler", "stage", "duration_ms", "trace_id", "suppressed")
+
+# Контекст текущего обработчика: имя и пользователь
+_context = contextvars.ContextVar("log_context", default=None)
+
+_listener = None
+
+# Контекст добавляется в запись в потоке обработчика, до постановки в очередь
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        context = _context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        if not hasattr(record, "trace_id"):
+            trace_id = current_trace_id()
+            if trace_id:
+                record.trace_id = trace_id
+        return True
+
+# Повторяющиеся ошибки: в окне window секунд пропускается не больше burst одинаковых записей
+# (одинаковые — с тем же шаблоном сообщения), первая запись следующего окна несёт число пропущенных
+class ErrorSamplingFilter(logging.Filter):
+    def __init__(self, burst=5, window=60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            started, passed, suppressed = self.counters.get(key, (now, 0, 0))
+            if now - started >= self.window:
+                if suppressed:
+                    record.suppressed = suppressed
+                started, passed, suppressed = now, 0, 0
+            if passed >= self.burst:
+                self.counters[key] = (started, passed, suppressed + 1)
+                return False
+            self.counters[key] = (started, passed + 1, suppressed)
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        exception = getattr(record, "exception", None)
+        if record.exc_info:
+            exception = self.formatException(record.exc_info)
+        if exception:
+            entry["exception"] = exception
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# Текстовый формат для консоли; трассировка из поля exception (её отрисовал _QueueHandler)
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        exception = getattr(record, "exception", None)
+        return f"{text}\n{exception}" if exception and not record.exc_info else text
+
+# QueueHandler.prepare вписывает трассировку в текст сообщения и очищает exc_info, так что
+# форматтеры в потоке записи её уже не видят. Здесь трассировка отрисовывается в поле exception,
+# а сообщение остаётся без неё
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        exception = record.exc_text
+        if record.exc_info:
+            exception = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        if exception:
+            record.exception = exception
+        return record
+
+# Ротация по размеру со сжатием старых файлов: bot.log.1.gz, bot.log.2.gz, ...
+def _gzip_namer(name):
+    return name + ".gz"
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+# Единая настройка логирования: обработчики потоков только кладут запись в очередь,
+# форматирование и запись на диск выполняет отдельный поток QueueListener
+def setup_logging(path="bot.log", level="INFO", max_bytes=10 * 1024 * 1024, backup_count=5,
+                  error_burst=5, error_window=60.0, console=True):
+    global _listener
+    if _listener is not None:
+        return
+
+    handlers = []
+    if path:
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        file_handler.namer = _gzip_namer
+        file_handler.rotator = _gzip_rotator
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(ConsoleFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(ErrorSamplingFilter(error_burst, error_window))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Запросы httpx к GigaChat на уровне INFO забивают журнал
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+# Имя обработчика и пользователь попадают во все записи, сделанные во время его работы
+def bind_handlers(bot):
+    for handlers in (bot.message_handlers, bot.callback_query_handlers, bot.inline_handlers):
+        for handler in handlers:
+            handler["function"] = _bound(handler["function"])
+
+def _bound(function):
+    name = function.__name__
+
+    @wraps(function)
+    def wrapper(update, *args, **kwargs):
+        user = getattr(update, "from_user", None)
+        token = _context.set({"handler": name, "user_id": user.id if user else None})
+        try:
+            return function(update, *args, **kwargs)
+        finally:
+            _context.reset(token)
+
+    return wrapper
@@ -0,0 +1,234 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Метрики в текстовом формате Prometheus. Обновление — запись в словарь под блокировкой,
+# накладные расходы — около микросекунды на вызов
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        self.functions = {}
+        _registry.append(self)
+
+    # Значение вычисляется при каждом опросе (размер очереди, статистика lru_cache)
+    def set_function(self, function, *labels):
+        self.functions[labels] = function
+
+    def _samples(self):
+        with self.lock:
+            samples = [(self.name, labels, value) for labels, value in self.values.items()]
+        for labels, function in self.functions.items():
+            try:
+                samples.append((self.name, labels, function()))
+            except Exception as e:
+                logger.warning("Не удалось получить значение %s: %s", self.name, e)
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                # Счётчики по корзинам (последняя — +Inf), сумма и количество
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _samples(self):
+        with self.lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self.values.items()]
+        samples = []
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels, cumulative, (("le", _format_value(bound)),)))
+            samples.append((f"{self.name}_sum", labels, total, ()))
+            samples.append((f"{self.name}_count", labels, count, ()))
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value, extra in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+# Метрики бота
+STAGE_SECONDS = Histogram(
+    "cashback_stage_seconds", "Длительность этапов обработки скриншота и работы с базой", ["stage"]
+)
+HANDLER_SECONDS = Histogram("cashback_handler_seconds", "Длительность обработчиков Telegram", ["handler"])
+HANDLER_ERRORS = Counter("cashback_handler_errors_total", "Необработанные исключения в обработчиках", ["handler"])
+LLM_FIRST_CATEGORY_SECONDS = Histogram(
+    "cashback_llm_first_category_seconds", "Время от запроса к GigaChat до первой категории в потоке"
+)
+LLM_CALLS = Counter("cashback_llm_calls_total", "Запросы к GigaChat", ["model"])
+LLM_TOKENS = Counter("cashback_llm_tokens_total", "Токены GigaChat", ["model", "kind"])
+LLM_IMAGE_BYTES = Histogram(
+    "cashback_llm_image_bytes", "Размер изображений, отправленных в GigaChat",
+    buckets=(50_000, 100_000, 200_000, 400_000, 800_000, 1_600_000, 3_200_000)
+)
+ROUTING_DECISIONS = Counter(
+    "cashback_routing_decisions_total", "Решения маршрутизатора: первая модель и исход", ["model", "outcome"]
+)
+ROUTING_AGREEMENT = Histogram(
+    "cashback_routing_agreement", "Согласие младшей и старшей моделей", buckets=(0.0, 0.25, 0.5, 0.75, 0.9, 1.0)
+)
+PREFILTER_DECISIONS = Counter(
+    "cashback_prefilter_decisions_total", "Решения локального фильтра изображений перед GigaChat", ["outcome"]
+)
+PREFILTER_SCORE = Histogram(
+    "cashback_prefilter_score", "Оценка фильтра: вероятность, что на изображении условия кэшбэка",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9, 1.0)
+)
+RECOGNITIONS = Counter("cashback_recognitions_total", "Успешные распознавания категорий", ["source"])
+EMPTY_PARSES = Counter("cashback_empty_parses_total", "Распознавания без категорий", ["source"])
+RECOGNITION_ERRORS = Counter("cashback_recognition_errors_total", "Ошибки при распознавании скриншота")
+CACHE_HITS = Counter("cashback_cache_hits_total", "Попадания в кэши", ["cache"])
+CACHE_MISSES = Counter("cashback_cache_misses_total", "Промахи кэшей", ["cache"])
+DB_COMMITS = Counter("cashback_db_commits_total", "Фиксации транзакций SQLite", ["operation"])
+HTTP_REQUESTS = Counter("cashback_http_requests_total", "HTTP-запросы к внешним API", ["client"])
+HTTP_CONNECTIONS = Counter(
+    "cashback_http_connections_total", "Новые соединения (TCP + TLS) к внешним API; остальные запросы идут по keep-alive", ["client"]
+)
+STATEMENT_ROWS = Counter(
+    "cashback_statement_rows_total", "Строки импортированных выписок: расходы по категориям, без категории, прочие", ["outcome"]
+)
+STATEMENT_BYTES = Counter("cashback_statement_bytes_total", "Объём импортированных выписок, байт")
+EXPORT_ROWS = Counter("cashback_export_rows_total", "Строки истории, выгруженные командой /export", ["format"])
+OUTBOX_MESSAGES = Counter(
+    "cashback_outbox_messages_total", "Исходящие сообщения: отправлены, объединены, повторены после 429, ошибки", ["outcome"]
+)
+OUTBOX_DELAY = Histogram("cashback_outbox_delay_seconds", "Время сообщения в очереди исходящих до отправки")
+OUTBOX_DEPTH = Gauge("cashback_outbox_depth", "Сообщения в очереди исходящих")
+REMINDERS = Counter(
+    "cashback_reminders_total", "Напоминания о выборе категорий: отправлены, пропущены, бот заблокирован", ["outcome"]
+)
+REMINDER_LAG = Histogram(
+    "cashback_reminder_lag_seconds", "Задержка отправки напоминания после назначенного времени",
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 21600, 86400)
+)
+ACTIVE_SESSIONS = Gauge("cashback_active_sessions", "Пользователи с активной сессией")
+QUEUE_DEPTH = Gauge("cashback_queue_depth", "Обновления, ожидающие свободного потока обработки")
+
+def render():
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+# Замер времени и ошибок всех зарегистрированных обработчиков сообщений и кнопок
+def instrument_handlers(bot):
+    for handlers in (bot.message_handlers, bot.callback_query_handlers, bot.inline_handlers):
+        for handler in handlers:
+            handler["function"] = _timed(handler["function"])
+
+def _timed(function):
+    name = function.__name__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+# Локальный HTTP-эндпоинт /metrics в фоновом потоке
+def start_metrics_server(port, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, server.server_address[1])
+    return server
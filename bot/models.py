@@ -8,6 +8,7 @@ class CashbackCategory(BaseModel):
 
 class CashbackResponse(BaseModel):
     categories: List[CashbackCategory] = Field(..., description="Список категорий с кешбэком")
+    bank: Optional[str] = Field(None, description="Банк, если он виден на скриншоте")
 
 class UserSession:
     def __init__(self):
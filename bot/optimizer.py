@@ -0,0 +1,161 @@
+import itertools
+import logging
+import numpy as np
+
+from .config import BANK_CATEGORY_PICKS, OPTIMIZER_DEFAULT_PICKS, OPTIMIZER_MAX_SUBSETS
+from .categories import find_bank
+
+logger = logging.getLogger(__name__)
+
+# Подбор категорий на месяц: в каждом банке из предложенных категорий выбирается не больше
+# BANK_CATEGORY_PICKS[банк], покупка в категории оплачивается картой с наибольшим выбранным
+# процентом. Цель — максимум суммы spend[категория] * процент / 100 за месяц.
+#
+# Категория, выбранная в банке, который за неё не платит, ничего не добавляет, поэтому задача
+# сводится к назначению: каждая категория — не больше чем одному банку, банку — не больше picks
+# категорий. Оно решается точно венгерским алгоритмом, где у банка picks одинаковых мест.
+# При ограничении на число карт перебираются наборы банков: оценки сверху для всех наборов
+# считаются одной операцией NumPy, назначение решается по убыванию оценки, пока она не станет
+# меньше найденного результата. Если наборов больше OPTIMIZER_MAX_SUBSETS — жадный выбор банков
+# с заменами по одному
+
+def _picks(bank):
+    return BANK_CATEGORY_PICKS.get(find_bank(bank) or bank, OPTIMIZER_DEFAULT_PICKS)
+
+# Венгерский алгоритм (потенциалы и кратчайшие увеличивающие пути), строк не больше, чем столбцов.
+# Возвращает столбец для каждой строки с минимальной суммой cost
+def _assign(cost):
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        owner[0] = row
+        column = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current = owner[column]
+            reduced = cost[current - 1] - u[current] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(free, minv[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+    result = np.full(n, -1)
+    assigned = np.flatnonzero(owner[1:])
+    result[owner[1:][assigned] - 1] = assigned
+    return result
+
+class Problem:
+    def __init__(self, rates, spend, picks=None, max_cards=None):
+        picks = picks or {}
+        self.categories = sorted(cat for cat, amount in spend.items() if amount > 0 and rates.get(cat))
+        self.spend = np.array([spend[cat] for cat in self.categories], dtype=np.float64)
+        self.banks = sorted({bank for cat in self.categories for bank in rates[cat]})
+        self.max_cards = max_cards
+        self.rates = np.zeros((len(self.banks), len(self.categories)))
+        for j, cat in enumerate(self.categories):
+            for bank, amount in rates[cat].items():
+                self.rates[self.banks.index(bank), j] = amount
+        # Кэшбэк в рублях, если категорией платить картой банка
+        self.weights = self.rates * self.spend / 100
+        self.picks = np.array([min(picks.get(bank, _picks(bank)), len(self.categories)) for bank in self.banks])
+        # Банк в одиночку: сумма picks лучших категорий
+        ranked = -np.sort(-self.weights, axis=1)
+        self.alone = np.array([ranked[b, :self.picks[b]].sum() for b in range(len(self.banks))])
+
+    # Лучшее назначение категорий банкам набора: (сумма, банк для каждой категории или -1)
+    def solve(self, banks):
+        banks = np.asarray(banks, dtype=np.int64)
+        slots = np.repeat(banks, self.picks[banks])
+        # Фиктивные столбцы с нулём — категорией не платить картой с повышенным кэшбэком
+        cost = np.hstack([-self.weights[slots].T, np.zeros((len(self.categories), len(self.categories)))])
+        columns = _assign(cost)
+        payers = np.full(len(self.categories), -1)
+        for j, column in enumerate(columns):
+            if column < len(slots) and self.weights[slots[column], j] > 0:
+                payers[j] = slots[column]
+        total = float(sum(self.weights[b, j] for j, b in enumerate(payers) if b >= 0))
+        return total, payers
+
+    # Оценка сверху для наборов банков (строки subsets): меньшая из двух — каждая категория
+    # по лучшему проценту в наборе без учёта мест и сумма банков в одиночку
+    def bounds(self, subsets):
+        by_category = self.weights[subsets].max(axis=1).sum(axis=1)
+        return np.minimum(by_category, self.alone[subsets].sum(axis=1))
+
+    def exact(self, size):
+        subsets = np.array(list(itertools.combinations(range(len(self.banks)), size)))
+        bounds = self.bounds(subsets)
+        best = (-1.0, None)
+        for index in np.argsort(-bounds):
+            if bounds[index] <= best[0] + 1e-9:
+                break
+            result = self.solve(subsets[index])
+            if result[0] > best[0]:
+                best = result
+        return best
+
+    def greedy(self, size):
+        chosen = []
+        best = None
+        for _ in range(size):
+            candidates = [(self.solve(chosen + [b]), b) for b in range(len(self.banks)) if b not in chosen]
+            best, bank = max(candidates, key=lambda item: item[0][0])
+            chosen.append(bank)
+        # Замены по одному банку, пока итог растёт
+        improved = True
+        while improved:
+            improved = False
+            for position in range(len(chosen)):
+                for bank in range(len(self.banks)):
+                    if bank in chosen:
+                        continue
+                    trial = chosen[:position] + [bank] + chosen[position + 1:]
+                    result = self.solve(trial)
+                    if result[0] > best[0] + 1e-9:
+                        chosen, best, improved = trial, result, True
+        return best
+
+    def describe(self, total, payers, method):
+        cards = {}
+        payments = {}
+        for j, bank in enumerate(payers):
+            if bank < 0:
+                continue
+            name = self.banks[bank]
+            cards.setdefault(name, []).append(self.categories[j])
+            payments[self.categories[j]] = (name, float(self.rates[bank, j]), float(self.weights[bank, j]))
+        return {"total": total, "cards": cards, "payments": payments, "method": method}
+
+# rates: {категория: {банк: процент}}, spend: {категория: рублей в месяц}.
+# Возвращает выбранные категории по картам, карту и кэшбэк для каждой категории и итог за месяц
+def optimize(rates, spend, picks=None, max_cards=None):
+    problem = Problem(rates, spend, picks, max_cards)
+    if not problem.banks:
+        return {"total": 0.0, "cards": {}, "payments": {}, "method": "exact"}
+    if max_cards is None or max_cards >= len(problem.banks):
+        return problem.describe(*problem.solve(np.arange(len(problem.banks))), "exact")
+    size = max(1, max_cards)
+    subsets = 1
+    for k in range(size):
+        subsets = subsets * (len(problem.banks) - k) // (k + 1)
+    if subsets <= OPTIMIZER_MAX_SUBSETS:
+        return problem.describe(*problem.exact(size), "exact")
+    logger.info("Подбор категорий: %d наборов из %d банков, жадный выбор", subsets, len(problem.banks))
+    return problem.describe(*problem.greedy(size), "greedy")
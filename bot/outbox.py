@@ -0,0 +1,250 @@
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from telebot import types
+from telebot.apihelper import ApiTelegramException
+
+from .config import (
+    OUTBOX_GLOBAL_RATE, OUTBOX_GLOBAL_BURST, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST, OUTBOX_WORKERS, OUTBOX_MAX_RETRIES
+)
+from .metrics import OUTBOX_MESSAGES, OUTBOX_DELAY, OUTBOX_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Предел длины текста сообщения в Telegram
+MAX_MESSAGE_LENGTH = 4096
+# Корзины чатов без очереди удаляются, когда их становится больше
+MAX_IDLE_BUCKETS = 10000
+
+# Корзина токенов: rate токенов в секунду, не больше capacity подряд
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Сколько секунд ждать свободного токена (0 — можно отправлять)
+    def delay(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+# На какое сообщение отвечает отправка: ReplyParameters не сравниваются по значению
+def _reply_target(kwargs):
+    reply = kwargs.get("reply_parameters")
+    return None if reply is None else (reply.message_id, reply.chat_id)
+
+# Сообщение или правка в очереди. Несколько вызовов, объединённых в один запрос, получают
+# один и тот же результат
+class _Item:
+    def __init__(self, method, chat_id, text, kwargs, target=None, coalesce=True):
+        self.method = method
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.target = target
+        self.coalesce = coalesce
+        self.futures = [Future()]
+        self.parts = 1
+        self.attempts = 0
+        self.created = time.monotonic()
+        # Контекст журнала и трассировки обработчика, который поставил сообщение в очередь
+        self.context = contextvars.copy_context()
+
+# Очередь исходящих сообщений. Обработчики ставят сообщение в очередь и сразу возвращаются
+# (результат — Future с types.Message). Диспетчер выбирает чаты по кругу с учётом общей корзины
+# токенов и корзины чата; в каждом чате не больше одного запроса одновременно, поэтому порядок
+# сообщений сохраняется. Ответ 429 возвращает сообщение в начало очереди чата и приостанавливает
+# чат на retry_after секунд.
+#
+# Пока сообщение ждёт в очереди, к нему присоединяются следующие в тот же чат: текст без
+# inline-кнопок дополняется следующим текстом, повторная правка заменяет прежнюю, правка ещё не
+# отправленного сообщения меняет его текст
+class Outbox:
+    def __init__(self, bot, global_rate=OUTBOX_GLOBAL_RATE, global_burst=OUTBOX_GLOBAL_BURST,
+                 chat_rate=OUTBOX_CHAT_RATE, chat_burst=OUTBOX_CHAT_BURST, workers=OUTBOX_WORKERS,
+                 max_retries=OUTBOX_MAX_RETRIES):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.buckets = {}
+        # chat_id -> очередь; порядок ключей — очередь чатов на отправку
+        self.queues = {}
+        self.busy = set()
+        self.paused = {}
+        self.pending = 0
+        self.condition = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox")
+        threading.Thread(target=self._dispatch, name="outbox", daemon=True).start()
+        OUTBOX_DEPTH.set_function(lambda: self.pending)
+
+    def send_message(self, chat_id, text, coalesce=True, **kwargs):
+        return self._put(_Item("send", chat_id, text, kwargs, coalesce=coalesce))
+
+    def reply_to(self, message, text, **kwargs):
+        kwargs.setdefault("reply_parameters", types.ReplyParameters(message.message_id))
+        return self.send_message(message.chat.id, text, **kwargs)
+
+    # message — types.Message, его message_id или Future от send_message
+    def edit_message_text(self, text, chat_id, message, **kwargs):
+        return self._put(_Item("edit", chat_id, text, kwargs, target=message))
+
+    # Ожидание, пока очередь опустеет (бенчмарки, остановка бота)
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending or self.busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def _put(self, item):
+        future = item.futures[0]
+        with self.condition:
+            queue = self.queues.get(item.chat_id)
+            if queue and self._merge(queue[-1], item):
+                last = queue[-1]
+                last.futures.append(future)
+                OUTBOX_MESSAGES.inc("coalesced")
+                return future
+            if queue is None:
+                queue = self.queues[item.chat_id] = deque()
+            queue.append(item)
+            self.pending += 1
+            # Ждать могут и диспетчер, и flush
+            self.condition.notify_all()
+        return future
+
+    @staticmethod
+    def _merge(last, item):
+        if last.method == "send" and item.method == "send":
+            text = last.text + "\n\n" + item.text
+            # Inline-кнопки относятся к тексту своего сообщения; клавиатура под полем ввода просто
+            # заменяется следующей
+            inline = isinstance(item.kwargs.get("reply_markup"), types.InlineKeyboardMarkup)
+            markup = last.kwargs.get("reply_markup")
+            if not (last.coalesce and item.coalesce) \
+                    or isinstance(markup, types.InlineKeyboardMarkup) or (markup is not None and inline) \
+                    or last.kwargs.get("parse_mode") != item.kwargs.get("parse_mode") \
+                    or _reply_target(last.kwargs) != _reply_target(item.kwargs) \
+                    or len(text) > MAX_MESSAGE_LENGTH:
+                return False
+            last.text = text
+            last.parts += 1
+            if item.kwargs.get("reply_markup") is not None:
+                last.kwargs["reply_markup"] = item.kwargs["reply_markup"]
+            return True
+        if item.method != "edit":
+            return False
+        # Правка сообщения, которое ещё не отправлено и не объединено с другими, — новый текст отправки
+        if last.method == "send" and last.parts == 1 and item.target is last.futures[0]:
+            last.text = item.text
+            last.kwargs.update(item.kwargs)
+            return True
+        if last.method == "edit" and last.target is item.target:
+            last.text = item.text
+            last.kwargs = item.kwargs
+            return True
+        return False
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                item, wait = self._next(time.monotonic())
+                if item is None:
+                    self.condition.wait(wait)
+                    continue
+            self.pool.submit(item.context.run, self._send, item)
+
+    # Следующее сообщение, которое можно отправить сейчас, или сколько ждать
+    def _next(self, now):
+        wait = self.global_bucket.delay(now)
+        if wait:
+            return None, wait
+        wait = None
+        for chat_id, queue in self.queues.items():
+            if chat_id in self.busy:
+                continue
+            bucket = self.buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            delay = max(self.paused.get(chat_id, 0.0) - now, bucket.delay(now))
+            if delay > 0:
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            item = queue.popleft()
+            self.pending -= 1
+            # Чат уходит в конец круга
+            del self.queues[chat_id]
+            if queue:
+                self.queues[chat_id] = queue
+            self.paused.pop(chat_id, None)
+            self.busy.add(chat_id)
+            bucket.take(now)
+            self.global_bucket.take(now)
+            if len(self.buckets) > MAX_IDLE_BUCKETS:
+                self._prune(now)
+            return item, None
+        return None, wait
+
+    def _prune(self, now):
+        for chat_id in [chat_id for chat_id, bucket in self.buckets.items()
+                        if chat_id not in self.queues and chat_id not in self.busy and bucket.full(now)]:
+            del self.buckets[chat_id]
+
+    def _send(self, item):
+        try:
+            if item.method == "send":
+                result = self.bot.send_message(item.chat_id, item.text, **item.kwargs)
+            else:
+                target = item.target.result() if isinstance(item.target, Future) else item.target
+                message_id = getattr(target, "message_id", target)
+                result = self.bot.edit_message_text(item.text, item.chat_id, message_id, **item.kwargs)
+        except ApiTelegramException as e:
+            retry_after = ((e.result_json or {}).get("parameters") or {}).get("retry_after")
+            if e.error_code == 429 and item.attempts < self.max_retries:
+                item.attempts += 1
+                OUTBOX_MESSAGES.inc("retried")
+                logger.warning("Лимит Telegram для чата %s, повтор через %s с", item.chat_id, retry_after)
+                with self.condition:
+                    self.paused[item.chat_id] = time.monotonic() + float(retry_after or 1)
+                    self.queues.setdefault(item.chat_id, deque()).appendleft(item)
+                    self.pending += 1
+            else:
+                self._fail(item, e)
+        except Exception as e:
+            self._fail(item, e)
+        else:
+            OUTBOX_MESSAGES.inc("sent")
+            OUTBOX_DELAY.observe(time.monotonic() - item.created)
+            for future in item.futures:
+                future.set_result(result)
+        finally:
+            with self.condition:
+                self.busy.discard(item.chat_id)
+                self.condition.notify_all()
+
+    def _fail(self, item, error):
+        OUTBOX_MESSAGES.inc("failed")
+        logger.error("Не удалось отправить сообщение в чат %s: %s", item.chat_id, error)
+        for future in item.futures:
+            future.set_exception(error)
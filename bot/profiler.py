@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import logging
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Интервал опроса стеков, секунды
+SAMPLE_INTERVAL = 0.005
+
+_running = threading.Lock()
+
+# Семплирующий профилировщик: раз в SAMPLE_INTERVAL снимаются стеки всех потоков, кроме своего.
+# В отличие от cProfile видит все потоки TeleBot и не замедляет обработку
+def sample_stacks(seconds, interval=SAMPLE_INTERVAL):
+    own = threading.get_ident()
+    names = {}
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if not names.get(thread_id):
+                thread = threading._active.get(thread_id)
+                names[thread_id] = thread.name if thread else str(thread_id)
+            stacks[(names[thread_id],) + tuple(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+def format_stacks(stacks, samples, seconds, top=40):
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for frame in set(stack[1:]):
+            total[frame] += count
+    lines = [f"Семплирование {seconds} с, {samples} опросов, интервал {SAMPLE_INTERVAL * 1000:.0f} мс", ""]
+    lines.append("Собственное время (верх стека):")
+    lines += [f"{count:8d}  {frame}" for frame, count in own.most_common(top)]
+    lines += ["", "Включая вызванные функции:"]
+    lines += [f"{count:8d}  {frame}" for frame, count in total.most_common(top)]
+    # Свёрнутые стеки в формате flamegraph.pl / speedscope
+    lines += ["", "Стеки:"]
+    lines += [";".join(stack) + f" {count}" for stack, count in stacks.most_common()]
+    return "\n".join(lines) + "\n"
+
+def memory_report(seconds, top=40):
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+    before = tracemalloc.take_snapshot()
+    time.sleep(seconds)
+    after = tracemalloc.take_snapshot()
+    if started_here:
+        tracemalloc.stop()
+    current = after.statistics("lineno")
+    growth = after.compare_to(before, "lineno")
+    lines = [f"Снимки tracemalloc с интервалом {seconds} с", ""]
+    lines.append("Прирост за интервал:")
+    lines += [str(stat) for stat in growth[:top]]
+    lines += ["", "Крупнейшие выделения:"]
+    lines += [str(stat) for stat in current[:top]]
+    return "\n".join(lines) + "\n"
+
+# Профилирование в фоновом потоке; по окончании отчёт пишется в directory и передаётся в on_done.
+# Одновременно идёт только одна сессия
+def start_profiling(seconds, mode, directory, on_done):
+    if not _running.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            if mode == "mem":
+                report = memory_report(seconds)
+            else:
+                stacks, samples = sample_stacks(seconds)
+                report = format_stacks(stacks, samples, seconds)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"profile-{mode}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(report)
+            on_done(path, None)
+        except Exception as e:
+            logger.error("Ошибка профилирования: %s", e)
+            on_done(None, e)
+        finally:
+            _running.release()
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+    return True
@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Тексты кнопок и команды сохраняются как есть, остальной текст маскируется
+KNOWN_TEXTS = {
+    "➕ Добавить информацию", "🔄 Сбросить данные", "📊 Показать сводку",
+    "Выбрать банк", "Назад", "Ручной ввод", "Скриншот",
+}
+# Данные кнопок без пользовательских значений; у остальных (bank_<банк>, resetbank_<банк>,
+# reset_<банк>, cat_<категория>) после префикса маскируется название
+KNOWN_CALLBACKS = {
+    "bank_other", "cat_other", "reset_all", "reset_all_confirm", "reset_cancel", "confirm_screenshot",
+    "cancel_screenshot", "force_recognize", "add_more", "back_main",
+}
+_NUMERIC_RE = re.compile(r"^[\d\s.,%]+$")
+_LETTER_RE = re.compile(r"[^\W\d_]")
+
+# Запись обновлений в компактный журнал (gzip, JSON Lines) для последующего воспроизведения.
+# Идентификаторы пользователей заменяются HMAC-хэшем, имена не сохраняются, свободный текст маскируется
+class UpdateRecorder:
+    def __init__(self, path, salt=None):
+        self.path = path
+        self.salt = (salt or os.urandom(16).hex()).encode()
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, "at", encoding="utf-8")
+
+    def anonymize_user(self, user_id):
+        digest = hmac.new(self.salt, str(user_id).encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:6], "big")
+
+    @staticmethod
+    def anonymize_text(text):
+        if text in KNOWN_TEXTS or _NUMERIC_RE.match(text):
+            return text
+        if text.startswith("/"):
+            return text.split()[0]
+        return _LETTER_RE.sub("x", text)
+
+    @staticmethod
+    def anonymize_callback(data):
+        prefix, separator, value = data.partition("_")
+        if data in KNOWN_CALLBACKS or not separator:
+            return data
+        return prefix + separator + _LETTER_RE.sub("x", value)
+
+    def _entry(self, update):
+        if update.message:
+            message = update.message
+            entry = {"u": self.anonymize_user(message.from_user.id)}
+            if message.content_type == "photo":
+                entry["k"] = "p"
+                if message.caption:
+                    entry["x"] = self.anonymize_text(message.caption)
+            elif message.content_type == "text":
+                entry["k"] = "m"
+                entry["x"] = self.anonymize_text(message.text)
+            else:
+                return None
+            return entry
+        if update.callback_query:
+            call = update.callback_query
+            return {"u": self.anonymize_user(call.from_user.id), "k": "c", "x": self.anonymize_callback(call.data)}
+        if update.inline_query:
+            query = update.inline_query
+            return {"u": self.anonymize_user(query.from_user.id), "k": "i", "x": self.anonymize_text(query.query)}
+        return None
+
+    def record(self, updates):
+        elapsed = int((time.monotonic() - self.started) * 1000)
+        lines = []
+        for update in updates:
+            try:
+                entry = self._entry(update)
+            except Exception as e:
+                logger.warning("Не удалось записать обновление: %s", e)
+                continue
+            if entry:
+                entry["t"] = elapsed
+                lines.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+        if not lines:
+            return
+        with self.lock:
+            self.file.write("\n".join(lines) + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# Подключение записи к боту: каждая пачка обновлений пишется в журнал перед обработкой
+def attach_recorder(bot, path, salt=None):
+    recorder = UpdateRecorder(path, salt)
+    process_new_updates = bot.process_new_updates
+
+    def process_and_record(updates):
+        recorder.record(updates)
+        process_new_updates(updates)
+
+    bot.process_new_updates = process_and_record
+    return recorder
+
+def read_log(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
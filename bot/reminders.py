@@ -0,0 +1,218 @@
+import heapq
+import threading
+import time
+import zlib
+import logging
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from telebot.apihelper import ApiTelegramException
+
+from .config import (
+    REMINDER_HOUR, REMINDER_TIMEZONE, REMINDER_JITTER, REMINDER_RATE, REMINDER_BATCH, REMINDER_ACTIVE_MONTHS,
+    REMINDER_MAX_LATE, REMINDER_WINDOW, REMINDER_MAX_PENDING
+)
+from .database import (
+    add_change_listener, add_reminders, claim_reminders, disable_reminder, get_active_users, get_due_reminders,
+    get_reminder, get_reminder_users, get_unscheduled_users, set_reminder
+)
+from .keyboards import main_menu_keyboard
+from .metrics import REMINDERS, REMINDER_LAG
+
+logger = logging.getLogger(__name__)
+
+REMINDER_TEXT = (
+    "📅 Начался новый месяц — пора выбрать категории кэшбэка в банках и обновить данные в боте.\n"
+    "Отключить напоминания: /remind off"
+)
+
+@lru_cache(maxsize=None)
+def get_zone(timezone):
+    return ZoneInfo(timezone or REMINDER_TIMEZONE)
+
+# Проверка названия часового пояса из базы tz: "Asia/Yekaterinburg"
+def valid_timezone(timezone):
+    try:
+        get_zone(timezone)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+def shift_period(period, months):
+    year, month = divmod(int(period[:4]) * 12 + int(period[5:7]) - 1 + months, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+def local_period(timezone, now):
+    return datetime.fromtimestamp(now, get_zone(timezone)).strftime("%Y-%m")
+
+# Время напоминания о месяце period: первое число в REMINDER_HOUR по местному времени плюс
+# сдвиг до REMINDER_JITTER секунд. Сдвиг зависит только от пользователя и месяца, поэтому после
+# перезапуска время получается тем же, а отправка не собирается в одну секунду
+def reminder_time(user_id, timezone, period):
+    start = datetime(int(period[:4]), int(period[5:7]), 1, REMINDER_HOUR, tzinfo=get_zone(timezone))
+    return int(start.timestamp()) + zlib.crc32(f"{user_id}:{period}".encode()) % REMINDER_JITTER
+
+# Ближайшее напоминание — о следующем месяце по местному времени
+def next_reminder(user_id, timezone, now):
+    period = shift_period(local_period(timezone, now), 1)
+    return period, reminder_time(user_id, timezone, period)
+
+# Напоминания в начале месяца. Источник истины — таблица reminders (месяц и время отправки
+# каждого пользователя); в памяти куча только тех, что наступают в ближайшие REMINDER_WINDOW
+# секунд, она дочитывается из базы по индексу due_at. Наступившие напоминания отправляются
+# пачками не быстрее REMINDER_RATE в секунду через очередь исходящих. Перед отправкой строка
+# переносится на следующий месяц (claim_reminders), и отправляется только перенесённое: запись
+# в куче, устаревшая после смены часового пояса, или повтор после перезапуска не проходят
+class ReminderScheduler:
+    def __init__(self, rate=REMINDER_RATE, batch=REMINDER_BATCH, window=REMINDER_WINDOW, clock=time.time):
+        self.outbox = None
+        self.rate = rate
+        self.batch = batch
+        self.window = window
+        self.clock = clock
+        self.heap = []
+        self.loaded_until = 0
+        self.known = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+
+    # Назначение напоминаний пользователям без них (первый запуск, пользователи из старой базы)
+    # и подписка на новых
+    def load(self):
+        self.known = get_reminder_users()
+        missing = get_unscheduled_users()
+        if missing:
+            self.register(missing)
+            logger.info("Назначены напоминания %d пользователям", len(missing))
+        add_change_listener(self.user_changed)
+
+    def start(self, outbox):
+        self.outbox = outbox
+        self.load()
+        threading.Thread(target=self._run, name="reminders", daemon=True).start()
+
+    def user_changed(self, user_id):
+        if user_id not in self.known:
+            self.register([user_id])
+
+    def register(self, user_ids, timezone=None):
+        now = self.clock()
+        rows = [(user_id, timezone, *next_reminder(user_id, timezone, now)) for user_id in user_ids]
+        add_reminders(rows)
+        with self.lock:
+            self.known.update(user_ids)
+            for user_id, timezone, period, due_at in rows:
+                self._push(due_at, user_id, timezone, period)
+
+    # (timezone, enabled, период, due_at); пользователь без записи получает её
+    def get(self, user_id):
+        reminder = get_reminder(user_id)
+        if reminder is None:
+            self.register([user_id])
+            reminder = get_reminder(user_id)
+        return reminder
+
+    # Смена часового пояса или включение: время пересчитывается для того же месяца, а если оно
+    # уже прошло — для следующего
+    def update(self, user_id, timezone=None, enabled=None):
+        current_timezone, current_enabled, period, _ = self.get(user_id)
+        timezone = current_timezone if timezone is None else timezone
+        enabled = bool(current_enabled) if enabled is None else enabled
+        due_at = reminder_time(user_id, timezone, period)
+        if due_at <= self.clock():
+            period, due_at = next_reminder(user_id, timezone, self.clock())
+        set_reminder(user_id, timezone, enabled, period, due_at)
+        if enabled:
+            with self.lock:
+                self._push(due_at, user_id, timezone, period)
+        return timezone, enabled, period, due_at
+
+    # Запись попадает в кучу, если её время уже в загруженном окне; иначе её прочитает _refill
+    def _push(self, due_at, user_id, timezone, period):
+        if due_at < self.loaded_until:
+            heapq.heappush(self.heap, (due_at, user_id, timezone, period))
+            self.wake.set()
+
+    def _refill(self, now):
+        until = now + self.window
+        rows = get_due_reminders(self.loaded_until, until)
+        for row in rows:
+            heapq.heappush(self.heap, row)
+        self.loaded_until = until
+        if rows:
+            logger.debug("Загружено напоминаний: %d", len(rows))
+
+    # Один шаг: отправка пачки наступивших напоминаний. Возвращает, сколько секунд ждать следующего
+    def run_once(self, now):
+        with self.lock:
+            if now + self.window / 2 >= self.loaded_until:
+                self._refill(now)
+            due = []
+            while self.heap and self.heap[0][0] <= now and len(due) < self.batch:
+                due.append(heapq.heappop(self.heap))
+            if not due:
+                wait = self.loaded_until - self.window / 2 - now
+                return min(wait, self.heap[0][0] - now) if self.heap else wait
+        return self._process(due, now) / self.rate
+
+    def _process(self, due, now):
+        claims = []
+        late = set()
+        for due_at, user_id, timezone, period in due:
+            if now - due_at > REMINDER_MAX_LATE:
+                # Бот не работал дольше допустимого: о прошедшем месяце не напоминаем
+                late.add(user_id)
+                claims.append((user_id, period, due_at, *next_reminder(user_id, timezone, now)))
+            else:
+                next_period = shift_period(period, 1)
+                claims.append((user_id, period, due_at, next_period, reminder_time(user_id, timezone, next_period)))
+        claimed = claim_reminders(claims)
+        # Пачка обычно об одном месяце; активность проверяется одним запросом на месяц
+        periods = {}
+        for due_at, user_id, timezone, period in due:
+            periods.setdefault(period, []).append(user_id)
+        active = set()
+        for period, user_ids in periods.items():
+            active |= get_active_users(user_ids, shift_period(period, -REMINDER_ACTIVE_MONTHS))
+        sent = 0
+        due_at_by_user = {user_id: due_at for due_at, user_id, _, _ in due}
+        for user_id in claimed:
+            if user_id in late:
+                REMINDERS.inc("late")
+            elif user_id not in active:
+                REMINDERS.inc("inactive")
+            else:
+                future = self.outbox.send_message(user_id, REMINDER_TEXT, reply_markup=main_menu_keyboard())
+                future.add_done_callback(lambda future, user_id=user_id: self._sent(future, user_id))
+                REMINDER_LAG.observe(max(0.0, now - due_at_by_user[user_id]))
+                sent += 1
+        return sent
+
+    def _sent(self, future, user_id):
+        error = future.exception()
+        if error is None:
+            REMINDERS.inc("sent")
+        elif isinstance(error, ApiTelegramException) and error.error_code == 403:
+            # Пользователь заблокировал бота
+            REMINDERS.inc("blocked")
+            disable_reminder(user_id)
+        else:
+            REMINDERS.inc("failed")
+
+    def _run(self):
+        while True:
+            try:
+                if self.outbox.pending > REMINDER_MAX_PENDING:
+                    wait = 1.0
+                else:
+                    wait = self.run_once(self.clock())
+            except Exception as e:
+                logger.error("Ошибка отправки напоминаний: %s", e)
+                wait = 60.0
+            self.wake.wait(max(wait, 0.0))
+            self.wake.clear()
+
+reminder_scheduler = ReminderScheduler()
+
+def start_reminders(outbox):
+    reminder_scheduler.start(outbox)
@@ -0,0 +1,61 @@
+import os
+import logging
+from PIL import Image, ImageFilter
+
+from .config import (
+    ROUTING_MIN_AMOUNT, ROUTING_MAX_AMOUNT, ROUTING_MAX_UNKNOWN_SHARE,
+    ROUTING_COMPLEX_ASPECT, ROUTING_COMPLEX_EDGE_DENSITY
+)
+from .categories import find_category
+
+logger = logging.getLogger(__name__)
+
+# Ширина уменьшенной копии для оценки сложности изображения
+FEATURE_WIDTH = 256
+# Порог яркости на карте границ, выше которого пиксель считается границей
+EDGE_THRESHOLD = 32
+
+# Признаки изображения для выбора модели: размеры, вытянутость и плотность границ
+# (много текста, баннеров и иконок — высокая плотность)
+def image_features(file_path):
+    features = {"bytes": os.path.getsize(file_path)}
+    try:
+        with Image.open(file_path) as image:
+            width, height = image.size
+            gray = image.convert("L")
+            gray = gray.resize((FEATURE_WIDTH, max(1, round(height * FEATURE_WIDTH / width))))
+        histogram = gray.filter(ImageFilter.FIND_EDGES).histogram()
+        features.update({
+            "width": width,
+            "height": height,
+            "aspect": height / width,
+            "edge_density": sum(histogram[EDGE_THRESHOLD:]) / sum(histogram),
+        })
+    except Exception as e:
+        logger.warning("Не удалось оценить изображение: %s", e)
+    features["complex"] = (
+        features.get("aspect", 0) >= ROUTING_COMPLEX_ASPECT
+        or features.get("edge_density", 0) >= ROUTING_COMPLEX_EDGE_DENSITY
+    )
+    return features
+
+# Причина перейти к более точной модели или None, если результату можно доверять
+def escalation_reason(categories, parse_tier):
+    if not categories:
+        return "empty"
+    if parse_tier == "repaired":
+        return "repaired"
+    if any(not ROUTING_MIN_AMOUNT <= cat.amount <= ROUTING_MAX_AMOUNT for cat in categories):
+        return "amount"
+    unknown = sum(find_category(cat.category) is None for cat in categories)
+    if unknown / len(categories) > ROUTING_MAX_UNKNOWN_SHARE:
+        return "unknown_categories"
+    return None
+
+# Согласие двух результатов: доля совпавших пар категория/процент (коэффициент Жаккара)
+def agreement(first, second):
+    a = {(cat.category, float(cat.amount)) for cat in first}
+    b = {(cat.category, float(cat.amount)) for cat in second}
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,321 @@
+import csv
+import io
+import itertools
+import os
+import re
+import time
+import logging
+import zipfile
+from xml.etree import ElementTree
+import numpy as np
+import pandas as pd
+
+from .config import STATEMENT_CHUNK_ROWS, MCC_CATEGORIES, MERCHANT_KEYWORDS, CATEGORY_SYNONYMS
+from .database import replace_spending
+from .categories import normalize_category, find_category
+from .metrics import STAGE_SECONDS, STATEMENT_ROWS, STATEMENT_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк в начале файла просматривается в поисках заголовка (перед ним бывает шапка выписки)
+HEADER_SEARCH_ROWS = 50
+SAMPLE_BYTES = 64 * 1024
+
+# Названия столбцов в выгрузках банков, по убыванию приоритета
+COLUMN_NAMES = {
+    "date": ["дата операции", "дата", "date"],
+    "amount": ["сумма операции", "сумма в валюте счета", "сумма", "amount"],
+    "category": ["категория", "category"],
+    "mcc": ["mcc"],
+    "description": ["описание", "назначение", "контрагент", "место", "description", "merchant"],
+    "status": ["статус", "status"],
+}
+_FAILED_RE = re.compile(r"fail|отклон|отмен", re.IGNORECASE)
+_SPACES_RE = re.compile(r"[\s ]")
+_GROUPING_RE = re.compile(r"[.,](?=.*[.,])")
+_DAY_FIRST_RE = r"(?P<day>\d{1,2})\.(?P<month>\d{2})\.(?P<year>\d{4})"
+_ISO_RE = r"(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})"
+
+# Словари для классификации: точные названия (канонические и синонимы) и части названий магазинов
+_EXACT = {}
+for _canonical, _variants in CATEGORY_SYNONYMS.items():
+    for _variant in [_canonical, *_variants]:
+        _EXACT.setdefault(normalize_category(_variant), _canonical)
+_KEYWORDS = dict(_EXACT)
+for _canonical, _variants in MERCHANT_KEYWORDS.items():
+    for _variant in _variants:
+        _KEYWORDS.setdefault(_variant.lower().replace("ё", "е"), _canonical)
+# Одна альтернатива на все ключевые слова, длинные раньше коротких; совпадение с начала слова
+_KEYWORDS_RE = re.compile(
+    r"(?<![^\W\d_])(" + "|".join(re.escape(word) for word in sorted(_KEYWORDS, key=len, reverse=True)) + ")"
+)
+_MCC = {code: category for category, codes in MCC_CATEGORIES.items() for code in codes}
+
+# Выписку нельзя разобрать; текст показывается пользователю
+class StatementError(ValueError):
+    pass
+
+_XLSX = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_XLSX_RELATIONSHIP = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+def _find_columns(header):
+    names = [str(name).strip().lower() if name is not None else "" for name in header]
+    columns = {}
+    for role, variants in COLUMN_NAMES.items():
+        for variant in variants:
+            matches = [i for i, name in enumerate(names) if name == variant] or \
+                      [i for i, name in enumerate(names) if name.startswith(variant)]
+            if matches:
+                columns[role] = matches[0]
+                break
+    if "date" not in columns or "amount" not in columns:
+        return None
+    return columns
+
+# Категории для уникальных строк: сначала точное совпадение со словарём категорий, затем ключевые
+# слова (одно регулярное выражение на весь столбец), для коротких названий категорий банка — нечёткий поиск
+def _classify(texts, fuzzy=False):
+    normalized = texts.str.lower().str.replace("ё", "е", regex=False)
+    result = normalized.map(lambda text: _EXACT.get(normalize_category(text)))
+    missing = result.isna()
+    if missing.any():
+        found = normalized[missing].str.extract(_KEYWORDS_RE, expand=False)
+        result[missing] = found.map(_KEYWORDS)
+    if fuzzy:
+        missing = result.isna()
+        result[missing] = normalized[missing].map(find_category)
+    return result
+
+def _lookup(values, fuzzy=False):
+    codes, uniques = pd.factorize(values)
+    if not len(uniques):
+        return pd.Series([None] * len(values), index=values.index, dtype=object)
+    categories = _classify(pd.Series(uniques, dtype=object).astype(str), fuzzy).to_numpy()
+    result = pd.Series(categories[codes], index=values.index, dtype=object)
+    result[codes < 0] = None
+    return result
+
+# Суммы, которые read_csv не разобрал сам: "1 234,56", "1,234.56", "1.234,56". Дробная часть —
+# после последнего разделителя, остальные разделители — разряды
+def _amounts(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    values = values.astype(str).str.replace(_SPACES_RE, "", regex=True) \
+        .str.replace(_GROUPING_RE, "", regex=True).str.replace(",", ".", regex=False)
+    return pd.to_numeric(values, errors="coerce")
+
+# Значение функции для каждой строки столбца, посчитанное по уникальным значениям:
+# статусы, MCC и категории в выписке повторяются тысячи раз
+def _by_unique(values, function):
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([function(value) for value in uniques] + [None], dtype=object)
+    return pd.Series(mapped[codes], index=values.index)
+
+def _mcc_category(value):
+    try:
+        return _MCC.get(int(float(value)))
+    except (TypeError, ValueError):
+        return None
+
+def _period_code(value):
+    if not value:
+        return None
+    match = re.search(_DAY_FIRST_RE, value) or re.search(_ISO_RE, value)
+    if match:
+        return int(match["year"]) * 100 + int(match["month"])
+    # В XLSX дата может храниться числом дней с 30.12.1899
+    try:
+        date = pd.Timestamp("1899-12-30") + pd.Timedelta(days=float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return date.year * 100 + date.month
+
+# Период операции числом ГГГГММ (NaN, если дату разобрать не удалось). Для периода достаточно
+# первых 10 символов даты: после обрезки (в NumPy, без цикла по строкам) значений столько же,
+# сколько дней в выписке, и разбираются только они
+def _periods(values):
+    days = values.fillna("").to_numpy(dtype="U10")
+    return _by_unique(pd.Series(days, index=values.index), _period_code).astype(float)
+
+# Учёт очередного блока строк в totals: {(период, категория): [сумма, число операций]}
+def _process(frame, columns, totals, report):
+    amounts = _amounts(frame.iloc[:, columns["amount"]])
+    periods = _periods(frame.iloc[:, columns["date"]])
+    valid = amounts.notna() & periods.notna()
+    if "status" in columns:
+        failed = _by_unique(frame.iloc[:, columns["status"]], lambda status: bool(_FAILED_RE.search(str(status))))
+        valid &= ~failed.fillna(False).astype(bool)
+    # Расходы — отрицательные суммы; если их нет в первом блоке, выписка содержит только расходы
+    if report["sign"] is None:
+        report["sign"] = -1 if (amounts[valid] < 0).any() else 1
+    expenses = valid & (amounts * report["sign"] > 0)
+
+    categories = pd.Series([None] * len(frame), index=frame.index, dtype=object)
+    if "mcc" in columns:
+        categories = _by_unique(frame.iloc[:, columns["mcc"]], _mcc_category)
+    for role, fuzzy in (("category", True), ("description", False)):
+        missing = expenses & categories.isna()
+        if role in columns and missing.any():
+            categories[missing] = _lookup(frame.iloc[:, columns[role]][missing], fuzzy)
+
+    classified = expenses & categories.notna()
+    report["rows"] += len(frame)
+    report["expenses"] += int(expenses.sum())
+    report["unclassified_amount"] += float(amounts[expenses & ~classified].abs().sum())
+    grouped = pd.DataFrame({
+        "period": periods[classified].astype("int64"), "category": categories[classified],
+        "amount": amounts[classified].abs()
+    }).groupby(["period", "category"])["amount"].agg(["sum", "count"])
+    for (period, category), (amount, count) in zip(grouped.index, grouped.to_numpy()):
+        total = totals.setdefault((f"{period // 100:04d}-{period % 100:02d}", category), [0.0, 0])
+        total[0] += float(amount)
+        total[1] += int(count)
+
+def _csv_chunks(path, chunk_rows):
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE_BYTES)
+    encoding = "utf-8-sig"
+    try:
+        text = sample.decode(encoding)
+    except UnicodeDecodeError as e:
+        # Обрезанный на границе выборки символ UTF-8 — не повод менять кодировку
+        if e.start < len(sample) - 4:
+            encoding = "cp1251"
+        text = sample.decode(encoding, errors="ignore")
+    try:
+        delimiter = csv.Sniffer().sniff(text[:8192], delimiters=";,\t").delimiter
+    except csv.Error:
+        delimiter = ";" if text.count(";") > text.count(",") else ","
+    # Число столбцов — по самой длинной записи в начале файла (шапка выписки бывает короче таблицы);
+    # csv.reader учитывает переводы строк внутри кавычек
+    records = csv.reader(io.StringIO(text), delimiter=delimiter)
+    width = max((len(record) for record in itertools.islice(records, HEADER_SEARCH_ROWS)), default=0)
+    options = dict(sep=delimiter, encoding=encoding, header=None, names=range(width), on_bad_lines="skip")
+    # Заголовок ищет сам pandas. Пустые строки оставлены, чтобы номер строки совпадал с числом
+    # записей до неё: skiprows считает записи (с учётом кавычек), а не строки файла
+    head = pd.read_csv(path, nrows=HEADER_SEARCH_ROWS, dtype=object, skip_blank_lines=False, **options)
+    for index, row in enumerate(head.itertuples(index=False)):
+        columns = _find_columns([None if pd.isna(value) else value for value in row])
+        if columns:
+            break
+    else:
+        raise StatementError("Не найдены столбцы с датой и суммой операции")
+    # Суммы разбирает сам read_csv; дробная часть отделяется запятой в файлах с ";" (русская
+    # локаль Excel), точкой — в остальных. Значения в другом формате оставляют столбец строками,
+    # и он разбирается в _amounts
+    decimal = "," if delimiter == ";" else "."
+    numbers = sorted(set(columns.values()))
+    reader = pd.read_csv(
+        path, skiprows=index + 1, usecols=numbers,
+        dtype={number: object for number in numbers if number != columns["amount"]},
+        decimal=decimal, thousands=" " if decimal == "," else None, chunksize=chunk_rows, **options
+    )
+    # После usecols столбцы идут по порядку номеров
+    positions = {number: i for i, number in enumerate(numbers)}
+    columns = {role: positions[number] for role, number in columns.items()}
+    for frame in reader:
+        yield frame, columns
+
+# Номер столбца по ссылке на ячейку: "AB12" -> 27
+def _column_number(reference):
+    number = 0
+    for char in reference:
+        if char.isdigit():
+            break
+        number = number * 26 + ord(char) - 64
+    return number - 1
+
+def _first_sheet(archive):
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    relationship = workbook.find(f"{_XLSX}sheets/{_XLSX}sheet").get(_XLSX_RELATIONSHIP)
+    for rel in ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels")):
+        if rel.get("Id") == relationship:
+            target = rel.get("Target").lstrip("/")
+            return target if target.startswith("xl/") else "xl/" + target
+    raise StatementError("В файле нет листов")
+
+# Строки первого листа как {номер столбца: значение}. Лист читается потоково (iterparse) без
+# объектов ячеек openpyxl: в памяти только общая таблица строк и текущая строка
+def _xlsx_rows(path):
+    with zipfile.ZipFile(path) as archive:
+        strings = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            with archive.open("xl/sharedStrings.xml") as f:
+                for _, element in ElementTree.iterparse(f):
+                    if element.tag == f"{_XLSX}si":
+                        strings.append("".join(t.text or "" for t in element.iter(f"{_XLSX}t")))
+                        element.clear()
+        with archive.open(_first_sheet(archive)) as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag != f"{_XLSX}row":
+                    continue
+                row = {}
+                number = -1
+                for cell in element:
+                    reference = cell.get("r")
+                    number = _column_number(reference) if reference else number + 1
+                    kind = cell.get("t")
+                    if kind == "inlineStr":
+                        row[number] = "".join(t.text or "" for t in cell.iter(f"{_XLSX}t"))
+                        continue
+                    value = cell.find(f"{_XLSX}v")
+                    if value is not None:
+                        row[number] = strings[int(value.text)] if kind == "s" else value.text
+                element.clear()
+                yield row
+
+def _xlsx_chunks(path, chunk_rows):
+    rows = _xlsx_rows(path)
+    for _, row in zip(range(HEADER_SEARCH_ROWS), rows):
+        columns = _find_columns([row.get(i) for i in range(max(row, default=-1) + 1)])
+        if columns:
+            break
+    else:
+        raise StatementError("Не найдены столбцы с датой и суммой операции")
+    # В блоке только нужные столбцы, по порядку номеров
+    numbers = sorted(set(columns.values()))
+    positions = {number: i for i, number in enumerate(numbers)}
+    columns = {role: positions[number] for role, number in columns.items()}
+    chunk = []
+    for row in rows:
+        chunk.append([row.get(number) for number in numbers])
+        if len(chunk) >= chunk_rows:
+            yield pd.DataFrame(chunk), columns
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk), columns
+
+# Импорт выписки из CSV или XLSX: файл читается блоками по chunk_rows строк, в памяти остаются
+# только суммы по месяцам и категориям. Возвращает отчёт с объёмом, скоростью и итогами
+def import_statement(user_id, path, chunk_rows=STATEMENT_CHUNK_ROWS, save=True):
+    started = time.perf_counter()
+    size = os.path.getsize(path)
+    chunks = _xlsx_chunks if path.lower().endswith(".xlsx") else _csv_chunks
+    if chunks is _xlsx_chunks and not zipfile.is_zipfile(path):
+        raise StatementError("Файл не похож на XLSX")
+    totals = {}
+    report = {"rows": 0, "expenses": 0, "unclassified_amount": 0.0, "sign": None, "bytes": size}
+    with STAGE_SECONDS.time("statement"):
+        for frame, columns in chunks(path, chunk_rows):
+            _process(frame, columns, totals, report)
+        if save and totals:
+            replace_spending(user_id, totals)
+    seconds = time.perf_counter() - started
+    classified = sum(operations for _, operations in totals.values())
+    STATEMENT_ROWS.inc("classified", amount=classified)
+    STATEMENT_ROWS.inc("unclassified", amount=report["expenses"] - classified)
+    STATEMENT_ROWS.inc("other", amount=report["rows"] - report["expenses"])
+    STATEMENT_BYTES.inc(amount=size)
+    report.update(
+        seconds=seconds,
+        rows_per_second=report["rows"] / seconds if seconds else 0.0,
+        megabytes_per_second=size / 1024 / 1024 / seconds if seconds else 0.0,
+        periods=sorted({period for period, _ in totals}),
+        totals=totals,
+    )
+    logger.info(
+        "Выписка: %d строк, %d расходов, %.1f МБ за %.2f с (%.0f строк/с, %.1f МБ/с)",
+        report["rows"], report["expenses"], size / 1024 / 1024, seconds,
+        report["rows_per_second"], report["megabytes_per_second"]
+    )
+    return report
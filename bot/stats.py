@@ -0,0 +1,134 @@
+import threading
+import time
+import logging
+from datetime import datetime
+import pandas as pd
+
+from .config import STATS_INTERVAL, STATS_MIN_USERS
+from .database import add_change_listener, get_names, get_period_changes, get_users_period_rows
+from .categories import canonicalize_category, find_bank
+from .metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["id", "user_id", "bank_id", "category_id", "amount", "updated_at"]
+DTYPES = {"user_id": "int64", "bank_id": "int64", "category_id": "int64", "amount": "float64", "updated_at": "int64"}
+
+# Статистика по всем пользователям за текущий месяц: для каждой категории лучший, медианный
+# и самый частый процент и банк. Из базы читаются только строки, изменённые с прошлого пересчёта
+# (updated_at), и строки пользователей, у которых были удаления; агрегаты считаются
+# векторно по строкам месяца в памяти
+class CategoryStats:
+    def __init__(self, min_users=STATS_MIN_USERS):
+        self.min_users = min_users
+        self.period = None
+        self.since = 0
+        self.frame = _frame([])
+        self.banks = {}
+        self.bank_names = []
+        self.categories = {}
+        self.category_names = []
+        self.stats = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        add_change_listener(self.mark_dirty)
+
+    def mark_dirty(self, user_id):
+        with self.lock:
+            self.dirty.add(user_id)
+
+    def refresh(self, now=None):
+        period = (now or datetime.now()).strftime("%Y-%m")
+        with STAGE_SECONDS.time("stats"):
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+            if period != self.period:
+                # Новый месяц: полная загрузка (в начале месяца строк мало)
+                self.period, self.since = period, 0
+                self.frame = self.frame.iloc[0:0]
+                dirty = set()
+            changes = _frame(get_period_changes(period, self.since))
+            if dirty:
+                self.frame = self.frame[~self.frame["user_id"].isin(dirty)]
+                changes = pd.concat([changes, _frame(get_users_period_rows(dirty, period))])
+                changes = changes[~changes.index.duplicated(keep="last")]
+            if not changes.empty:
+                self.since = max(self.since, int(changes["updated_at"].max()))
+                self.frame = pd.concat([self.frame[~self.frame.index.isin(changes.index)], changes])
+            self.stats = self.aggregate()
+        return self.stats
+
+    # Справочник id -> код канонического названия; названия приводятся к каноническим,
+    # чтобы "Сбер" и "Сбербанк" или "Рестораны" и "рестораны" считались одним значением
+    @staticmethod
+    def _codes(names, canonical):
+        values = {}
+        codes = {}
+        for value_id, name in names.items():
+            codes[value_id] = values.setdefault(canonical(name), len(values))
+        return codes, list(values)
+
+    def _names(self):
+        # Справочники перечитываются, только если в приращении появились новые id
+        if not set(self.frame["bank_id"].unique()) <= self.banks.keys():
+            self.banks, self.bank_names = self._codes(get_names("banks"), lambda name: find_bank(name) or name)
+        if not set(self.frame["category_id"].unique()) <= self.categories.keys():
+            self.categories, self.category_names = self._codes(get_names("categories"), canonicalize_category)
+
+    def aggregate(self):
+        if self.frame.empty:
+            return {}
+        self._names()
+        # Группировки идут по целочисленным кодам, названия подставляются в конце
+        frame = pd.DataFrame({
+            "category": self.frame["category_id"].map(self.categories),
+            "bank": self.frame["bank_id"].map(self.banks),
+            "user_id": self.frame["user_id"],
+            "amount": self.frame["amount"],
+        })
+        # Разные написания одной категории у пользователя сводятся к большему проценту
+        frame = frame.groupby(["category", "bank", "user_id"], sort=False)["amount"].max().reset_index()
+        grouped = frame.groupby("category")
+        users = grouped["user_id"].nunique()
+        # Категории, где данных меньше чем от min_users пользователей, не показываются
+        frame = frame[frame["category"].isin(users.index[users >= self.min_users])]
+        if frame.empty:
+            return {}
+        grouped = frame.groupby("category")
+        best = frame.loc[grouped["amount"].idxmax()].set_index("category")
+        median = grouped["amount"].median()
+        common_bank = frame.groupby(["category", "bank"]).size().groupby(level=0).idxmax()
+        common_amount = frame.groupby(["category", "amount"]).size().groupby(level=0).idxmax()
+        return {
+            self.category_names[category]: {
+                "users": int(users[category]),
+                "best_bank": self.bank_names[best.at[category, "bank"]],
+                "best_amount": float(best.at[category, "amount"]),
+                "median_amount": float(median[category]),
+                "common_bank": self.bank_names[common_bank[category][1]],
+                "common_amount": float(common_amount[category][1]),
+            }
+            for category in best.index
+        }
+
+def _frame(rows):
+    return pd.DataFrame.from_records(rows, columns=COLUMNS).set_index("id").astype(DTYPES)
+
+category_stats = CategoryStats()
+
+# Последний посчитанный результат; обработчики не ждут пересчёта
+def get_category_stats():
+    return category_stats.stats
+
+def start_stats_job(interval=STATS_INTERVAL):
+    def run():
+        while True:
+            try:
+                started = time.perf_counter()
+                stats = category_stats.refresh()
+                logger.debug("Статистика по категориям: %d категорий за %.3f с", len(stats), time.perf_counter() - started)
+            except Exception as e:
+                logger.error("Ошибка пересчёта статистики: %s", e)
+            time.sleep(interval)
+
+    threading.Thread(target=run, name="stats", daemon=True).start()
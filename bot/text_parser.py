@@ -0,0 +1,140 @@
+import re
+
+from .categories import canonicalize_categories, canonicalize_category, find_bank, find_category
+from .config import ROUTING_MIN_AMOUNT, ROUTING_MAX_AMOUNT, ROUTING_MAX_UNKNOWN_SHARE
+from .models import CashbackCategory, CashbackResponse
+
+# Максимальная длина названия категории в тексте предложения
+MAX_CATEGORY_LENGTH = 40
+
+# Позиции предложения разделяются переводами строк, запятыми (кроме десятичных), точками с запятой,
+# маркерами списков и союзом "и" перед процентом или после него ("АЗС 3% и аптеки 5%")
+_SEPARATORS_RE = re.compile(r"[\n;•·▪]+|,(?!\d)|\s+\|\s+|\s+и\s+(?=(?:до\s+)?\d)|(?<=%)\s*и\s+")
+_AMOUNT = r"(?P<amount>\d{1,3}(?:[.,]\d{1,2})?)\s*%"
+# "Рестораны 5%", "АЗС — 3 %", "Аптеки: до 7%"
+_CATEGORY_FIRST_RE = re.compile(
+    r"^(?P<category>[^\W\d_][^%\d]*?)\s*[:\-—–]?\s*(?:до\s+)?" + _AMOUNT, re.IGNORECASE
+)
+# "5% на рестораны", "7 % — аптеки"
+_AMOUNT_FIRST_RE = re.compile(
+    r"^(?:до\s+)?" + _AMOUNT + r"\s*[:\-—–]?\s*(?:(?:на|за|в)\s+)?(?P<category>[^\W\d_][^%\d]*?)\s*$",
+    re.IGNORECASE
+)
+_UP_TO_RE = re.compile(r"^до\s+", re.IGNORECASE)
+# Базовый кэшбэк на все покупки категорией не считается
+_GENERIC_CATEGORIES = {"все", "всё", "все покупки", "всё остальное", "остальные покупки", "остальное"}
+# Слова, которые не относятся к названию категории
+_NOISE_RE = re.compile(r"\b(?:кэшбэк|кешбэк|кэшбек|кешбек|cashback|категори[яи])\w*\b", re.IGNORECASE)
+
+# Заголовок перед двоеточием ("Категории на март: Аптеки") отбрасывается
+def _clean_category(text: str) -> str:
+    text = text.rsplit(":", 1)[-1]
+    return text.strip(" \t-—–:.\"«»()")
+
+def _parse_segment(segment: str):
+    segment = _NOISE_RE.sub(" ", segment).strip(" \t-—–:.*\"«\ufe0f")
+    segment = _UP_TO_RE.sub("", segment)
+    for pattern in (_CATEGORY_FIRST_RE, _AMOUNT_FIRST_RE):
+        match = pattern.match(segment)
+        if not match:
+            continue
+        category = _clean_category(match.group("category"))
+        amount = float(match.group("amount").replace(",", "."))
+        if category.lower() in _GENERIC_CATEGORIES:
+            return None
+        if category and len(category) <= MAX_CATEGORY_LENGTH and ROUTING_MIN_AMOUNT <= amount <= ROUTING_MAX_AMOUNT:
+            return CashbackCategory(category=category, amount=amount)
+    return None
+
+# Локальный разбор текста предложения без обращения к GigaChat. Обычная переписка тоже
+# содержит проценты ("скидка 50% на всё", "курс вырос на 2%"), поэтому результат принимается,
+# только если неизвестных категорий не больше ROUTING_MAX_UNKNOWN_SHARE
+def parse_offer_text(text: str) -> CashbackResponse:
+    if not text or "%" not in text:
+        return CashbackResponse(categories=[])
+    categories = []
+    for segment in _SEPARATORS_RE.split(text):
+        cat = _parse_segment(segment)
+        if cat:
+            categories.append(cat)
+    unknown = sum(find_category(cat.category) is None for cat in categories)
+    if not categories or unknown / len(categories) > ROUTING_MAX_UNKNOWN_SHARE:
+        return CashbackResponse(categories=[])
+    return CashbackResponse(categories=canonicalize_categories(categories))
+
+# Траты для /optimize: "продукты 20000, кафе 5 тыс; карт 2"
+_SPEND_SEPARATORS_RE = re.compile(r"[\n;,]+")
+_SPEND_RE = re.compile(
+    r"^(?P<category>[^\W\d_][^\d]*?)\s*[:\-—–]?\s*(?P<amount>\d[\d\s]*(?:[.,]\d+)?)\s*"
+    r"(?P<thousands>к|k|тыс\.?)?\s*(?:₽|руб\.?|р\.?)?$",
+    re.IGNORECASE
+)
+_CARDS_RE = re.compile(r"^(?:карт\w*\s*(?P<after>\d+)|(?P<before>\d+)\s*карт\w*)$", re.IGNORECASE)
+
+# Возвращает {категория: рублей в месяц} и ограничение на число карт (None — без ограничения)
+def parse_spend_text(text: str):
+    spend = {}
+    max_cards = None
+    for segment in _SPEND_SEPARATORS_RE.split(text or ""):
+        segment = segment.strip()
+        cards = _CARDS_RE.match(segment)
+        if cards:
+            max_cards = int(cards.group("after") or cards.group("before"))
+            continue
+        match = _SPEND_RE.match(segment)
+        if not match:
+            continue
+        amount = float(re.sub(r"\s", "", match.group("amount")).replace(",", "."))
+        if match.group("thousands"):
+            amount *= 1000
+        if amount > 0:
+            category = canonicalize_category(_clean_category(match.group("category")))
+            spend[category] = spend.get(category, 0) + amount
+    return spend, max_cards
+
+# Массовый ввод ставок: строки "банк;категория;процент" (разделитель ";", табуляция или запятая)
+_RATE_SEPARATORS = (";", "\t", ",")
+_RATE_AMOUNT_RE = re.compile(r"^(?:до\s+)?(?P<amount>\d{1,3}(?:[.,]\d{1,2})?)\s*%?$", re.IGNORECASE)
+# Первая строка файла "Банк;Категория;Процент" — заголовок, если процент в ней не число
+_RATE_HEADER_RE = re.compile(r"^\W*(?:банк|bank)\b", re.IGNORECASE)
+
+def _parse_rate_line(line: str):
+    separator = next((sep for sep in _RATE_SEPARATORS if sep in line), None)
+    if separator is None:
+        return None, "ожидается «банк;категория;процент»"
+    # Процент может быть с запятой ("1,5"), поэтому строка делится не больше чем на три части
+    parts = [part.strip().strip("\"'«»").strip() for part in line.split(separator, 2)]
+    if len(parts) < 3:
+        return None, "ожидается «банк;категория;процент»"
+    bank, category, amount = parts
+    if not bank:
+        return None, "не указан банк"
+    if not category or len(category) > MAX_CATEGORY_LENGTH:
+        return None, "не указана категория" if not category else "слишком длинное название категории"
+    match = _RATE_AMOUNT_RE.match(amount)
+    if not match:
+        return None, f"процент «{amount}» не число"
+    value = float(match.group("amount").replace(",", "."))
+    if not 0 < value <= 100:
+        return None, "процент должен быть от 0 до 100"
+    # Банк приводится к каноническому названию только по точному совпадению или синониму:
+    # неизвестный банк сохраняется под своим названием, а не под похожим известным
+    return (find_bank(bank, fuzzy=False) or bank, canonicalize_category(_clean_category(category)), value), None
+
+# Возвращает ставки [(банк, категория, процент)] и ошибки [(номер строки, строка, причина)].
+# Повтор пары банк/категория заменяет прежний процент
+def parse_rates_text(text: str):
+    rates = {}
+    errors = []
+    for number, line in enumerate((text or "").splitlines(), start=1):
+        line = line.strip().lstrip("\ufeff")
+        if not line:
+            continue
+        rate, error = _parse_rate_line(line)
+        if error and number == 1 and _RATE_HEADER_RE.match(line):
+            continue
+        if error:
+            errors.append((number, line, error))
+        else:
+            rates[rate[:2]] = rate[2]
+    return [(bank, category, amount) for (bank, category), amount in rates.items()], errors
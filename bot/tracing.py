@@ -0,0 +1,169 @@
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+# OpenTelemetry необязателен: без него спаны пишутся только в JSON Lines
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+except ImportError:
+    otel_trace = None
+
+# Текущая трасса и спан; контекст свой у каждого потока обработки
+_current = contextvars.ContextVar("trace", default=None)
+
+_writer = None
+_tracer = None
+_sample_rate = 1.0
+
+# Запись завершённых спанов в файл, одна строка JSON на спан
+class JsonLinesExporter:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def export(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def configure(path=None, otlp_endpoint=None, sample_rate=1.0):
+    global _writer, _tracer, _sample_rate
+    _sample_rate = sample_rate
+    if path:
+        _writer = JsonLinesExporter(path)
+    if otlp_endpoint:
+        if otel_trace is None:
+            logger.warning("Пакет opentelemetry-sdk не установлен, экспорт в коллектор отключён")
+        else:
+            provider = TracerProvider(resource=Resource.create({"service.name": "cashback-assistant"}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint)))
+            _tracer = provider.get_tracer(__name__)
+
+def enabled():
+    return _writer is not None or _tracer is not None
+
+def current_trace_id():
+    state = _current.get()
+    return state[0] if state else None
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+# Новая трасса на каждое обновление; внутри неё спаны вкладываются через контекст.
+# Если трасса не выбрана сэмплированием, вложенные спаны ничего не пишут
+@contextmanager
+def trace(name, **attributes):
+    if not enabled() or random.random() >= _sample_rate:
+        token = _current.set(None)
+        try:
+            yield None
+        finally:
+            _current.reset(token)
+        return
+    token = _current.set((_new_id(128), None))
+    try:
+        with span(name, **attributes) as trace_id:
+            yield trace_id
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def span(name, **attributes):
+    state = _current.get()
+    if state is None:
+        yield None
+        return
+    trace_id, parent_id = state
+    span_id = _new_id(64)
+    token = _current.set((trace_id, span_id))
+    otel_span = _tracer.start_span(name, attributes={"cashback.trace_id": trace_id, **attributes}) if _tracer else None
+    started = time.time()
+    error = None
+    try:
+        if otel_span is not None:
+            with otel_trace.use_span(otel_span, end_on_exit=False):
+                yield trace_id
+        else:
+            yield trace_id
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration = time.time() - started
+        _current.reset(token)
+        if otel_span is not None:
+            if error:
+                otel_span.set_attribute("error", error)
+            otel_span.end()
+        if _writer is not None:
+            record = {
+                "trace_id": trace_id, "span_id": span_id, "parent_id": parent_id, "name": name,
+                "start": round(started, 6), "duration_ms": round(duration * 1000, 3), "thread": threading.current_thread().name,
+            }
+            if attributes:
+                record["attributes"] = attributes
+            if error:
+                record["error"] = error
+            _writer.export(record)
+
+def traced(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Трасса вокруг каждого обработчика и спаны на вызовы Bot API
+def install(bot):
+    for kind, handlers in (
+        ("message", bot.message_handlers), ("callback", bot.callback_query_handlers), ("inline", bot.inline_handlers)
+    ):
+        for handler in handlers:
+            handler["function"] = _traced_handler(handler["function"], kind)
+
+    make_request = apihelper._make_request
+    download_file = apihelper.download_file
+
+    def traced_request(token, method_name, method="get", params=None, files=None):
+        with span("telegram." + method_name):
+            return make_request(token, method_name, method, params=params, files=files)
+
+    def traced_download(token, file_path):
+        with span("telegram.download_file"):
+            return download_file(token, file_path)
+
+    apihelper._make_request = traced_request
+    apihelper.download_file = traced_download
+
+def _traced_handler(function, kind):
+    name = function.__name__
+
+    @wraps(function)
+    def wrapper(update, *args, **kwargs):
+        user = getattr(update, "from_user", None)
+        with trace("handler." + name, kind=kind, user_id=user.id if user else None):
+            return function(update, *args, **kwargs)
+
+    return wrapper
@@ -1,40 +1,195 @@
 import os
 import tempfile
+import threading
+import time
+import logging
 from datetime import datetime
-from .config import CATEGORY_EMOJIS, DEFAULT_CATEGORY_EMOJI
-from .database import get_summary as db_get_summary
+from telebot import apihelper
+from .config import (
+    CATEGORY_EMOJIS, DEFAULT_CATEGORY_EMOJI, STATUS_EDIT_INTERVAL, GIGACHAT_PRICES, CARD_LINKS, OPTIMIZER_DEFAULT_SPEND,
+    STATEMENT_PROFILE_MONTHS, REMINDER_TIMEZONE
+)
+from .database import (
+    get_summary as db_get_summary, get_usage_summary, get_top_usage_users, get_best, get_all_best, get_user_rates,
+    get_spending_profile
+)
+from .categories import find_bank
+from .stats import get_category_stats
+from .optimizer import optimize
+from .reminders import get_zone
+
+logger = logging.getLogger(__name__)
+
+def category_label(cat):
+    # Если первая буква не является буквой, предполагаем, что эмоджи уже есть
+    if cat and not cat[0].isalpha():
+        return cat.capitalize()
+    if cat in CATEGORY_EMOJIS:
+        return f"{CATEGORY_EMOJIS[cat]} {cat.capitalize()}"
+    return f"{DEFAULT_CATEGORY_EMOJI} {cat.capitalize()}"
 
 def format_summary(user_id: int):
     rows = db_get_summary(user_id)
     summary = {}
     
-    for bank, category, amount in rows:
+    for bank, category, amount, period in rows:
         if category not in summary:
             summary[category] = []
-        summary[category].append((bank, amount))
+        summary[category].append((bank, amount, period))
     
     text_lines = ["🏆 Лучшие кэшбэки по категориям:"]
     
     for cat, entries in summary.items():
-        # Если первая буква не является буквой, предполагаем, что эмоджи уже есть
-        if cat and not cat[0].isalpha():
-            cat_label = cat.capitalize()
-        elif cat in CATEGORY_EMOJIS:
-            cat_label = f"{CATEGORY_EMOJIS[cat]} {cat.capitalize()}"
-        else:
-            cat_label = f"{DEFAULT_CATEGORY_EMOJI} {cat.capitalize()}"
-        
-        text_lines.append(f"\n {cat_label}")
+        text_lines.append(f"\n {category_label(cat)}")
         entries.sort(key=lambda x: x[1], reverse=True)
         medals = ["🥇", "🥈", "🥉"]
         
-        for idx, (bank, amount) in enumerate(entries[:3]):
+        for idx, (bank, amount, period) in enumerate(entries[:3]):
             medal = medals[idx] if idx < len(medals) else ""
-            text_lines.append(f"└ {medal} {bank}: {int(amount)}%")
+            undated = "" if period else " (без периода)"
+            text_lines.append(f"└ {medal} {bank}: {int(amount)}%{undated}")
     
     text_lines.append(f"\n📅 Актуально на: {datetime.now().strftime('%d.%m.%Y %H:%M')}")
     return "\n".join(text_lines)
 
+# Ответ на вопрос «какой картой платить»: лучший банк и следующие за ним
+def format_best(user_id, category):
+    best = get_best(user_id, category)
+    if not best:
+        return f"В категории «{category}» кэшбэка пока нет. Добавьте его через «➕ Добавить информацию»"
+    bank, amount = best[0]
+    text_lines = [f"{category_label(category)}: платите картой {bank} — {amount:g}%"]
+    for bank, amount in best[1:]:
+        text_lines.append(f"└ {bank}: {amount:g}%")
+    return "\n".join(text_lines)
+
+# Предложение после сводки по статистике всех пользователей за месяц: категории, где у других
+# процент выше, и популярные категории, которых у пользователя нет. Пока статистики нет — список карт
+def format_offers(user_id, limit=3):
+    stats = get_category_stats()
+    own = get_all_best(user_id, limit=1)
+    text_lines = []
+    
+    better = sorted(
+        ((s["best_amount"] - own[cat][0][1], cat) for cat, s in stats.items() if cat in own and s["best_amount"] > own[cat][0][1]),
+        reverse=True
+    )
+    for _, cat in better[:limit]:
+        s = stats[cat]
+        text_lines.append(f"{category_label(cat)}: у пользователей до {s['best_amount']:g}% в {s['best_bank']} (у вас {own[cat][0][1]:g}%)")
+    
+    missing = sorted(((s["users"], cat) for cat, s in stats.items() if cat not in own), reverse=True)
+    for _, cat in missing[:limit]:
+        s = stats[cat]
+        text_lines.append(
+            f"{category_label(cat)}: чаще всего {s['common_amount']:g}% в {s['common_bank']}, до {s['best_amount']:g}% в {s['best_bank']}"
+        )
+    
+    if not text_lines:
+        return "💳 Чтобы увеличить вашу выгоду, оформите карту:\n" + "".join(f"{bank}: {link}\n" for bank, link in CARD_LINKS.items())
+    
+    # Ссылки только на карты банков, упомянутых в подсказках
+    mentioned = {stats[cat]["best_bank"] for _, cat in better[:limit] + missing[:limit]}
+    mentioned |= {stats[cat]["common_bank"] for _, cat in missing[:limit]}
+    text_lines = ["📈 Кэшбэк у других пользователей в этом месяце:\n"] + [f"▪️ {line}" for line in text_lines]
+    card_lines = [f"{bank}: {link}" for bank, link in CARD_LINKS.items() if (find_bank(bank) or bank) in mentioned]
+    if card_lines:
+        text_lines.append("\n💳 Оформить карту:")
+        text_lines += card_lines
+    return "\n".join(text_lines)
+
+# Какие категории выбрать в каждом банке и чем платить: траты из команды, из выписки или типичные
+def format_optimization(user_id, spend=None, max_cards=None):
+    rates = get_user_rates(user_id)
+    if not rates:
+        return "Кэшбэка пока нет. Добавьте предложения банков через «➕ Добавить информацию»"
+    profile = None if spend else get_spending_profile(user_id, STATEMENT_PROFILE_MONTHS)
+    result = optimize(rates, spend or profile or OPTIMIZER_DEFAULT_SPEND, max_cards=max_cards)
+    if not result["cards"]:
+        return "Ни одна из указанных категорий трат не совпадает с категориями вашего кэшбэка"
+    
+    text_lines = ["🧮 Какие категории выбрать:"]
+    for bank, categories in result["cards"].items():
+        text_lines.append(f"\n🏦 {bank}: " + ", ".join(category_label(cat) for cat in categories))
+    text_lines.append("\n💳 Чем платить:")
+    for cat, (bank, amount, cashback) in sorted(result["payments"].items(), key=lambda item: -item[1][2]):
+        text_lines.append(f"└ {category_label(cat)} — {bank} {amount:g}% ≈ {cashback:.0f} ₽")
+    text_lines.append(f"\nИтого ≈ {result['total']:.0f} ₽ в месяц")
+    if profile:
+        text_lines.append("Посчитано по средним тратам из ваших выписок")
+    elif not spend:
+        text_lines.append("Посчитано для типичных трат. Свои: /optimize продукты 20000, кафе 5000, карт 2 или пришлите выписку CSV/XLSX")
+    return "\n".join(text_lines)
+
+# Итог импорта выписки: объём и скорость обработки, средние траты в месяц по категориям
+def format_statement_report(report, limit=10):
+    periods = report["periods"]
+    if not periods:
+        return "В выписке не найдено расходов по известным категориям"
+    monthly = {}
+    for (period, category), (amount, operations) in report["totals"].items():
+        monthly[category] = monthly.get(category, 0) + amount / len(periods)
+    first, last = (datetime.strptime(period, "%Y-%m").strftime("%m.%Y") for period in (periods[0], periods[-1]))
+    text_lines = [
+        f"✅ Выписка обработана: {report['expenses']} расходов за {len(periods)} мес. ({first}–{last})",
+        f"⏱ {report['bytes'] / 1024 / 1024:.1f} МБ за {report['seconds']:.1f} с, {report['rows_per_second']:.0f} строк/с",
+        "\nТраты в месяц:",
+    ]
+    for category, amount in sorted(monthly.items(), key=lambda item: -item[1])[:limit]:
+        text_lines.append(f"└ {category_label(category)}: {amount:,.0f} ₽".replace(",", " "))
+    if report["unclassified_amount"]:
+        text_lines.append(f"\nБез категории: {report['unclassified_amount'] / len(periods):,.0f} ₽ в месяц".replace(",", " "))
+    text_lines.append("\n/optimize подберёт категории кэшбэка под эти траты")
+    return "\n".join(text_lines)
+
+# Напоминание о выборе категорий: (timezone, enabled, период, due_at)
+def format_reminder(reminder):
+    timezone, enabled, _, due_at = reminder
+    if not enabled:
+        return "🔕 Напоминания о выборе категорий выключены\nВключить: /remind on"
+    when = datetime.fromtimestamp(due_at, get_zone(timezone)).strftime("%d.%m.%Y около %H:%M")
+    return (
+        f"🔔 Напомню выбрать категории кэшбэка {when} ({timezone or REMINDER_TIMEZONE})\n\n"
+        "Часовой пояс: /remind Asia/Yekaterinburg\nВыключить: /remind off"
+    )
+
+# Итог массового ввода одним сообщением: сколько сохранено и какие строки не разобраны
+def format_import_report(saved, errors, limit=10):
+    text_lines = [f"✅ Сохранено ставок: {saved}" if saved else "❌ Не сохранено ни одной ставки"]
+    if errors:
+        text_lines.append(f"\nНе разобрано строк: {len(errors)}")
+        for number, line, reason in errors[:limit]:
+            text_lines.append(f"└ {number}: «{line[:40]}» — {reason}")
+        if len(errors) > limit:
+            text_lines.append(f"└ и ещё {len(errors) - limit}")
+    if not saved:
+        text_lines.append("\nФормат: банк;категория;процент, по одной ставке в строке")
+    return "\n".join(text_lines)
+
+def format_usage(days=7):
+    rows = get_usage_summary(days)
+    if not rows:
+        return f"За {days} дн. запросов к GigaChat не было"
+    
+    text_lines = [f"📈 Расход GigaChat за {days} дн.:"]
+    total_cost = 0.0
+    for day, model, users, calls, prompt, completion, precached, image_bytes, seconds in rows:
+        cost = (prompt + completion) / 1000 * GIGACHAT_PRICES.get(model, 0)
+        total_cost += cost
+        text_lines.append(
+            f"\n{day} {model}: {calls} запр., {users} польз.\n"
+            f"└ токены: {prompt} + {completion} (кэш {precached}), ≈{cost:.2f} ₽\n"
+            f"└ в среднем: {(prompt + completion) / calls:.0f} ток., {image_bytes / calls / 1024:.0f} КБ, {seconds / calls:.1f} с"
+        )
+    text_lines.append(f"\nИтого ≈{total_cost:.2f} ₽")
+    
+    top = get_top_usage_users(days, limit=5)
+    if top:
+        text_lines.append("\nБольше всего токенов:")
+        for user_id, calls, tokens in top:
+            text_lines.append(f"└ {user_id}: {tokens} ток., {calls} запр.")
+    return "\n".join(text_lines)
+
 def save_temp_file(file_data):
     # Создание временного файла для сохранения изображения
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
@@ -42,9 +197,71 @@ def save_temp_file(file_data):
     temp_file.close()
     return temp_file.name
 
+# Скачивание файла Telegram во временный файл частями, не держа его целиком в памяти
+def download_temp_file(token, file_path, suffix, chunk_size=64 * 1024):
+    url = (apihelper.FILE_URL or "https://api.telegram.org/file/bot{0}/{1}").format(token, file_path)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with apihelper._get_req_session().get(url, stream=True, proxies=apihelper.proxy) as response:
+            if response.status_code != 200:
+                raise apihelper.ApiHTTPException("Download file", response)
+            for chunk in response.iter_content(chunk_size):
+                temp_file.write(chunk)
+    except Exception:
+        temp_file.close()
+        delete_temp_file(temp_file.name)
+        raise
+    temp_file.close()
+    return temp_file.name
+
 def delete_temp_file(file_path):
     # Удаление временного файла после использования
     try:
         os.unlink(file_path)
     except Exception as e:
-        pass 
\ No newline at end of file
+        pass
+
+# Статусное сообщение, которое дополняется строками по ходу обработки.
+# Правки отправляются не чаще interval секунд, чтобы не упираться в лимиты Telegram
+class ProgressMessage:
+    def __init__(self, outbox, chat_id, header, interval=STATUS_EDIT_INTERVAL):
+        self.outbox = outbox
+        self.chat_id = chat_id
+        self.header = header
+        self.interval = interval
+        self.lines = []
+        self.lock = threading.Lock()
+        # Future отправки: правки ждут в очереди исходящих, пока сообщение не отправлено,
+        # и не объединяются с другими сообщениями в этот чат
+        self.message = outbox.send_message(chat_id, header, coalesce=False)
+        self.shown = header
+        # Первая строка показывается сразу, дальше правки идут с интервалом
+        self.last_edit = 0.0
+
+    def add(self, line):
+        with self.lock:
+            self.lines.append(line)
+            if time.monotonic() - self.last_edit >= self.interval:
+                self._edit(self._render())
+
+    # Новый заголовок и пустой список строк, например при повторном распознавании другой моделью
+    def restart(self, header):
+        with self.lock:
+            self.header = header
+            self.lines = []
+            self._edit(self._render())
+
+    def finish(self, text=None):
+        with self.lock:
+            self._edit(text or self._render())
+
+    def _render(self):
+        return "\n".join([self.header, ""] + self.lines) if self.lines else self.header
+
+    def _edit(self, text):
+        if text == self.shown:
+            return
+        # Ошибки отправки журналирует очередь; неотправленная правка заменяется следующей
+        self.outbox.edit_message_text(text, self.chat_id, self.message)
+        self.shown = text
+        self.last_edit = time.monotonic()
@@ -1,12 +1,10 @@
 import logging
 from bot import create_bot
+from bot.config import LOG_PATH, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ERROR_BURST, LOG_ERROR_WINDOW
+from bot.logging_config import setup_logging
 
 # Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    filename='bot.log'
-)
+setup_logging(LOG_PATH, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ERROR_BURST, LOG_ERROR_WINDOW)
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
@@ -16,4 +14,4 @@ if __name__ == "__main__":
         logger.info("Бот запущен успешно")
         bot.polling(none_stop=True)
     except Exception as e:
-        logger.error(f"Произошла ошибка: {str(e)}") 
\ No newline at end of file
+        logger.error("Произошла ошибка: %s", e)